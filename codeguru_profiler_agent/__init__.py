@@ -7,6 +7,34 @@ Modules
 
 """
 
+import sys
+
 from . import *
-from .profiler import Profiler
-from .aws_lambda.profiler_decorator import with_lambda_profiler
+
+# The public classes are imported on first access so that importing a submodule, e.g. the lambda handler during the
+# cold start of a lambda function, does not import the whole agent and boto3 with it.
+_LAZY_ATTRIBUTE_MODULES = {
+    "Profiler": "codeguru_profiler_agent.profiler",
+    "with_lambda_profiler": "codeguru_profiler_agent.aws_lambda.profiler_decorator",
+    "WsgiEndpointMiddleware": "codeguru_profiler_agent.middleware.wsgi_middleware",
+    "AsgiEndpointMiddleware": "codeguru_profiler_agent.middleware.asgi_middleware",
+}
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        module_name = _LAZY_ATTRIBUTE_MODULES.get(name)
+        if module_name is None:
+            raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+        import importlib
+        value = getattr(importlib.import_module(module_name), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()).union(_LAZY_ATTRIBUTE_MODULES))
+else:
+    # module level __getattr__ is only supported from Python 3.7
+    from .profiler import Profiler
+    from .aws_lambda.profiler_decorator import with_lambda_profiler
+    from .middleware.wsgi_middleware import WsgiEndpointMiddleware
+    from .middleware.asgi_middleware import AsgiEndpointMiddleware
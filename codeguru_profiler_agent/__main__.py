@@ -2,8 +2,14 @@ import os
 import sys
 import runpy
 import logging
+import datetime
 
 profiler = None
+IMPORT_PROFILE_FILE_PREFIX = "./profile-imports-"
+OUTPUT_FORMATS = ("json", "folded", "speedscope", "pprof")
+OFFLINE_PROFILING_GROUP_NAME = "offline"
+# the profile is written once when the script exits
+OFFLINE_REPORTING_INTERVAL = datetime.timedelta(days=365)
 
 
 def _start_profiler(options, env):
@@ -22,6 +28,71 @@ def _start_profiler(options, env):
     return profiler
 
 
+def _start_offline_profiler(options, env):
+    """
+    This will init a profiler writing the profile to the output file given in options when it is stopped, instead of
+    sending it to CodeGuru Profiler, and start it.
+    :param options: options containing the output file and format, and optionally the profiling group name
+    :param env: the environment dict from which to search for variables (usually os.environ is passed)
+    :return: the profiler object
+    """
+    from codeguru_profiler_agent.profiler import Profiler
+    from codeguru_profiler_agent.profiler_builder import _read_override
+    global profiler
+    environment_override = _read_override(env)
+    environment_override.update(_offline_environment(options))
+    environment_override.update({
+        "reporting_mode": "file",
+        "reporting_interval": OFFLINE_REPORTING_INTERVAL,
+        "minimum_time_reporting": datetime.timedelta(),
+        # there is no fleet of hosts starting together to spread the samples of, and short scripts need samples
+        "initial_sampling_interval": datetime.timedelta()
+    })
+    profiler = Profiler(profiling_group_name=options.profiling_group_name or OFFLINE_PROFILING_GROUP_NAME,
+                        environment_override=environment_override)
+    profiler.start()
+    return profiler
+
+
+def _offline_environment(options, file_prefix=None):
+    """
+    :return: the environment of the FileReporter writing the profile in the format and to the output file given in
+        options, or to a file named after file_prefix if no output file was given
+    """
+    from codeguru_profiler_agent.agent_metadata.agent_metadata import AgentMetadata
+    from codeguru_profiler_agent.agent_metadata.fleet_info import DefaultFleetInfo
+    # the profile is not sent anywhere so we do not need to look up the fleet metadata
+    environment = {"agent_metadata": AgentMetadata(fleet_info=DefaultFleetInfo())}
+    if file_prefix is not None:
+        environment["file_prefix"] = file_prefix
+    if options.output_path is not None:
+        environment["file_path"] = options.output_path
+    environment["file_format"] = options.output_format or _output_format_of(options.output_path)
+    return environment
+
+
+def _output_format_of(output_path):
+    if output_path is None:
+        return "json"
+    if output_path.endswith((".folded", ".txt")):
+        return "folded"
+    if output_path.endswith(".speedscope.json"):
+        return "speedscope"
+    if output_path.endswith((".pb.gz", ".pprof")):
+        return "pprof"
+    return "json"
+
+
+def _report_import_profile(import_profiler, options):
+    """
+    Writes the import tree recorded while running the script as a profile, by default in a JSON file.
+    """
+    from codeguru_profiler_agent.file_reporter.file_reporter import FileReporter
+    reporter = FileReporter(environment=_offline_environment(options, file_prefix=IMPORT_PROFILE_FILE_PREFIX))
+    output_filename = reporter.report(import_profiler.to_profile(options.profiling_group_name or "imports"))
+    print("Import profile written to " + output_filename, file=sys.stderr)
+
+
 def _set_log_level(log_level):
     if log_level is None:
         return
@@ -30,10 +101,11 @@ def _set_log_level(log_level):
         logging.basicConfig(level=numeric_level)
 
 
-def main(input_args=sys.argv[1:], env=os.environ, start_profiler=_start_profiler):
+def main(input_args=sys.argv[1:], env=os.environ, start_profiler=_start_profiler,
+         start_offline_profiler=_start_offline_profiler):
     from argparse import ArgumentParser
     usage = 'python -m codeguru_profiler_agent [-p profilingGroupName] [-r region] [-c credentialProfileName]' \
-            ' [-m module | scriptfile.py] [arg]' \
+            ' [-o outputFile [--format json|folded|speedscope]] [--profile-imports] [-m module | scriptfile.py] [arg]' \
             + '...\nexample: python -m codeguru_profiler_agent -p myProfilingGroup hello_world.py'
     parser = ArgumentParser(usage=usage)
     parser.add_argument('-p', '--profiling-group-name', dest="profiling_group_name",
@@ -50,6 +122,19 @@ def main(input_args=sys.argv[1:], env=os.environ, start_profiler=_start_profiler
     parser.add_argument('--log', dest='log_level',
                         help='Set log level, possible values: debug, info, warning, error and critical'
                              + ' (default is warning)')
+    parser.add_argument('-o', '--output', dest='output_path',
+                        help='Write the profile to this file when the script exits instead of sending it to CodeGuru'
+                             + ' Profiler; no profiling group or AWS credentials are needed')
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS,
+                        help='Format of the output file: "json" is the CodeGuru Profiler format, "folded" the folded'
+                             + ' stacks of flamegraph.pl, "speedscope" the format of https://www.speedscope.app and'
+                             + ' "pprof" the gzipped protocol buffers of pprof (default depends on the output file'
+                             + ' extension: .folded or .txt for folded, .speedscope.json for speedscope, .pb.gz or'
+                             + ' .pprof for pprof, json otherwise)')
+    parser.add_argument('--profile-imports', dest='profile_imports', action='store_true', default=False,
+                        help='Instead of sampling, record the modules imported by the script with the time spent'
+                             + ' importing each of them, and write them as a profile to the output file, or to '
+                             + IMPORT_PROFILE_FILE_PREFIX + '<timestamp>.json by default')
     parser.add_argument('scriptfile')
 
     (known_args, rest) = parser.parse_known_args(args=input_args)
@@ -80,7 +165,14 @@ def main(input_args=sys.argv[1:], env=os.environ, start_profiler=_start_profiler
         }
 
     # now start and stop profile around executing the user's code
-    if not start_profiler(known_args, env):
+    import_profiler = None
+    if known_args.profile_imports:
+        from codeguru_profiler_agent.import_profiler import ImportProfiler
+        import_profiler = ImportProfiler()
+        import_profiler.start()
+    elif known_args.output_path is not None:
+        start_offline_profiler(known_args, env)
+    elif not start_profiler(known_args, env):
         parser.print_usage()
     try:
         # Skip issue reported by Bandit.
@@ -91,8 +183,17 @@ def main(input_args=sys.argv[1:], env=os.environ, start_profiler=_start_profiler
         # so the customer's code cannot be altered before it is executed.
         exec(code, globs, None)  # nosec
     finally:
+        if import_profiler is not None:
+            import_profiler.stop()
+            _report_import_profile(import_profiler, known_args)
         if profiler is not None:
             profiler.stop()
+        if known_args.output_path is not None and import_profiler is None:
+            if os.path.exists(known_args.output_path):
+                print("Profile written to " + known_args.output_path, file=sys.stderr)
+            else:
+                print("No profile was written as no sample was taken, the script may have run for less than the"
+                      " sampling interval", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -71,6 +71,10 @@ class ErrorsMetadata:
         self.increment_sdk_error(error_type)
 
 
+# a single slow sample, e.g. caused by GIL contention, only shows up in the highest percentiles
+REPORTED_PERCENTILES = (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9))
+
+
 class AgentDebugInfo:
     def __init__(self, errors_metadata=None, agent_start_time=None, timer=None):
         self.process_id = get_process_id()
@@ -110,6 +114,8 @@ class AgentDebugInfo:
             for metric, metric_value in self.timer.metrics.items():
                 generic_metrics[metric + "_timings_max"] = metric_value.max
                 generic_metrics[metric + "_timings_average"] = metric_value.average()
+                for percentile_name, percentile in REPORTED_PERCENTILES:
+                    generic_metrics[metric + "_timings_" + percentile_name] = metric_value.percentile(percentile)
 
             if generic_metrics:
                 json["genericMetrics"] = generic_metrics
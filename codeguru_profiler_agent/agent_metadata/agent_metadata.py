@@ -1,10 +1,15 @@
 import json
+import logging
+import os
+import threading
+import time
 from platform import python_version
 
 from codeguru_profiler_agent.agent_metadata.aws_ec2_instance import AWSEC2Instance
 from codeguru_profiler_agent.agent_metadata.aws_fargate_task import AWSFargateTask
 from codeguru_profiler_agent.agent_metadata.fleet_info import DefaultFleetInfo
 
+logger = logging.getLogger(__name__)
 
 # NOTE: Please do not alter the value for the following constants without the full knowledge of the use of them.
 # These constants are used in several scripts, including setup.py.
@@ -12,18 +17,106 @@ __agent_name__ = "CodeGuruProfiler-python"
 __agent_version__ = "1.2.6"
 
 
+# Lambda sets this in the environment of the functions, which run with no metadata endpoint
+AWS_LAMBDA_FUNCTION_NAME_ENV = "AWS_LAMBDA_FUNCTION_NAME"
+# ECS sets this in the environment of the containers it runs, on Fargate as well as on EC2 instances
+ECS_CONTAINER_METADATA_URI_ENV = "ECS_CONTAINER_METADATA_URI_V4"
+AWS_EXECUTION_ENV = "AWS_EXECUTION_ENV"
+AWS_ECS_FARGATE = "AWS_ECS_FARGATE"
+# vendor and version files of the virtual hardware; EC2 instances have "Amazon EC2" or "amazon" in one of them
+DMI_ID_PATH = "/sys/class/dmi/id"
+DMI_VENDOR_FILES = ("sys_vendor", "board_vendor", "bios_vendor", "bios_version", "product_version")
+DEFAULT_LOOK_UP_DEADLINE_SECONDS = 3
+
+
 def look_up_fleet_info(
-        platform_metadata_fetchers=(
-                AWSEC2Instance.look_up_metadata,
-                AWSFargateTask.look_up_metadata
-        )
+        platform_metadata_fetchers=None,
+        env=os.environ,
+        fleet_info_cache=None,
+        deadline_seconds=DEFAULT_LOOK_UP_DEADLINE_SECONDS,
+        dmi_id_path=DMI_ID_PATH
 ):
-    for metadata_fetcher in platform_metadata_fetchers:
-        fleet_info = metadata_fetcher()
-        if fleet_info is not None:
-            return fleet_info
-
-    return DefaultFleetInfo()
+    """
+    Looks up the metadata of the platform we run on. The metadata endpoints that cannot be there according to the
+    environment are not queried, and the others are queried concurrently: the first fetcher in order returning a fleet
+    info within the deadline wins, the lookups still running after it are left to finish in the background.
+
+    :param platform_metadata_fetchers: functions returning the fleet info of a platform or None, in order of
+        preference; default is chosen from the environment, see _platform_metadata_fetchers
+    :param env: typically os.environ
+    :param fleet_info_cache: if set, a FleetInfoCache the fleet info is loaded from, or saved into once looked up
+    :param deadline_seconds: how long we wait for the fetchers altogether
+    :param dmi_id_path: directory of the DMI files telling the vendor of the (virtual) hardware
+    """
+    if fleet_info_cache is not None:
+        cached_fleet_info = fleet_info_cache.load()
+        if cached_fleet_info is not None:
+            return cached_fleet_info
+    if platform_metadata_fetchers is None:
+        platform_metadata_fetchers = _platform_metadata_fetchers(env, dmi_id_path)
+
+    fleet_info = _first_fleet_info(platform_metadata_fetchers, deadline_seconds)
+    if fleet_info is None:
+        return DefaultFleetInfo()
+    if fleet_info_cache is not None:
+        fleet_info_cache.save(fleet_info)
+    return fleet_info
+
+
+def _platform_metadata_fetchers(env, dmi_id_path):
+    if env.get(AWS_LAMBDA_FUNCTION_NAME_ENV):
+        # the lambda metadata is looked up from the context of the invocation, see AWSLambda
+        return ()
+    ecs_metadata_uri = env.get(ECS_CONTAINER_METADATA_URI_ENV)
+    if ecs_metadata_uri and env.get(AWS_EXECUTION_ENV) == AWS_ECS_FARGATE:
+        return lambda: AWSFargateTask.look_up_metadata(url=ecs_metadata_uri),
+    fetchers = []
+    if _is_ec2_according_to_dmi(dmi_id_path) is not False:
+        fetchers.append(AWSEC2Instance.look_up_metadata)
+    if ecs_metadata_uri:
+        fetchers.append(lambda: AWSFargateTask.look_up_metadata(url=ecs_metadata_uri))
+    return tuple(fetchers)
+
+
+def _is_ec2_according_to_dmi(dmi_id_path):
+    """
+    :return: True or False depending on whether the DMI vendor files mention Amazon, None if none of them can be read
+        (e.g. not on Linux, or in a container hiding them), in which case we cannot tell.
+    """
+    has_read_any = False
+    for file_name in DMI_VENDOR_FILES:
+        try:
+            with open(os.path.join(dmi_id_path, file_name)) as dmi_file:
+                content = dmi_file.read()
+        except OSError:
+            continue
+        has_read_any = True
+        if "amazon" in content.lower():
+            return True
+    return False if has_read_any else None
+
+
+def _first_fleet_info(platform_metadata_fetchers, deadline_seconds):
+    results = [None] * len(platform_metadata_fetchers)
+
+    def fetch(index, metadata_fetcher):
+        try:
+            results[index] = metadata_fetcher()
+        except Exception:
+            logger.info("Unable to look up the fleet metadata", exc_info=True)
+
+    threads = [threading.Thread(target=fetch, args=(index, metadata_fetcher), daemon=True,
+                                name="codeguru-profiler-fleet-info-lookup")
+               for index, metadata_fetcher in enumerate(platform_metadata_fetchers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + deadline_seconds
+    for index, thread in enumerate(threads):
+        # the fetchers before this one have finished or timed out, so if this one answered it is the preferred one
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if results[index] is not None:
+            return results[index]
+    return None
 
 
 class AgentInfo:
@@ -58,40 +151,53 @@ class AgentMetadata:
         self._fleet_info = fleet_info
         self.agent_info = agent_info
         self.runtime_version = runtime_version
-        self.json_rep = None
+        # the fleet info is looked up once, the other fields depend on the profile being encoded
+        self._fleet_info_json = None
 
     @property
     def fleet_info(self):
         if self._fleet_info is None:
-            self._fleet_info = look_up_fleet_info()
+            # imported here as the cache is only needed if the fleet info was not given, e.g. not in lambda
+            from codeguru_profiler_agent.agent_metadata.fleet_info_cache import FleetInfoCache
+            self._fleet_info = look_up_fleet_info(fleet_info_cache=FleetInfoCache())
         return self._fleet_info
 
     def serialize_to_json(self, sample_weight, duration_ms, cpu_time_seconds,
-                          average_num_threads, overhead_ms, memory_usage_mb, total_sample_count):
+                          average_num_threads, overhead_ms, memory_usage_mb, total_sample_count,
+                          cpu_time_sample_weight=None, thread_states=()):
         """
         This needs to be compliant with the AgentMetadata schema that is used on the service side.
+        The CPU_TIME sample weight is only reported when the profile contains CPU_TIME counts. Thread state counts
+        are sampled like WALL_TIME so they share its sample weight.
+        Several profiles get encoded with the same metadata, e.g. the time slices of a profile, so a new representation
+        is built for each of them.
         """
-        if self.json_rep is None:
-            self.json_rep = {
-                "sampleWeights": {
-                    "WALL_TIME": sample_weight
-                },
-                "durationInMs": duration_ms,
-                "fleetInfo": self.fleet_info.serialize_to_map(),
-                "agentInfo": {
-                    "type": self.agent_info.agent_type,
-                    "version": self.agent_info.version
-                },
-                "agentOverhead": {
-                    "memoryInMB": int(memory_usage_mb)
-                },
-                "runtimeVersion": self.runtime_version,
-                "cpuTimeInSeconds": cpu_time_seconds,
-                "metrics": {
-                    "numThreads": average_num_threads
-                },
-                "numTimesSampled": total_sample_count
-            }
-            if overhead_ms != 0:
-                self.json_rep["agentOverhead"]["timeInMs"] = int(overhead_ms)
-        return self.json_rep
+        if self._fleet_info_json is None:
+            self._fleet_info_json = self.fleet_info.serialize_to_map()
+        json_rep = {
+            "sampleWeights": {
+                "WALL_TIME": sample_weight
+            },
+            "durationInMs": duration_ms,
+            "fleetInfo": self._fleet_info_json,
+            "agentInfo": {
+                "type": self.agent_info.agent_type,
+                "version": self.agent_info.version
+            },
+            "agentOverhead": {
+                "memoryInMB": int(memory_usage_mb)
+            },
+            "runtimeVersion": self.runtime_version,
+            "cpuTimeInSeconds": cpu_time_seconds,
+            "metrics": {
+                "numThreads": average_num_threads
+            },
+            "numTimesSampled": total_sample_count
+        }
+        if overhead_ms != 0:
+            json_rep["agentOverhead"]["timeInMs"] = int(overhead_ms)
+        if cpu_time_sample_weight is not None:
+            json_rep["sampleWeights"]["CPU_TIME"] = cpu_time_sample_weight
+        for thread_state in thread_states:
+            json_rep["sampleWeights"][thread_state] = sample_weight
+        return json_rep
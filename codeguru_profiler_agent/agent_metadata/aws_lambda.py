@@ -1,16 +1,14 @@
 import os
 import logging
-import uuid
+import sys
 
-from unittest.mock import MagicMock
 from codeguru_profiler_agent.agent_metadata.fleet_info import FleetInfo
-from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext, HANDLER_ENV_NAME_FOR_CODEGURU_KEY
 
 logger = logging.getLogger(__name__)
 
 LAMBDA_MEMORY_SIZE_ENV = "AWS_LAMBDA_FUNCTION_MEMORY_SIZE"
 LAMBDA_EXECUTION_ENV = "AWS_EXECUTION_ENV"
-HANDLER_ENV_NAME_FOR_CODEGURU_KEY = "HANDLER_ENV_NAME_FOR_CODEGURU"
 LAMBDA_TASK_ROOT = "LAMBDA_TASK_ROOT"
 LAMBDA_RUNTIME_DIR = "LAMBDA_RUNTIME_DIR"
 
@@ -38,6 +36,8 @@ class AWSLambda(FleetInfo):
         self.function_arn = function_arn
         self.memory_limit_mb = memory_limit_mb
         self.execution_env = execution_env
+        # uuid is imported here as importing it takes a few milliseconds, which matters during lambda cold starts
+        import uuid
         self.agent_id = agent_id or str(uuid.uuid4())
 
     def get_fleet_instance_id(self):
@@ -109,7 +109,7 @@ class AWSLambda(FleetInfo):
         Adding a specific condition to ignore MagicMock instances from being added to the metadata since
         it causes boto to raise a ParamValidationError, similar to https://github.com/boto/botocore/issues/2063.
         '''
-        if lambda_context.context is not None and not isinstance(lambda_context.context, MagicMock):
+        if lambda_context.context is not None and not _is_mock(lambda_context.context):
             as_map[AWS_REQUEST_ID_KEY] = lambda_context.context.aws_request_id
             as_map[LAMBDA_REMAINING_TIME_IN_MILLISECONDS_KEY] = \
                 str(lambda_context.context.get_remaining_time_in_millis())
@@ -117,3 +117,9 @@ class AWSLambda(FleetInfo):
             as_map[LAMBDA_PREVIOUS_EXECUTION_TIME_IN_MILLISECONDS_KEY] = \
                 str(int(lambda_context.last_execution_duration.total_seconds() * 1000))
         return as_map
+
+
+def _is_mock(value):
+    # a MagicMock can only exist if unittest.mock was imported, importing it here would slow lambda cold starts down
+    mock_module = sys.modules.get("unittest.mock")
+    return mock_module is not None and isinstance(value, mock_module.MagicMock)
@@ -1,10 +1,7 @@
 import logging
 import os
-import uuid
 
 from abc import ABCMeta, abstractmethod
-from urllib import request
-from urllib.request import Request
 
 METADATA_URI_TIMEOUT_SECONDS = 3
 
@@ -20,7 +17,9 @@ def http_get(url, headers={}):
     logger.debug("Making a request to {} with headers set for these keys: {}".format(url, headers.keys()))
     if not url.startswith("http"):
         raise ValueError("url for metadata is not a valid http address. We will not try to get metadata")
-    req = Request(url)
+    # urllib.request takes a while to import and is not needed during lambda cold starts
+    from urllib import request
+    req = request.Request(url)
     for key in headers:
         req.add_header(key, headers[key])
     return request.urlopen(req, timeout=METADATA_URI_TIMEOUT_SECONDS)  # nosec
@@ -54,6 +53,7 @@ class FleetInfo(metaclass=ABCMeta):  # pragma: no cover
 class DefaultFleetInfo(FleetInfo):
 
     def __init__(self):
+        import uuid
         self.fleet_instance_id = str(uuid.uuid4())
         try:
             # sched_getaffinity gives the number of logical cpus that the process can use on Unix systems.
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import tempfile
+
+from codeguru_profiler_agent.agent_metadata.aws_ec2_instance import AWSEC2Instance
+from codeguru_profiler_agent.agent_metadata.aws_fargate_task import AWSFargateTask
+
+# changes on every boot of the kernel, so a cached fleet info does not outlive the host or task it was looked up for
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+logger = logging.getLogger(__name__)
+
+
+class FleetInfoCache:
+    """
+    Keeps the fleet info looked up from the metadata endpoints in a file, so the processes started later on the same
+    host do not need to query the endpoints again. The file records the boot id of the kernel and is ignored after a
+    reboot; it is only readable by the current user and only trusted if owned by them.
+
+    Only EC2 instance and Fargate task metadata are cached; the default fleet info is looked up again as the endpoints
+    may just have been slow to answer.
+    """
+
+    def __init__(self, file_path=None, boot_id_path=BOOT_ID_PATH):
+        """
+        :param file_path: path of the cache file; default is codeguru-profiler-fleet-info-<uid>.json in the temporary
+            directory
+        :param boot_id_path: path of the file giving the boot id; the cache is disabled if it cannot be read
+        """
+        self._file_path = file_path or os.path.join(
+            tempfile.gettempdir(), "codeguru-profiler-fleet-info-{}.json".format(_get_uid()))
+        self._boot_id_path = boot_id_path
+
+    def load(self):
+        """
+        :return: the cached fleet info, or None if there is none for the current boot
+        """
+        boot_id = self._read_boot_id()
+        if boot_id is None:
+            return None
+        try:
+            with open(self._file_path) as cache_file:
+                if os.fstat(cache_file.fileno()).st_uid != _get_uid():
+                    return None
+                cached = json.load(cache_file)
+            if cached.get("bootId") != boot_id:
+                return None
+            return _deserialize(cached["fleetInfo"])
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.debug("Ignoring the fleet info cache file " + self._file_path, exc_info=True)
+            return None
+
+    def save(self, fleet_info):
+        boot_id = self._read_boot_id()
+        if boot_id is None or not isinstance(fleet_info, (AWSEC2Instance, AWSFargateTask)):
+            return
+        temporary_file_path = "{}.{}.tmp".format(self._file_path, os.getpid())
+        try:
+            file_descriptor = os.open(temporary_file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(file_descriptor, "w") as cache_file:
+                json.dump({"bootId": boot_id, "fleetInfo": fleet_info.serialize_to_map()}, cache_file)
+            # concurrent processes may write the cache at the same time, rename is atomic so readers see either file
+            os.replace(temporary_file_path, self._file_path)
+        except Exception:
+            logger.debug("Unable to write the fleet info cache file " + self._file_path, exc_info=True)
+            try:
+                os.remove(temporary_file_path)
+            except OSError:
+                pass
+
+    def _read_boot_id(self):
+        try:
+            with open(self._boot_id_path) as boot_id_file:
+                return boot_id_file.read().strip() or None
+        except OSError:
+            return None
+
+
+def _deserialize(fleet_info_map):
+    compute_type = fleet_info_map.get("computeType")
+    if compute_type == "aws_ec2_instance":
+        return AWSEC2Instance(host_name=fleet_info_map["hostName"], host_type=fleet_info_map["hostType"])
+    if compute_type == "aws_fargate_task":
+        return AWSFargateTask(task_arn=fleet_info_map["taskArn"], cpu_limit=fleet_info_map.get("cpuLimit"),
+                              memory_limit_in_mb=fleet_info_map.get("memoryLimitInMB"))
+    return None
+
+
+def _get_uid():
+    # os.getuid does not exist on Windows, where there is no boot id file either so the cache is not used
+    return os.getuid() if hasattr(os, "getuid") else 0
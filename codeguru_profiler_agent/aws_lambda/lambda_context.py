@@ -1,17 +1,32 @@
-from datetime import timedelta
-
 _singleton = None
 
+# the layer's bootstrap script keeps the original handler of the function in this environment variable; it is defined
+# here rather than with the other lambda metadata so that the lambda handler does not import it during cold starts
+HANDLER_ENV_NAME_FOR_CODEGURU_KEY = "HANDLER_ENV_NAME_FOR_CODEGURU"
+
+# phases of the lambda sandbox lifecycle, see LambdaContext.phase
+COLD_INVOKE_PHASE = "cold-invoke"
+WARM_INVOKE_PHASE = "warm-invoke"
+PHASES = (COLD_INVOKE_PHASE, WARM_INVOKE_PHASE)
+
 
 class LambdaContext:
     """
     This class contains the contextual data about AWS lambda execution
     It is kept updated by the profiler decorator when a lambda function is called
     It has a singleton pattern to make it available from anywhere for convenience.
+
+    The phase is COLD_INVOKE_PHASE during the first invocation of the sandbox and WARM_INVOKE_PHASE during the next
+    ones; it is None before the first invocation and outside of AWS lambda. There is no phase for the init of the
+    sandbox, as the profiler only starts with the first invocation.
+
+    The last execution duration is a datetime.timedelta, None until the first invocation returns; datetime is not
+    imported here as this module is imported during the cold start of lambda functions.
     """
     def __init__(self):
         self.context = None
-        self.last_execution_duration = timedelta()
+        self.last_execution_duration = None
+        self.phase = None
 
     @classmethod
     def get(cls):
@@ -19,5 +34,3 @@ class LambdaContext:
         if _singleton is None:
             _singleton = LambdaContext()
         return _singleton
-
-
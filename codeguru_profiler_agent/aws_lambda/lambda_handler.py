@@ -1,7 +1,7 @@
 import os
 import importlib
 from codeguru_profiler_agent.aws_lambda.profiler_decorator import with_lambda_profiler
-from codeguru_profiler_agent.agent_metadata.aws_lambda import HANDLER_ENV_NAME_FOR_CODEGURU_KEY
+from codeguru_profiler_agent.aws_lambda.lambda_context import HANDLER_ENV_NAME_FOR_CODEGURU_KEY
 HANDLER_ENV_NAME = "_HANDLER"
 
 
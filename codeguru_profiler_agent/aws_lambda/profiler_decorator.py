@@ -1,8 +1,15 @@
 import os
-from datetime import datetime
-from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext
+import threading
+import time
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext, COLD_INVOKE_PHASE, WARM_INVOKE_PHASE
+
+FLUSH_AT_END_OF_INVOCATION_ENV = "AWS_CODEGURU_PROFILER_FLUSH_AT_END_OF_INVOCATION"
+DEFAULT_MAX_FLUSH_WAIT_MS = 1000
+# time left to the function after the flush, so that it does not time out because of the profiler
+FLUSH_SAFETY_MARGIN_MS = 200
 
 _profiler = None
+_flush_thread = None
 
 
 def _create_lambda_profiler(profiling_group_name, region_name, environment_override, context, env=os.environ):
@@ -23,7 +30,8 @@ def _create_lambda_profiler(profiling_group_name, region_name, environment_overr
 
 
 def with_lambda_profiler(profiling_group_name=None, region_name=None, environment_override=dict(),
-                         profiler_factory=_create_lambda_profiler, env=os.environ):
+                         profiler_factory=_create_lambda_profiler, env=os.environ, flush_at_end_of_invocation=None,
+                         max_flush_wait_ms=DEFAULT_MAX_FLUSH_WAIT_MS):
     """
     Adds profiler start and pause calls around given function execution.
     start() and pause() should never throw exceptions.
@@ -33,17 +41,29 @@ def with_lambda_profiler(profiling_group_name=None, region_name=None, environmen
         configuration for the region. (e.g. "us-west-2")
     :param environment_override: custom dependency container dictionary. allows custom behavior to be injected.
         See Profiler class for details.
+    :param flush_at_end_of_invocation: if True, the profile is reported after the function returns when the reporting
+        interval is reached, instead of waiting for a sample of a later invocation, which may never come for
+        infrequently invoked functions. Default is the AWS_CODEGURU_PROFILER_FLUSH_AT_END_OF_INVOCATION environment
+        variable, "false" if not set.
+    :param max_flush_wait_ms: how long the invocation may wait for the report, also bounded by the remaining time of
+        the invocation; a report that takes longer carries on in the background, while the runtime sends the response,
+        and after the sandbox is thawed for the next invocation.
     """
+    if flush_at_end_of_invocation is None:
+        flush_at_end_of_invocation = env.get(FLUSH_AT_END_OF_INVOCATION_ENV, "false").lower() == "true"
+
     def function_decorator(function):
         def profiler_decorate(event, context):
-            start_time = datetime.now()
+            start_time = time.perf_counter()
             global _profiler
             if _profiler is None:
                 _profiler = profiler_factory(profiling_group_name=profiling_group_name,
                                              region_name=region_name,
                                              environment_override=environment_override,
                                              context=context, env=env)
-            LambdaContext.get().context = context
+            lambda_context = LambdaContext.get()
+            lambda_context.phase = COLD_INVOKE_PHASE if lambda_context.context is None else WARM_INVOKE_PHASE
+            lambda_context.context = context
             if not _profiler.start():
                 # if start() failed, there is high chance it will fail again
                 # so we disable the profiler to prevent further attempts.
@@ -51,19 +71,48 @@ def with_lambda_profiler(profiling_group_name=None, region_name=None, environmen
             try:
                 return function(event, context)
             finally:
-                LambdaContext.get().last_execution_duration = datetime.now() - start_time
+                # imported here rather than with this module to keep it out of the cold start, the profiler already
+                # imported it by then
+                from datetime import timedelta
+                LambdaContext.get().last_execution_duration = timedelta(seconds=time.perf_counter() - start_time)
                 _profiler.pause()
+                if flush_at_end_of_invocation:
+                    _report_if_due(context, max_flush_wait_ms)
 
         return profiler_decorate
 
     return function_decorator
 
 
+def _report_if_due(context, max_flush_wait_ms):
+    """
+    Reports the profile if it is due from a background thread and waits for it within the time budget. If a previous
+    report is still in progress, e.g. it was frozen with the sandbox, we leave it to it.
+    """
+    global _flush_thread
+    if _flush_thread is not None and _flush_thread.is_alive():
+        return
+    try:
+        remaining_time_ms = context.get_remaining_time_in_millis() - FLUSH_SAFETY_MARGIN_MS
+    except Exception:
+        remaining_time_ms = max_flush_wait_ms
+    wait_ms = min(max_flush_wait_ms, remaining_time_ms)
+    if wait_ms <= 0:
+        return
+    _flush_thread = threading.Thread(target=_profiler.report_if_due, name="codeguru-profiler-lambda-flush",
+                                     daemon=True)
+    _flush_thread.start()
+    _flush_thread.join(wait_ms / 1000)
+
+
 def clear_static_profiler():
     """
     Used for unit tests
     """
-    global _profiler
+    global _profiler, _flush_thread
+    if _flush_thread is not None:
+        _flush_thread.join()
+        _flush_thread = None
     if _profiler is not None:
         _profiler.stop()
         _profiler = None
@@ -80,6 +129,9 @@ class _EmptyProfiler:
     def pause(self, block=False):
         return True
 
+    def report_if_due(self):
+        return False
+
     def is_running(self):
         return False
 
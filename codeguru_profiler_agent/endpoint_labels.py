@@ -0,0 +1,115 @@
+"""
+This module keeps track of the endpoint each thread or asyncio task is serving, as recorded by the WSGI and ASGI
+middleware, so that the samples can be partitioned by endpoint under the root of the call graph.
+
+Recording an endpoint is on the request path so it is kept to a dictionary write (threads) or a context variable set
+(asyncio) of the raw request path; the normalization into an endpoint frame happens when sampling, on the profiler
+thread, and is cached.
+"""
+import re
+import threading
+import weakref
+
+from functools import lru_cache
+
+try:
+    import contextvars
+except ImportError:  # Python 3.6, where only the WSGI middleware is supported
+    contextvars = None
+
+from codeguru_profiler_agent.model.frame import Frame
+
+ENDPOINT_FRAME_FORMAT = "<endpoint:{}>"
+# bounds the memory used by the caches and the number of endpoint frames if the paths are not normalized well enough
+MAX_ENDPOINT_FRAMES = 1000
+OTHER_ENDPOINT_FRAME = Frame(name=ENDPOINT_FRAME_FORMAT.format("<other>"))
+# path segments that are most likely identifiers: numbers, uuids and long hexadecimal strings
+PATH_IDENTIFIER_SEGMENT = re.compile(r"/(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+                                     r"|[0-9a-fA-F]{16,})(?=/|$)")
+
+# thread ident -> endpoint of the request the thread is serving; setting and removing a key is atomic under the GIL, so
+# request threads and the sampler do not need a lock.
+endpoints_by_thread_id = {}
+
+
+class _NoContextVar:
+    @staticmethod
+    def get():
+        return None
+
+
+# endpoint of the request an asyncio task is serving; tasks created while serving a request inherit it.
+current_endpoint = contextvars.ContextVar("codeguru_profiler_endpoint", default=None) if contextvars is not None \
+    else _NoContextVar()
+# asyncio task -> endpoint of the request it is serving, for the Python versions where the context of a task cannot be
+# read (before 3.12); only the task running the middleware is recorded there, not the tasks it creates.
+endpoints_by_task = weakref.WeakKeyDictionary()
+# whether an ASGI middleware was created, so the sampler only looks up the current task of event loops if needed
+is_asgi_middleware_used = False
+
+_endpoint_frames = {}
+
+
+def set_endpoint(endpoint):
+    """
+    Replaces the endpoint recorded by the middleware for the request being served by the caller, e.g. with the route
+    template resolved by the web framework ("/users/<id>") which is only known after the middleware was called.
+    This does nothing outside of a request served through one of the middleware.
+
+    :param endpoint: the name of the endpoint, e.g. "GET /users/<id>"
+    """
+    if current_endpoint.get() is not None:
+        current_endpoint.set(endpoint)
+        task = _current_task()
+        if task is not None and task in endpoints_by_task:
+            endpoints_by_task[task] = endpoint
+        return
+    thread_id = threading.get_ident()
+    if thread_id in endpoints_by_thread_id:
+        endpoints_by_thread_id[thread_id] = endpoint
+
+
+def endpoint_frame(endpoint):
+    """
+    :returns: the <endpoint:NAME> frame for the endpoint recorded by the middleware, with identifiers in the path
+        replaced by {id}; or None if endpoint is None
+    """
+    if endpoint is None:
+        return None
+    name = _normalize_endpoint(endpoint)
+    frame = _endpoint_frames.get(name)
+    if frame is None:
+        if len(_endpoint_frames) >= MAX_ENDPOINT_FRAMES:
+            return OTHER_ENDPOINT_FRAME
+        frame = Frame(name=ENDPOINT_FRAME_FORMAT.format(name))
+        _endpoint_frames[name] = frame
+    return frame
+
+
+@lru_cache(maxsize=MAX_ENDPOINT_FRAMES)
+def _normalize_endpoint(endpoint):
+    # the raw paths are only cached for speed: once more than the cache size were seen, the least recently used ones
+    # are normalized again, unlike the endpoint frames which are capped
+    return PATH_IDENTIFIER_SEGMENT.sub("/{id}", endpoint)
+
+
+def task_endpoint(task):
+    """
+    :returns: the endpoint recorded in the context of an asyncio task; or None
+    """
+    # Task.get_context() only exists since Python 3.12, the pure Python tasks of older versions keep the context in a
+    # private attribute and the C tasks do not expose it at all.
+    get_context = getattr(task, "get_context", None)
+    context = get_context() if get_context is not None else getattr(task, "_context", None)
+    if context is None:
+        return endpoints_by_task.get(task)
+    return context.get(current_endpoint)
+
+
+def _current_task():
+    try:
+        import asyncio
+        return asyncio.current_task()
+    except RuntimeError:
+        # no event loop is running in this thread
+        return None
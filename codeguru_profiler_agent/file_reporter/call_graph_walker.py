@@ -0,0 +1,28 @@
+ENTER = "enter"
+LEAVE = "leave"
+
+
+def walk_call_graph(callgraph):
+    """
+    Walks the call graph depth first without recursion, so that deep stacks do not hit the recursion limit and the
+    caller can stream its output while walking. The root node itself is not visited.
+
+    :param callgraph: the root CallGraphNode
+    :returns: an iterator of (event, node, path) where event is ENTER before the children of node are walked and LEAVE
+        after, and path is the list of nodes from the child of the root down to node; path is updated in place so
+        callers must copy it if they keep it.
+    """
+    path = []
+    children_iterators = [iter(callgraph.children)]
+    while children_iterators:
+        child = next(children_iterators[-1], None)
+        if child is None:
+            children_iterators.pop()
+            if path:
+                node = path[-1]
+                yield LEAVE, node, path
+                path.pop()
+            continue
+        path.append(child)
+        yield ENTER, child, path
+        children_iterators.append(iter(child.children))
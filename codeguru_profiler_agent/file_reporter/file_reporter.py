@@ -1,27 +1,100 @@
 import logging
 import datetime
+import gzip
+import os
+import re
 
+from codeguru_profiler_agent.file_reporter.folded_stacks_encoder import FoldedStacksEncoder
+from codeguru_profiler_agent.file_reporter.pprof_encoder import PprofEncoder
+from codeguru_profiler_agent.file_reporter.speedscope_encoder import SpeedscopeEncoder
 from codeguru_profiler_agent.reporter.reporter import Reporter
-from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder
+from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder, GZIP_BALANCED_COMPRESSION_LEVEL
 
 logger = logging.getLogger(__name__)
 
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H-%M-%S"
+TIMESTAMP_PATTERN = r"\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}"
+
+# file format -> (function creating the encoder from the environment, suffix of the files)
+FILE_FORMATS = {
+    "json": (lambda environment: ProfileEncoder(gzip=False, environment=environment), ".json"),
+    "folded": (lambda environment: FoldedStacksEncoder(environment=environment), ".folded"),
+    "speedscope": (lambda environment: SpeedscopeEncoder(environment=environment), ".speedscope.json"),
+    "pprof": (lambda environment: PprofEncoder(environment=environment), ".pb.gz")
+}
+
+
+def _bz2_file(output_stream):
+    import bz2
+    return bz2.BZ2File(output_stream, mode="wb")
+
+
+def _xz_file(output_stream):
+    # lzma is an optional module of the standard library, it is only imported when used
+    import lzma
+    return lzma.LZMAFile(output_stream, mode="wb")
+
+
+# file compression -> (function wrapping the file stream into a compressing stream, suffix added to the files)
+FILE_COMPRESSIONS = {
+    "gzip": (lambda output_stream: gzip.GzipFile(fileobj=output_stream, mode="wb",
+                                                 compresslevel=GZIP_BALANCED_COMPRESSION_LEVEL), ".gz"),
+    "bz2": (_bz2_file, ".bz2"),
+    "xz": (_xz_file, ".xz")
+}
+
 
 class FileReporter(Reporter):
     """
-    Writes JSON-encoded profiles to a file; this is used for testing purposes.
-    """
+    Writes profiles to a file; this is used for testing purposes and by the command line runner to write profiles
+    locally, and can be left on to keep a local archive of the profiles. Besides the JSON format sent to CodeGuru
+    Profiler, profiles can be written as folded stacks for the flame graph tools, as speedscope JSON
+    (https://www.speedscope.app) or as gzipped pprof protocol buffers, and the files can be compressed. The time slices
+    of a profile, if any, are also written each to their own file named after the profile file and the start of the
+    slice.
 
-    _FILE_SUFFIX = ".json"
+    Each file is written to a temporary file renamed once complete, so readers never see a partial profile, and is
+    never overwritten: a counter is added to its name if a file of the same name exists. When a maximum number of files
+    or of bytes is set, the oldest files named after file_prefix are deleted after each report to stay within them.
+    """
 
     def __init__(self, environment=dict()):
         """
         :param environment: dependency container dictionary for the current profiler
         :param file_prefix: (required inside environment) path + file prefix to use for profile reports
+        :param file_path: (inside environment) if set, the path every profile report is written to, replacing the
+            previous one, instead of a file named after file_prefix and the time of the report
+        :param file_format: (inside environment) the format of the profiles, one of "json" (default), "folded",
+            "speedscope" or "pprof"; it also gives the suffix of the files named after file_prefix
+        :param file_compression: (inside environment) "gzip", "bz2" or "xz" to compress the files, which adds the
+            matching suffix to the files named after file_prefix; default is None, no compression. pprof files are
+            always gzipped.
+        :param max_file_count: (inside environment) max number of files named after file_prefix to keep; default is
+            None, no limit
+        :param max_total_file_bytes: (inside environment) max total size of the files named after file_prefix to keep;
+            the latest report is kept even if it is larger. Default is None, no limit
+        :param profile_encoder: (inside environment) the encoder writing the profiles, replacing the one of file_format
         """
         self._file_prefix = environment["file_prefix"]
-        self._profile_encoder = \
-            environment.get("profile_encoder") or ProfileEncoder(gzip=False, environment=environment)
+        self._file_path = environment.get("file_path")
+        file_format = environment.get("file_format") or "json"
+        if file_format not in FILE_FORMATS:
+            raise ValueError("Invalid file format for CodeGuru Profiler detected: {}".format(file_format))
+        create_encoder, self._file_suffix = FILE_FORMATS[file_format]
+        self._profile_encoder = environment.get("profile_encoder") or create_encoder(environment)
+        file_compression = environment.get("file_compression")
+        if file_compression is not None and file_compression not in FILE_COMPRESSIONS:
+            raise ValueError("Invalid file compression for CodeGuru Profiler detected: {}".format(file_compression))
+        self._compress = None
+        if file_compression is not None and file_format != "pprof":
+            self._compress, compression_suffix = FILE_COMPRESSIONS[file_compression]
+            self._file_suffix += compression_suffix
+        # the names given by _output_filename_for, with the counter added by _rename_to_unique_filename
+        self._report_file_name = re.compile("{prefix}{timestamp}(-slice-{timestamp})?(-\\d+)?{suffix}".format(
+            prefix=re.escape(os.path.basename(self._file_prefix)), timestamp=TIMESTAMP_PATTERN,
+            suffix=re.escape(self._file_suffix)))
+        self._max_file_count = environment.get("max_file_count")
+        self._max_total_file_bytes = environment.get("max_total_file_bytes")
 
     def setup(self):
         """
@@ -38,17 +111,100 @@ class FileReporter(Reporter):
     def report(self, profile, agent_metadata=None, timestamp=None):
         if timestamp is None:
             timestamp = datetime.datetime.now()
-        output_filename = self._output_filename_for(timestamp)
+        output_filename = self._write(profile, self._output_filename_for(timestamp))
 
-        logger.info("Writing profile to '{}'".format(output_filename))
+        for time_slice in profile.time_slices:
+            self._report_time_slice(time_slice, timestamp)
 
-        with open(output_filename, 'wb') as output_file_stream:
-            self._profile_encoder.encode(
-                profile=profile, output_stream=output_file_stream)
+        if self._file_path is None:
+            self._delete_oldest_files(keep=output_filename)
+        return output_filename
+
+    def _report_time_slice(self, time_slice, timestamp):
+        slice_start = datetime.datetime.fromtimestamp(time_slice.start / 1000)
+        self._write(time_slice, self._output_filename_for(timestamp, slice_start))
 
+    def _write(self, profile, output_filename):
+        """
+        :return: the name of the file written, which has a counter added to output_filename if it already existed
+        """
+        temporary_filename = "{}.{}.tmp".format(output_filename, os.getpid())
+        try:
+            with open(temporary_filename, 'wb') as output_file_stream:
+                if self._compress is None:
+                    self._profile_encoder.encode(profile=profile, output_stream=output_file_stream)
+                else:
+                    with self._compress(output_file_stream) as compressed_stream:
+                        self._profile_encoder.encode(profile=profile, output_stream=compressed_stream)
+            if self._file_path is not None:
+                os.replace(temporary_filename, output_filename)
+            else:
+                output_filename = self._rename_to_unique_filename(temporary_filename, output_filename)
+        except BaseException:
+            _remove_if_exists(temporary_filename)
+            raise
+        logger.info("Wrote profile to '{}'".format(output_filename))
         return output_filename
 
-    def _output_filename_for(self, timestamp):
+    def _rename_to_unique_filename(self, temporary_filename, output_filename):
+        root = output_filename[:-len(self._file_suffix)]
+        counter = 0
+        while True:
+            filename = output_filename if counter == 0 else "{}-{}{}".format(root, counter, self._file_suffix)
+            try:
+                # unlike a rename, a hard link fails if the file exists, even if another process creates it meanwhile
+                os.link(temporary_filename, filename)
+                os.remove(temporary_filename)
+                return filename
+            except FileExistsError:
+                counter += 1
+            except OSError:
+                # the file system does not support hard links
+                if not os.path.exists(filename):
+                    os.replace(temporary_filename, filename)
+                    return filename
+                counter += 1
+
+    def _delete_oldest_files(self, keep):
+        if self._max_file_count is None and self._max_total_file_bytes is None:
+            return
+        directory = os.path.dirname(self._file_prefix) or "."
+        try:
+            files = []
+            for entry in os.scandir(directory):
+                if self._report_file_name.fullmatch(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+        except OSError:
+            logger.info("Unable to list the profile files in '{}'".format(directory), exc_info=True)
+            return
+        files.sort()
+        file_count = len(files)
+        total_bytes = sum(size for _, _, _, size in files)
+        for _, _, path, size in files:
+            if (self._max_file_count is None or file_count <= self._max_file_count) and \
+                    (self._max_total_file_bytes is None or total_bytes <= self._max_total_file_bytes):
+                return
+            if os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            logger.debug("Deleting profile file '{}'".format(path))
+            _remove_if_exists(path)
+            file_count -= 1
+            total_bytes -= size
+
+    def _output_filename_for(self, timestamp, slice_start=None):
+        slice_suffix = "" if slice_start is None else "-slice-" + slice_start.strftime(TIMESTAMP_FORMAT)
+        if self._file_path is not None:
+            root, extension = os.path.splitext(self._file_path)
+            return root + slice_suffix + extension if slice_suffix else self._file_path
         return self._file_prefix \
-            + timestamp.strftime("%Y-%m-%dT%H-%M-%S") \
-            + self._FILE_SUFFIX
+            + timestamp.strftime(TIMESTAMP_FORMAT) \
+            + slice_suffix \
+            + self._file_suffix
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,30 @@
+import sys
+
+from codeguru_profiler_agent.file_reporter.call_graph_walker import walk_call_graph, ENTER
+from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder, get_frame_name
+
+FRAME_DELIMITER = ";"
+
+
+class FoldedStacksEncoder:
+    """
+    Encodes a profile as folded stacks, the input of Brendan Gregg's flamegraph.pl and of most flame graph tools: one
+    line per stack, with the frames from the root separated by semicolons, followed by the number of samples.
+
+    The lines are written while walking the call graph so only the current stack is held in memory.
+    """
+
+    def __init__(self, environment=dict()):
+        self._module_path_extractor = ProfileEncoder.ModulePathExtractor(environment.get("sys_path") or sys.path)
+
+    def encode(self, profile, output_stream):
+        frame_names = []
+        for event, node, _ in walk_call_graph(profile.callgraph):
+            if event is not ENTER:
+                frame_names.pop()
+                continue
+            # the delimiter cannot be escaped in this format
+            frame_names.append(get_frame_name(node, self._module_path_extractor).replace(FRAME_DELIMITER, ","))
+            if node.runnable_count > 0:
+                output_stream.write("{} {}\n".format(FRAME_DELIMITER.join(frame_names), node.runnable_count)
+                                    .encode("utf-8"))
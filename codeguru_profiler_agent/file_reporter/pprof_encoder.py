@@ -0,0 +1,158 @@
+import gzip
+import sys
+
+from codeguru_profiler_agent.file_reporter.call_graph_walker import walk_call_graph, ENTER
+from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder, get_frame_name, \
+    get_wall_time_milliseconds_per_count
+
+GZIP_BALANCED_COMPRESSION_LEVEL = 6
+NANOSECONDS_PER_MILLISECOND = 1000000
+
+# field numbers of the pprof protocol buffers messages, see
+# https://github.com/google/pprof/blob/main/proto/profile.proto
+PROFILE_SAMPLE_TYPE = 1
+PROFILE_SAMPLE = 2
+PROFILE_LOCATION = 4
+PROFILE_FUNCTION = 5
+PROFILE_STRING_TABLE = 6
+PROFILE_TIME_NANOS = 9
+PROFILE_DURATION_NANOS = 10
+PROFILE_PERIOD_TYPE = 11
+PROFILE_PERIOD = 12
+VALUE_TYPE_TYPE = 1
+VALUE_TYPE_UNIT = 2
+SAMPLE_LOCATION_ID = 1
+SAMPLE_VALUE = 2
+LOCATION_ID = 1
+LOCATION_LINE = 4
+LINE_FUNCTION_ID = 1
+LINE_LINE = 2
+FUNCTION_ID = 1
+FUNCTION_NAME = 2
+FUNCTION_SYSTEM_NAME = 3
+FUNCTION_FILENAME = 4
+
+# protocol buffers wire types
+VARINT = 0
+LENGTH_DELIMITED = 2
+
+
+class PprofEncoder:
+    """
+    Encodes a profile in the gzipped protocol buffers format of pprof (https://github.com/google/pprof), with a
+    "samples" count and a "wall" time in nanoseconds for each stack. The protocol buffers are written by hand as the
+    format only needs a handful of messages, which spares a dependency on protobuf.
+
+    Samples are written while walking the call graph; the functions, locations and strings they refer to by id are
+    written at the end, which protocol buffers allow as the order of the fields of a message does not matter.
+    """
+
+    def __init__(self, environment=dict(), gzip=True):
+        self._gzip = gzip
+        self._module_path_extractor = ProfileEncoder.ModulePathExtractor(environment.get("sys_path") or sys.path)
+
+    def encode(self, profile, output_stream):
+        if self._gzip:
+            output_stream = gzip.GzipFile(fileobj=output_stream, mode="wb",
+                                          compresslevel=GZIP_BALANCED_COMPRESSION_LEVEL)
+        strings = _StringTable()
+        nanoseconds_per_count = get_wall_time_milliseconds_per_count(profile) * NANOSECONDS_PER_MILLISECOND
+        output_stream.write(_message_field(PROFILE_SAMPLE_TYPE, _value_type(strings, "samples", "count")))
+        output_stream.write(_message_field(PROFILE_SAMPLE_TYPE, _value_type(strings, "wall", "nanoseconds")))
+
+        # function id by frame name; ids start at 1 as 0 means unset, and each function has the location of same id
+        function_ids = {}
+        functions = []
+        location_ids = []
+        for event, node, _ in walk_call_graph(profile.callgraph):
+            if event is not ENTER:
+                location_ids.pop()
+                continue
+            frame_name = get_frame_name(node, self._module_path_extractor)
+            function_id = function_ids.get(frame_name)
+            if function_id is None:
+                function_id = function_ids[frame_name] = len(functions) + 1
+                functions.append(node)
+            location_ids.append(function_id)
+            if node.runnable_count > 0:
+                # pprof lists the locations of a sample from the leaf to the root
+                output_stream.write(_message_field(PROFILE_SAMPLE, b"".join([
+                    _packed_varints_field(SAMPLE_LOCATION_ID, reversed(location_ids)),
+                    _packed_varints_field(SAMPLE_VALUE, [node.runnable_count,
+                                                         int(node.runnable_count * nanoseconds_per_count)])])))
+
+        for function_id, (frame_name, node) in enumerate(zip(function_ids, functions), start=1):
+            output_stream.write(_message_field(PROFILE_LOCATION, b"".join([
+                _varint_field(LOCATION_ID, function_id),
+                _message_field(LOCATION_LINE, _varint_field(LINE_FUNCTION_ID, function_id)
+                               + _varint_field(LINE_LINE, node.start_line or 0))])))
+            function_name = strings.index_of(frame_name)
+            output_stream.write(_message_field(PROFILE_FUNCTION, b"".join([
+                _varint_field(FUNCTION_ID, function_id),
+                _varint_field(FUNCTION_NAME, function_name),
+                _varint_field(FUNCTION_SYSTEM_NAME, function_name),
+                _varint_field(FUNCTION_FILENAME, strings.index_of(node.file_path or ""))])))
+
+        output_stream.write(_varint_field(PROFILE_TIME_NANOS, int(profile.start) * NANOSECONDS_PER_MILLISECOND))
+        output_stream.write(_varint_field(PROFILE_DURATION_NANOS,
+                                          int(profile.get_active_millis_since_start()) * NANOSECONDS_PER_MILLISECOND))
+        output_stream.write(_message_field(PROFILE_PERIOD_TYPE, _value_type(strings, "wall", "nanoseconds")))
+        output_stream.write(_varint_field(PROFILE_PERIOD, profile.sampling_interval_ms * NANOSECONDS_PER_MILLISECOND))
+        for string in strings.strings:
+            output_stream.write(_bytes_field(PROFILE_STRING_TABLE, string.encode("utf-8")))
+
+        if self._gzip:
+            output_stream.close()
+
+
+class _StringTable:
+    def __init__(self):
+        # the first string of the table must be the empty string
+        self.strings = [""]
+        self._indexes = {"": 0}
+
+    def index_of(self, string):
+        index = self._indexes.get(string)
+        if index is None:
+            index = self._indexes[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+
+def _value_type(strings, value_type, unit):
+    return _varint_field(VALUE_TYPE_TYPE, strings.index_of(value_type)) + \
+        _varint_field(VALUE_TYPE_UNIT, strings.index_of(unit))
+
+
+def _varint(value):
+    # like protobuf does for int64 fields, negative values are encoded as their 64 bits two's complement
+    value &= 0xFFFFFFFFFFFFFFFF
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _key(field_number, wire_type):
+    return _varint(field_number << 3 | wire_type)
+
+
+def _varint_field(field_number, value):
+    return _key(field_number, VARINT) + _varint(value)
+
+
+def _bytes_field(field_number, data):
+    return _key(field_number, LENGTH_DELIMITED) + _varint(len(data)) + data
+
+
+def _message_field(field_number, message):
+    return _bytes_field(field_number, message)
+
+
+def _packed_varints_field(field_number, values):
+    return _bytes_field(field_number, b"".join(_varint(value) for value in values))
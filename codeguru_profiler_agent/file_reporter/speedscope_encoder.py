@@ -0,0 +1,59 @@
+import json
+import sys
+
+from codeguru_profiler_agent.file_reporter.call_graph_walker import walk_call_graph, ENTER
+from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder, get_frame_name, \
+    get_wall_time_milliseconds_per_count
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+EXPORTER = "codeguru-profiler-python-agent"
+
+
+class SpeedscopeEncoder:
+    """
+    Encodes a profile in the speedscope file format (https://www.speedscope.app), as an evented profile in milliseconds
+    of wall clock time: each frame is opened when the walk enters its node, its children are laid out one after the
+    other, then its self time, and it is closed.
+
+    The events are written while walking the call graph; the frame names are only written at the end as their index
+    is what the events refer to, so they are the only part of the profile kept in memory.
+    """
+
+    def __init__(self, environment=dict()):
+        self._module_path_extractor = ProfileEncoder.ModulePathExtractor(environment.get("sys_path") or sys.path)
+
+    def encode(self, profile, output_stream):
+        milliseconds_per_sample = get_wall_time_milliseconds_per_count(profile)
+        frame_indexes = {}
+        frame_names = []
+        # frame index of each node of the current stack
+        stack_frame_indexes = []
+        output_stream.write(
+            '{{"$schema": {}, "exporter": {}, "name": {}, "activeProfileIndex": 0, "profiles": [{{"type": "evented", '
+            '"name": {}, "unit": "milliseconds", "startValue": 0, "events": ['
+            .format(json.dumps(SPEEDSCOPE_SCHEMA), json.dumps(EXPORTER), json.dumps(profile.profiling_group_name),
+                    json.dumps(profile.profiling_group_name)).encode("utf-8"))
+        samples = 0
+        separator = ""
+        for event, node, _ in walk_call_graph(profile.callgraph):
+            if event is ENTER:
+                frame_name = get_frame_name(node, self._module_path_extractor)
+                frame_index = frame_indexes.get(frame_name)
+                if frame_index is None:
+                    frame_index = frame_indexes[frame_name] = len(frame_names)
+                    frame_names.append(frame_name)
+                stack_frame_indexes.append(frame_index)
+                event_type = "O"
+            else:
+                frame_index = stack_frame_indexes.pop()
+                samples += node.runnable_count
+                event_type = "C"
+            output_stream.write('{}{{"type": "{}", "frame": {}, "at": {}}}'.format(
+                separator, event_type, frame_index, samples * milliseconds_per_sample).encode("utf-8"))
+            separator = ", "
+        output_stream.write('], "endValue": {}}}], "shared": {{"frames": ['.format(
+            samples * milliseconds_per_sample).encode("utf-8"))
+        output_stream.write(", ".join('{{"name": {}}}'.format(json.dumps(name)) for name in frame_names)
+                            .encode("utf-8"))
+        output_stream.write(b']}}')
+
@@ -0,0 +1,168 @@
+"""
+This module records how long modules take to be imported, which the sampling profiler hardly sees as imports mostly
+happen once at startup, before the first samples.
+"""
+import sys
+import threading
+import time
+
+from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo
+from codeguru_profiler_agent.model.frame import Frame
+from codeguru_profiler_agent.model.profile import Profile
+from codeguru_profiler_agent.utils.time import current_milli_time
+
+# the call graph counts are expressed in microseconds of import time
+MICROSECONDS_PER_SECOND = 1000000
+# the profile keeps its sampling interval in whole milliseconds; the sample weight of the import profile is derived from
+# its sample count and active time instead, so this only needs to be a valid interval
+SAMPLING_INTERVAL_SECONDS = 0.001
+
+
+class ImportNode:
+    __slots__ = ("module_name", "cumulative_seconds", "children")
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        # time spent executing the module, including the modules it imported
+        self.cumulative_seconds = 0.0
+        self.children = {}
+
+    @property
+    def self_seconds(self):
+        return max(0.0, self.cumulative_seconds - sum(child.cumulative_seconds for child in self.children.values()))
+
+
+class ImportProfiler:
+    """
+    Records the tree of the modules imported while it is running, with the time spent executing each of them. It wraps
+    each finder of sys.meta_path with a finder of its own which wraps the loader of the modules found, so that their
+    execution is timed; the modules get their original loader back before being executed. Finders added to the meta
+    path once it is running are not wrapped, so the modules they find are not recorded.
+
+    The time spent finding a module is accounted to the module importing it, so the cumulative time of top level
+    imports does not include how long it took to find them.
+    """
+
+    def __init__(self, meta_path=None, clock=time.perf_counter):
+        """
+        :param meta_path: the list of finders to wrap; default is sys.meta_path
+        :param clock: function returning the current time in seconds, used to time the imports
+        """
+        self._meta_path = meta_path if meta_path is not None else sys.meta_path
+        self._clock = clock
+        self._is_running = False
+        self._import_stacks = threading.local()
+        self.root = ImportNode(module_name=None)
+        self.start_time_ms = None
+
+    def start(self):
+        if self.is_running():
+            return
+        self.start_time_ms = current_milli_time()
+        # the finders are wrapped in place rather than searched from a finder inserted first so that the search for
+        # a module that is not found is not done again by the finders of the meta path
+        self._meta_path[:] = [_TimingFinder(finder, self) if hasattr(finder, "find_spec") else finder
+                              for finder in self._meta_path]
+        self._is_running = True
+
+    def stop(self):
+        if not self.is_running():
+            return
+        self._meta_path[:] = [finder._finder if isinstance(finder, _TimingFinder) and finder._import_profiler is self
+                              else finder for finder in self._meta_path]
+        self._is_running = False
+
+    def is_running(self):
+        return self._is_running
+
+    def to_profile(self, profiling_group_name):
+        """
+        Converts the import tree into a profile where each module is a frame under the frame of the module importing it,
+        with its self time in microseconds as count. The active time of the profile is the total import time so the
+        sample weight converts the counts back to seconds.
+        """
+        total_seconds = sum(node.cumulative_seconds for node in self.root.children.values())
+        total_microseconds = int(total_seconds * MICROSECONDS_PER_SECOND)
+        start_ms = self.start_time_ms or current_milli_time()
+        end_ms = start_ms + max(1, int(total_seconds * 1000))
+        profile = Profile(profiling_group_name=profiling_group_name,
+                          sampling_interval_seconds=SAMPLING_INTERVAL_SECONDS, host_weight=1, start=start_ms,
+                          agent_debug_info=AgentDebugInfo(), clock=lambda: end_ms / 1000)
+        to_insert = [(profile.callgraph, node) for node in self.root.children.values()]
+        while to_insert:
+            parent, node = to_insert.pop()
+            call_graph_node = parent.update_current_node_and_get_child(Frame(name=node.module_name))
+            self_microseconds = int(node.self_seconds * MICROSECONDS_PER_SECOND)
+            if self_microseconds > 0:
+                call_graph_node.increase_runnable_count(self_microseconds)
+            to_insert.extend((call_graph_node, child) for child in node.children.values())
+        profile.total_sample_count = total_microseconds
+        profile.total_attempted_sample_threads_count = total_microseconds
+        profile.total_seen_threads_count = total_microseconds
+        profile.end = end_ms
+        return profile
+
+    def _enter(self, module_name):
+        stack = self._import_stack()
+        parent = stack[-1][0] if stack else self.root
+        node = parent.children.get(module_name)
+        if node is None:
+            node = ImportNode(module_name)
+            parent.children[module_name] = node
+        stack.append((node, self._clock()))
+
+    def _exit(self):
+        node, start_seconds = self._import_stack().pop()
+        node.cumulative_seconds += self._clock() - start_seconds
+
+    def _import_stack(self):
+        stack = getattr(self._import_stacks, "stack", None)
+        if stack is None:
+            stack = self._import_stacks.stack = []
+        return stack
+
+
+class _TimingFinder:
+    """
+    Finds modules with the finder it wraps and wraps the loader of the spec it returns.
+    """
+
+    def __init__(self, finder, import_profiler):
+        self._finder = finder
+        self._import_profiler = import_profiler
+
+    def __getattr__(self, name):
+        return getattr(self._finder, name)
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = self._finder.find_spec(fullname, path, target)
+        if spec is None or spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return spec
+        spec.loader = _TimingLoader(spec.loader, self._import_profiler)
+        return spec
+
+
+class _TimingLoader:
+    def __init__(self, loader, import_profiler):
+        self._loader = loader
+        self._import_profiler = import_profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        create_module = getattr(self._loader, "create_module", None)
+        return create_module(spec) if create_module is not None else None
+
+    def exec_module(self, module):
+        # put the original loader back first as some code checks the type of the loader of a module
+        spec = getattr(module, "__spec__", None)
+        if spec is not None and spec.loader is self:
+            spec.loader = self._loader
+        if getattr(module, "__loader__", None) is self:
+            module.__loader__ = self._loader
+        self._import_profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._import_profiler._exit()
@@ -4,13 +4,17 @@ import datetime
 
 from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
-from codeguru_profiler_agent.metrics.with_timer import with_timer
+from codeguru_profiler_agent.metrics.with_timer import with_timer, bind_untimed_methods
 from codeguru_profiler_agent.model.profile import Profile
+from codeguru_profiler_agent.socket_reporter.profile_aggregate_encoder import ProfileAggregateEncoder
+from codeguru_profiler_agent.utils.log_exception import log_exception
 from codeguru_profiler_agent.utils.time import current_milli_time
 from codeguru_profiler_agent.sdk_reporter.sdk_reporter import SdkReporter
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_TIME_SLICES = 10
+
 
 class LocalAggregator:
     """
@@ -20,6 +24,14 @@ class LocalAggregator:
     Each time we sample, the aggregator will check if the memory usage of the profile exceeds the memory limit.
     If memory limit is violated, a force_flush will be executed first; if the last flush action happened within
     the minimum time for reporting, OverMemoryLimitException will be raised.
+    Profiles are double-buffered: a spare profile is built ahead of time and swapped in when we report or reset, so
+    sampling can continue into it right away while the previous profile is sealed and encoded.
+    When an aggregation server is configured, the aggregates it received from other processes are merged into the
+    profile every time we sample and right before we report.
+    When a profile server is configured, the requests it received are answered right after each sample is added.
+    When a time slice duration is configured, the samples are aggregated into consecutive sub-profiles of that
+    duration which are merged into the profile when it is sealed for reporting; reporters may write them separately
+    (see FileReporter) to correlate incidents with stack changes at a finer granularity than the reporting interval.
     """
 
     def __init__(self, reporter, environment=dict()):
@@ -34,17 +46,34 @@ class LocalAggregator:
         :param errors_metadata: (required inside environment) metadata capturing errors in the current profile.
         :param profile_factory: (inside environment) the factory to created profiler; default Profile.
         :param clock: (inside environment) clock to be used; default is time.time
+        :param aggregation_server: (inside environment) AggregationServer receiving profile aggregates from other
+            processes; default None
+        :param time_slice_duration: (inside environment) duration of the time slices of the profile in
+            datetime.timedelta; default None, no time slices
+        :param max_time_slices: (inside environment) max number of time slices kept per profile, older ones are merged
+            into the profile; default 10
         """
         self.reporter = reporter
         self.profiling_group_name = environment["profiling_group_name"]
         self.host_weight = environment["host_weight"]
         self.timer = environment["timer"]
+        bind_untimed_methods(self)
         self.errors_metadata = environment["errors_metadata"]
 
         self.profile_factory = environment.get("profile_factory") or Profile
         self.clock = environment.get("clock") or time.time
+        self.aggregation_server = environment.get("aggregation_server")
+        self.profile_aggregate_encoder = \
+            environment.get("profile_aggregate_encoder") or ProfileAggregateEncoder()
+        time_slice_duration = environment.get("time_slice_duration")
+        self.time_slice_duration_ms = \
+            time_slice_duration.total_seconds() * 1000 if time_slice_duration is not None else None
+        self.max_time_slices = environment.get("max_time_slices") or DEFAULT_MAX_TIME_SLICES
 
         self.profile = None
+        # the last profile swapped out for reporting, sealed; kept until the next reset.
+        self.sealed_profile = None
+        self._spare_profile = None
         self.memory_limit_bytes = environment["memory_limit_bytes"]
         self.last_report_attempted = current_milli_time(clock=self.clock)
         self.agent_start_time = current_milli_time(clock=self.clock)
@@ -57,6 +86,8 @@ class LocalAggregator:
         :param sample: Sample instance reported by Sampler
         """
         self._aggregate_sample(sample)
+        if self.aggregation_server is not None:
+            self._merge_pending_aggregates()
         self._check_memory_limit()
 
     def setup(self):
@@ -64,8 +95,30 @@ class LocalAggregator:
 
     @with_timer("aggregateThreadDumps")
     def _aggregate_sample(self, sample):
+        if self.time_slice_duration_ms is not None:
+            self._maybe_start_time_slice()
         self.profile.add(sample)
 
+    def _maybe_start_time_slice(self):
+        now = current_milli_time(clock=self.clock)
+        time_slice = self.profile.current_time_slice
+        if time_slice is None or now - time_slice.start >= self.time_slice_duration_ms:
+            # the new slice starts at the previous sample so that the sample being added is after its start
+            start = self.profile.end or self.profile.start
+            self.profile.start_time_slice(self._create_profile(min(start, now)), self.max_time_slices)
+
+    @with_timer("mergeProfileAggregates")
+    def _merge_pending_aggregates(self):
+        aggregates = self.aggregation_server.pending_aggregates()
+        for aggregate in aggregates:
+            try:
+                self.profile_aggregate_encoder.decode_into(payload=aggregate, profile=self.profile)
+            except Exception as e:
+                log_exception(logger, "Failed to merge a profile aggregate: {}".format(str(e)))
+        now = current_milli_time(clock=self.clock)
+        if aggregates and now > self.profile.start:
+            self.profile.end = now
+
     def _check_memory_limit(self):
         if self.profile.get_memory_usage_bytes() > self.memory_limit_bytes:
             if self._is_under_min_reporting_time(
@@ -75,13 +128,41 @@ class LocalAggregator:
             self.flush(force=True)
 
     def reset(self):
+        """
+        Resets the errors and timer metrics and makes sure we sample into a new profile: if the profile was already
+        swapped out for reporting since the last reset, the profile we are sampling into is kept.
+        """
         self.errors_metadata.reset()
         self.timer.reset()
-        self.profile = self.profile_factory(
+        if self.sealed_profile is None:
+            self._swap_profile()
+        self.sealed_profile = None
+
+    def _swap_profile(self):
+        """
+        Replaces the profile we are sampling into by the spare one built ahead of time, then seals the previous one and
+        builds the next spare. The previous profile is kept in sealed_profile. If the previous profile was paused, e.g.
+        the profiler is paused at the end of a lambda invocation, the next one starts paused so the time until the
+        profiler is resumed is not counted as active.
+        """
+        now = current_milli_time(clock=self.clock)
+        next_profile = self._spare_profile or self._create_profile(now)
+        next_profile.restart_at(now)
+        previous_profile, self.profile = self.profile, next_profile
+        if previous_profile is not None:
+            if previous_profile.is_paused():
+                next_profile.pause()
+            previous_profile.seal()
+        self.sealed_profile = previous_profile
+        self._spare_profile = self._create_profile(now)
+        return previous_profile
+
+    def _create_profile(self, now):
+        return self.profile_factory(
             profiling_group_name=self.profiling_group_name,
             sampling_interval_seconds=AgentConfiguration.get().sampling_interval.total_seconds(),
             host_weight=self.host_weight,
-            start=current_milli_time(clock=self.clock),
+            start=now,
             agent_debug_info=AgentDebugInfo(self.errors_metadata, self.agent_start_time, self.timer),
             clock=self.clock
         )
@@ -96,6 +177,8 @@ class LocalAggregator:
         if self._is_under_min_reporting_time(now):
             logger.info("Dropping the profile as it is under the minimum reporting time")
         else:
+            if self.aggregation_server is not None:
+                self._merge_pending_aggregates()
             self._report_profile(now)
             reported = True
 
@@ -110,11 +193,12 @@ class LocalAggregator:
         previous_last_report_attempted_value = self.last_report_attempted
         self.last_report_attempted = now
         self._add_overhead_metric_to_profile()
-        logger.info("Attempting to report profile data: " + str(self.profile))
-        if self.profile.is_empty():
+        profile = self._swap_profile()
+        logger.info("Attempting to report profile data: " + str(profile))
+        if profile.is_empty():
             logger.info("Report was cancelled because it was empty")
             return False
-        is_reporting_successful = self.reporter.report(self.profile)
+        is_reporting_successful = self.reporter.report(profile)
         '''
         If we attempt to create a Profiling Group in the report() call, we do not want to update the last_report_attempted_value
         since we did not actually report a profile.
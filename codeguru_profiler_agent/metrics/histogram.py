@@ -0,0 +1,60 @@
+import math
+
+# Each power of two is split in this many linear sub-buckets, so a value is known within 1/16 of its power of two, i.e.
+# the relative error of percentiles is under 6.25%.
+SUB_BUCKET_COUNT = 16
+# Values are recorded in seconds: powers of two from 2^-24 (~60 nanoseconds) up to 2^40 are tracked, values outside of
+# this range are counted in the first or last bucket.
+MIN_EXPONENT = -24
+MAX_EXPONENT = 40
+BUCKET_COUNT = (MAX_EXPONENT - MIN_EXPONENT) * SUB_BUCKET_COUNT
+
+
+class LogLinearHistogram:
+    """
+    Fixed-size histogram of positive values with log-linear buckets (as in HdrHistogram): recording a value is O(1) and
+    only increments a counter of a list allocated upfront, so it can be done on the sampling path; percentiles are
+    computed by walking the buckets when they are reported.
+    """
+    __slots__ = ("counts", "count")
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+
+    def record(self, value):
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+
+    def percentile(self, percentile):
+        """
+        :param percentile: the percentile to return, between 0 and 100, e.g. 99.9
+        :returns: the upper bound of the bucket holding the value at this percentile; 0 if nothing was recorded
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(self.count * percentile / 100))
+        seen_count = 0
+        for index, count in enumerate(self.counts):
+            seen_count += count
+            if seen_count >= rank:
+                return _bucket_upper_bound(index)
+        return _bucket_upper_bound(BUCKET_COUNT - 1)
+
+
+def _bucket_index(value):
+    if value <= 0:
+        return 0
+    # value = mantissa * 2^exponent with 0.5 <= mantissa < 1
+    mantissa, exponent = math.frexp(value)
+    if exponent <= MIN_EXPONENT:
+        return 0
+    if exponent > MAX_EXPONENT:
+        return BUCKET_COUNT - 1
+    return (exponent - MIN_EXPONENT - 1) * SUB_BUCKET_COUNT + int((mantissa - 0.5) * 2 * SUB_BUCKET_COUNT)
+
+
+def _bucket_upper_bound(index):
+    exponent = index // SUB_BUCKET_COUNT + MIN_EXPONENT + 1
+    sub_bucket = index % SUB_BUCKET_COUNT
+    return math.ldexp(0.5 + (sub_bucket + 1) / (2 * SUB_BUCKET_COUNT), exponent)
@@ -1,18 +1,30 @@
+from codeguru_profiler_agent.metrics.histogram import LogLinearHistogram
+
+
 class Metric:
     def __init__(self):
         self.counter = 0
         self.total = 0
         self.max = 0
+        self.histogram = LogLinearHistogram()
 
     def add(self, value):
         self.counter += 1
         self.total += value
         if self.max < value:
             self.max = value
+        self.histogram.record(value)
 
     def average(self):
         return 0 if self.counter == 0 else self.total / self.counter
 
+    def percentile(self, percentile):
+        """
+        :param percentile: the percentile to return, between 0 and 100, e.g. 99.9
+        :returns: an estimate of the value at this percentile, within 6.25% of the actual value
+        """
+        return min(self.histogram.percentile(percentile), self.max)
+
     def __repr__(self):
         return "{}@{:#04x}(counter={}, total={:.5f}, max={:.5f}, average={:.5f})".format(
             self.__class__.__name__, id(self), self.counter, self.total,
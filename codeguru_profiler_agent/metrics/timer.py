@@ -7,12 +7,21 @@ class Timer:
     At the moment these metrics are collected but not reported to the backend.
     """
 
-    def __init__(self):
+    def __init__(self, metric_names=None):
+        """
+        :param metric_names: names of the metrics to record, others are ignored; default None records all metrics
+        """
         self.metrics = {}
+        self.metric_names = frozenset(metric_names) if metric_names is not None else None
+
+    def is_recorded(self, name):
+        return self.metric_names is None or name in self.metric_names
 
     def record(self, name, value):
         metric = self.metrics.get(name)
         if metric is None:
+            if not self.is_recorded(name):
+                return
             metric = self.metrics[name] = Metric()
         metric.add(value)
 
@@ -1,5 +1,8 @@
 from __future__ import absolute_import
 
+import functools
+import types
+
 from time import perf_counter
 from time import process_time
 
@@ -19,6 +22,7 @@ def with_timer(metric_name, measurement="cpu-time"):
                 "Unexpected measurement mode for timer '{}'".format(
                     str(measurement)))
 
+        @functools.wraps(fn)
         def timed(self, *args, **kwargs):
             if self.timer is None:
                 return fn(self, *args, **kwargs)
@@ -29,6 +33,26 @@ def with_timer(metric_name, measurement="cpu-time"):
 
             return result
 
+        timed.timer_metric_name = metric_name
         return timed
 
     return wrapper
+
+
+def bind_untimed_methods(instance, measured_elsewhere=()):
+    """
+    Binds the methods decorated with with_timer directly to the decorated function on the instance, skipping the
+    timing wrapper, when the timer of the instance does not record their metric; this is meant to be called from the
+    constructor of classes with methods called on the sampling path.
+
+    :param instance: object holding the timer, as for with_timer
+    :param measured_elsewhere: names of metrics the instance measures itself, e.g. as part of a batch
+    """
+    timer = instance.timer
+    for attribute_name in dir(type(instance)):
+        method = getattr(type(instance), attribute_name, None)
+        metric_name = getattr(method, "timer_metric_name", None)
+        if metric_name is None:
+            continue
+        if timer is None or not timer.is_recorded(metric_name) or metric_name in measured_elsewhere:
+            setattr(instance, attribute_name, types.MethodType(method.__wrapped__, instance))
@@ -0,0 +1,37 @@
+import asyncio
+
+from codeguru_profiler_agent import endpoint_labels
+
+
+class AsgiEndpointMiddleware:
+    """
+    ASGI middleware recording the endpoint served by each asyncio task so that the profile is partitioned by endpoint,
+    e.g.
+
+        app = AsgiEndpointMiddleware(app)
+
+    The endpoint is kept in a context variable, so tasks created while serving a request are attributed to its endpoint
+    too from Python 3.12 on; before that only the task serving the request is. It is "<method> <path>" with identifiers in the path replaced by {id}; use endpoint_labels.set_endpoint() to
+    replace it with the route resolved by your web framework.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        endpoint_labels.is_asgi_middleware_used = True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.app(scope, receive, send)
+        endpoint = scope.get("method", "WEBSOCKET") + " " + scope.get("path", "")
+        token = endpoint_labels.current_endpoint.set(endpoint)
+        task = asyncio.current_task()
+        previous_endpoint = endpoint_labels.endpoints_by_task.get(task)
+        endpoint_labels.endpoints_by_task[task] = endpoint
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            endpoint_labels.current_endpoint.reset(token)
+            if previous_endpoint is None:
+                endpoint_labels.endpoints_by_task.pop(task, None)
+            else:
+                endpoint_labels.endpoints_by_task[task] = previous_endpoint
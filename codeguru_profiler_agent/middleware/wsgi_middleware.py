@@ -0,0 +1,31 @@
+import threading
+
+from codeguru_profiler_agent.endpoint_labels import endpoints_by_thread_id
+
+
+class WsgiEndpointMiddleware:
+    """
+    WSGI middleware recording the endpoint served by each thread so that the profile is partitioned by endpoint, e.g.
+
+        app.wsgi_app = WsgiEndpointMiddleware(app.wsgi_app)
+
+    The endpoint is "<method> <path>" with identifiers in the path replaced by {id}; use
+    endpoint_labels.set_endpoint() to replace it with the route resolved by your web framework.
+    Note that the body of streamed responses is produced after the middleware returns, so it is not attributed to the
+    endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        thread_id = threading.get_ident()
+        previous_endpoint = endpoints_by_thread_id.get(thread_id)
+        endpoints_by_thread_id[thread_id] = environ.get("REQUEST_METHOD", "") + " " + environ.get("PATH_INFO", "")
+        try:
+            return self.app(environ, start_response)
+        finally:
+            if previous_endpoint is None:
+                del endpoints_by_thread_id[thread_id]
+            else:
+                endpoints_by_thread_id[thread_id] = previous_endpoint
@@ -5,7 +5,7 @@ class CallGraphNode:
     #
     # Note that of course these need to be maintained in sync with the fields being used by the class.
     __slots__ = ("frame_name", "class_name", "file_path", "runnable_count", "start_line", "end_line", "children",
-                 "memory_counter")
+                 "memory_counter", "cpu_time_seconds", "thread_state_counts")
 
     def __init__(self, frame_name, class_name, file_path, line_no, memory_counter=None):
         """
@@ -30,6 +30,12 @@ class CallGraphNode:
         # common, for now we just assume this is the case and don't check for it
         self.file_path = file_path
         self.runnable_count = 0
+        # cpu time spent by the sampled threads while this frame was at the top of their stack; only set when cpu time
+        # is sampled as most profiles do not need it
+        self.cpu_time_seconds = None
+        # how many times this frame was at the top of the stack per thread state; only set when thread states are
+        # classified, see thread_state_classifier
+        self.thread_state_counts = None
         # the start and end of the range of line number where we observed this node
         # None is expected for root node and agent duration metric node
         self.start_line = line_no
@@ -48,10 +54,38 @@ class CallGraphNode:
         node = self._get_child(frame=frame) or \
             self._insert_new_child(
                 CallGraphNode(frame_name=frame.name, class_name=frame.class_name, file_path=frame.file_path,
-                              line_no=frame.line_no))
+                              line_no=frame.line_no, memory_counter=self.memory_counter))
         node._maybe_update_line_no(frame.line_no)
         return node
 
+    def merge_and_get_child(self, other_child):
+        """
+        Counterpart of update_current_node_and_get_child used when merging call graphs: finds (or creates) the child
+        representing the same frame as other_child, which is a node from another call graph, and adds the runnable
+        count and the line range of other_child to it. Children of other_child are left for the caller to merge.
+        """
+        node = self._get_child_matching(other_child.frame_name, other_child.class_name, other_child.file_path) or \
+            self._insert_new_child(
+                CallGraphNode(frame_name=other_child.frame_name, class_name=other_child.class_name,
+                              file_path=other_child.file_path, line_no=None, memory_counter=self.memory_counter))
+        node.merge_counts(other_child)
+        return node
+
+    def merge_counts(self, other_node):
+        """
+        Adds the runnable count, the cpu time, the thread state counts and the line range of other_node, which
+        represents the same frame, to this node.
+        """
+        if other_node.runnable_count:
+            self.increase_runnable_count(other_node.runnable_count)
+        if other_node.cpu_time_seconds:
+            self.increase_cpu_time(other_node.cpu_time_seconds)
+        if other_node.thread_state_counts:
+            for thread_state, count in other_node.thread_state_counts.items():
+                self.increase_thread_state_count(thread_state, count)
+        self._maybe_update_line_no(other_node.start_line)
+        self._maybe_update_line_no(other_node.end_line)
+
     def increase_runnable_count(self, value_to_add=1):
         if value_to_add < 0:
             raise ValueError(
@@ -59,6 +93,22 @@ class CallGraphNode:
 
         self.runnable_count += value_to_add
 
+    def increase_cpu_time(self, seconds_to_add):
+        if seconds_to_add < 0:
+            raise ValueError(
+                "Cannot add negative cpu time to node: {}".format(seconds_to_add))
+
+        self.cpu_time_seconds = (self.cpu_time_seconds or 0.0) + seconds_to_add
+
+    def increase_thread_state_count(self, thread_state, value_to_add=1):
+        if value_to_add < 0:
+            raise ValueError(
+                "Cannot add negative counts to node: {}".format(value_to_add))
+
+        if self.thread_state_counts is None:
+            self.thread_state_counts = {}
+        self.thread_state_counts[thread_state] = self.thread_state_counts.get(thread_state, 0) + value_to_add
+
     def _maybe_update_line_no(self, line_no):
         if line_no is None:
             return
@@ -78,6 +128,12 @@ class CallGraphNode:
                 return child
         return None
 
+    def _get_child_matching(self, frame_name, class_name, file_path):
+        for child in self.children:
+            if child.frame_name == frame_name and child.class_name == class_name and child.file_path == file_path:
+                return child
+        return None
+
     def _insert_new_child(self, new_child):
         """
         FIXME: We still need to review the memory vs cpu tradeoffs of using a tuple vs an list vs a dictionary here,
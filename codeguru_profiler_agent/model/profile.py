@@ -30,14 +30,26 @@ class Profile:
         self._clock = clock
         self._end = None
         self.cpu_time_seconds = None
+        self._merged_cpu_time_seconds = 0
+        # whether the samples carried the cpu time of each thread, see Sampler
+        self.has_cpu_time = False
+        # whether the samples carried the state of each thread, see ThreadStateClassifier
+        self.has_thread_states = False
         self.total_attempted_sample_threads_count = 0
         self.total_seen_threads_count = 0
+        # asyncio tasks and greenlets are kept out of the thread counts above, which are reported to the service
+        self.total_attempted_sample_tasks_count = 0
+        self.total_seen_tasks_count = 0
         self.total_sample_count = 0
         self.sampling_interval_ms = int(sampling_interval_seconds * 1000)
         self.host_weight = int(host_weight)
         self._start_process_time = time.process_time()  # provides process time in fractional seconds as float.
         self.overhead_ms = 0
         self.agent_debug_info = agent_debug_info
+        self._sealed_debug_info = None
+        # sub-profiles the stacks are added to when time slicing is enabled, see start_time_slice; oldest first
+        self.time_slices = []
+        self._current_time_slice = None
 
     @property
     def end(self):
@@ -51,7 +63,7 @@ class Profile:
                 "Profile end value must be greater than {}, got {}".format(self.start, value))
         self._end = value
         # this is the total cpu time spent in this application since start, not just the overhead
-        self.cpu_time_seconds = time.process_time() - self._start_process_time
+        self.cpu_time_seconds = time.process_time() - self._start_process_time + self._merged_cpu_time_seconds
 
     def get_active_millis_since_start(self):
         """
@@ -101,13 +113,124 @@ class Profile:
             sample.attempted_sample_threads_count
         self.total_seen_threads_count += \
             sample.seen_threads_count
+        self.total_attempted_sample_tasks_count += sample.attempted_sample_tasks_count
+        self.total_seen_tasks_count += sample.seen_tasks_count
         self.total_sample_count += 1
 
-        for stack in sample.stacks:
-            self._insert_stack(stack)
+        if self._current_time_slice is not None:
+            self._current_time_slice.add(sample)
+            self.has_cpu_time = self.has_cpu_time or sample.cpu_times is not None
+            self.has_thread_states = self.has_thread_states or sample.thread_states is not None
+        elif sample.cpu_times is None and sample.thread_states is None:
+            for stack in sample.stacks:
+                self._insert_stack(stack)
+        else:
+            self.has_cpu_time = self.has_cpu_time or sample.cpu_times is not None
+            self.has_thread_states = self.has_thread_states or sample.thread_states is not None
+            for i, stack in enumerate(sample.stacks):
+                self._insert_stack(stack,
+                                   cpu_time_seconds=sample.cpu_times[i] if sample.cpu_times is not None else 0,
+                                   thread_state=sample.thread_states[i] if sample.thread_states is not None else None)
+            if sample.cpu_only_stacks:
+                for stack, cpu_time_seconds in sample.cpu_only_stacks:
+                    self._insert_stack(stack, runnable_count_increase=0, cpu_time_seconds=cpu_time_seconds)
 
         self.end = current_milli_time(clock=self._clock)
 
+    def merge(self, other, call_graph_only=False):
+        """
+        Merges another profile into this one, e.g. to combine profiles collected by several threads, processes or
+        over consecutive time slices. The other profile is left untouched.
+
+        Call graphs are unioned: nodes representing the same frame get their runnable counts summed and their line
+        ranges unioned. Sample and thread counters, cpu time and overhead are summed. The time range becomes the
+        union of both ranges; if the two profiles do not overlap in time (e.g. time slices) the gap between them and
+        the paused time of the other profile are counted as paused so the active duration is the sum of both.
+
+        The graphs are walked iteratively so that deep stacks do not hit the recursion limit, and new nodes are
+        accounted in the memory counter of this profile as they get created.
+
+        :param other: the profile to merge into this one
+        :param call_graph_only: if True, only the call graph is merged, e.g. for the time slices of this profile whose
+            counters and time range are already part of it
+        """
+        self._merge_call_graph(other)
+        if call_graph_only:
+            return
+
+        self.total_attempted_sample_threads_count += other.total_attempted_sample_threads_count
+        self.total_seen_threads_count += other.total_seen_threads_count
+        self.total_attempted_sample_tasks_count += other.total_attempted_sample_tasks_count
+        self.total_seen_tasks_count += other.total_seen_tasks_count
+        self.total_sample_count += other.total_sample_count
+        self.overhead_ms += other.overhead_ms
+        self.has_cpu_time = self.has_cpu_time or other.has_cpu_time
+        self.has_thread_states = self.has_thread_states or other.has_thread_states
+        if other.cpu_time_seconds is not None:
+            self._merged_cpu_time_seconds += other.cpu_time_seconds
+            self.cpu_time_seconds = (self.cpu_time_seconds or 0) + other.cpu_time_seconds
+        self._merge_time_range(other)
+
+    def _merge_call_graph(self, other):
+        to_merge = [(self.callgraph, other.callgraph)]
+        while to_merge:
+            node, other_node = to_merge.pop()
+            for other_child in other_node.children:
+                to_merge.append((node.merge_and_get_child(other_child), other_child))
+        self.callgraph.merge_counts(other.callgraph)
+
+    def start_time_slice(self, time_slice, max_time_slices):
+        """
+        Starts adding the stacks of the next samples to time_slice, an empty profile starting now, instead of to the
+        call graph of this profile; the counters and time range of this profile are still updated by add().
+        The previous time slice is sealed. When there are more than max_time_slices, the oldest ones are merged into
+        the call graph of this profile and dropped, so memory stays bounded.
+        """
+        if self._current_time_slice is not None:
+            self._current_time_slice.seal()
+        self.time_slices.append(time_slice)
+        self._current_time_slice = time_slice
+        while len(self.time_slices) > max_time_slices:
+            self.merge(self.time_slices.pop(0), call_graph_only=True)
+
+    @property
+    def current_time_slice(self):
+        return self._current_time_slice
+
+    def _merge_time_slices(self):
+        """
+        Merges the call graphs of the time slices into the call graph of this profile so it holds the whole profile.
+        The time slices are kept so reporters can write them separately.
+        """
+        if self._current_time_slice is None:
+            return
+        self._current_time_slice.seal()
+        self._current_time_slice = None
+        for time_slice in self.time_slices:
+            self.merge(time_slice, call_graph_only=True)
+
+    def _merge_time_range(self, other):
+        end = self._active_end()
+        other_end = other._active_end()
+        if other_end <= self.start:
+            self._paused_ms += other._paused_ms + (self.start - other_end)
+        elif other.start >= end:
+            self._paused_ms += other._paused_ms + (other.start - end)
+            # the active time now ends where the later profile ends
+            self.last_pause = other.last_pause
+            self.last_resume = other.last_resume
+        self.start = min(self.start, other.start)
+        if other.end is not None and (self._end is None or other.end > self._end):
+            self._end = other.end
+
+    def _active_end(self):
+        """
+        The end of the active time of a paused profile is when it was paused; otherwise it is its last sample.
+        """
+        if self.last_pause is not None:
+            return self.last_pause
+        return self._end if self._end is not None else self.start
+
     def set_overhead_ms(self, duration_timedelta):
         """
         The overhead is the total cpu time spent profiling since start. It is measured by a Timer object and only passed
@@ -116,7 +239,7 @@ class Profile:
         """
         self.overhead_ms = duration_timedelta.total_seconds() * 1000
 
-    def _insert_stack(self, stack, runnable_count_increase=1):
+    def _insert_stack(self, stack, runnable_count_increase=1, cpu_time_seconds=0, thread_state=None):
         current_node = self.callgraph
 
         # navigate to the end of the stack in the graph, adding nodes when necessary
@@ -125,11 +248,76 @@ class Profile:
 
         # only increment the end of the stack as we use self time in the graph
         current_node.increase_runnable_count(runnable_count_increase)
+        if cpu_time_seconds:
+            current_node.increase_cpu_time(cpu_time_seconds)
+        if thread_state is not None:
+            current_node.increase_thread_state_count(thread_state, runnable_count_increase)
+
+    def restart_at(self, start):
+        """
+        Moves the start of a profile that was built ahead of time to the moment it actually starts being used.
+        This is only expected to be called on an empty profile.
+        """
+        self._validate_positive_number(start)
+        self.start = start
+        self.last_resume = start
+        self._start_process_time = time.process_time()
+
+    def seal(self):
+        """
+        Freezes the active duration, the cpu time and the debug info of this profile so it can be encoded later,
+        possibly by another thread, while the agent keeps profiling into a new profile. The end time is left to the
+        time of the last sample. Time slices are merged into the call graph.
+        """
+        self._merge_time_slices()
+        self.pause()
+        if self._end is not None:
+            self.cpu_time_seconds = time.process_time() - self._start_process_time + self._merged_cpu_time_seconds
+        self._sealed_debug_info = self.agent_debug_info.serialize_to_json()
+
+    def snapshot(self):
+        """
+        Copies this profile while samples are still being added to it, so the copy can be encoded by another thread.
+        This is expected to be called from the thread adding the samples; the copy is sealed and holds the samples of
+        the time slices in its call graph.
+        """
+        snapshot = Profile(profiling_group_name=self.profiling_group_name,
+                           sampling_interval_seconds=self.sampling_interval_ms / 1000, host_weight=self.host_weight,
+                           start=self.start, agent_debug_info=self.agent_debug_info, clock=self._clock)
+        snapshot._merge_call_graph(self)
+        if self._current_time_slice is not None:
+            for time_slice in self.time_slices:
+                snapshot._merge_call_graph(time_slice)
+        snapshot.total_attempted_sample_threads_count = self.total_attempted_sample_threads_count
+        snapshot.total_seen_threads_count = self.total_seen_threads_count
+        snapshot.total_attempted_sample_tasks_count = self.total_attempted_sample_tasks_count
+        snapshot.total_seen_tasks_count = self.total_seen_tasks_count
+        snapshot.total_sample_count = self.total_sample_count
+        snapshot.overhead_ms = self.overhead_ms
+        snapshot.has_cpu_time = self.has_cpu_time
+        snapshot.has_thread_states = self.has_thread_states
+        snapshot.last_resume = self.last_resume
+        snapshot.last_pause = self.last_pause
+        snapshot._paused_ms = self._paused_ms
+        snapshot._end = self._end
+        snapshot.cpu_time_seconds = self.cpu_time_seconds
+        snapshot._start_process_time = self._start_process_time
+        snapshot._merged_cpu_time_seconds = self._merged_cpu_time_seconds
+        snapshot.seal()
+        return snapshot
+
+    def is_sealed(self):
+        return self._sealed_debug_info is not None
 
     def get_memory_usage_bytes(self):
-        return self.memory_counter.get_memory_usage_bytes()
+        if self._current_time_slice is None:
+            return self.memory_counter.get_memory_usage_bytes()
+        return self.memory_counter.get_memory_usage_bytes() + \
+            sum(time_slice.get_memory_usage_bytes() for time_slice in self.time_slices)
 
     def serialize_agent_debug_info_to_json(self):
+        if self._sealed_debug_info is not None:
+            return self._sealed_debug_info
         return self.agent_debug_info.serialize_to_json()
 
     def pause(self):
@@ -138,6 +326,8 @@ class Profile:
             return
         self.last_pause = current_milli_time(clock=self._clock)
         self.last_resume = None
+        if self._current_time_slice is not None:
+            self._current_time_slice.pause()
 
     def resume(self):
         if self.last_resume is not None:
@@ -147,6 +337,11 @@ class Profile:
         prev_last_pause = self.last_pause
         self.last_pause = None
         self._paused_ms += self.last_resume - prev_last_pause
+        if self._current_time_slice is not None:
+            self._current_time_slice.resume()
+
+    def is_paused(self):
+        return self.last_pause is not None
 
     def is_empty(self):
         return self.total_seen_threads_count == 0.0
@@ -1,14 +1,26 @@
 class Sample:
-    __slots__ = ["stacks", "attempted_sample_threads_count", "seen_threads_count"]
+    __slots__ = ["stacks", "attempted_sample_threads_count", "seen_threads_count", "cpu_times", "thread_states",
+                 "attempted_sample_tasks_count", "seen_tasks_count", "cpu_only_stacks"]
 
-    def __init__(self, stacks, attempted_sample_threads_count=0, seen_threads_count=0):
+    def __init__(self, stacks, attempted_sample_threads_count=0, seen_threads_count=0, cpu_times=None,
+                 thread_states=None, attempted_sample_tasks_count=0, seen_tasks_count=0, cpu_only_stacks=None):
         """
         :param stacks: list of lists; each list is a list of Frame object representing a thread stack in bottom (of thread stack) to top (of thread stack) order
         :param start_time: current time (in ms) just before we started taking the sample
         :param end_time: current time (in ms) just after we started taking the sample
         :param attempted_sample_threads_count: how many threads we tried to sample (can be > than len(stacks) if we could not get/excluded some threads)
         :param seen_threads_count: total number of threads observed in the system when we took the sample
+        :param cpu_times: list of cpu times in seconds each thread spent since its previous sample, in the same order as stacks; or None if cpu time is not sampled
+        :param thread_states: list of thread states (see thread_state_classifier) in the same order as stacks; or None if thread states are not classified
+        :param attempted_sample_tasks_count: how many asyncio tasks and suspended greenlets we tried to sample; they are not counted as threads
+        :param seen_tasks_count: total number of pending asyncio tasks and suspended greenlets observed when we took the sample
+        :param cpu_only_stacks: list of (stack, cpu time in seconds) only adding cpu time to the profile, not wall clock samples; only set along with cpu_times
         """
         self.stacks = stacks
         self.attempted_sample_threads_count = attempted_sample_threads_count
         self.seen_threads_count = seen_threads_count
+        self.cpu_times = cpu_times
+        self.thread_states = thread_states
+        self.attempted_sample_tasks_count = attempted_sample_tasks_count
+        self.seen_tasks_count = seen_tasks_count
+        self.cpu_only_stacks = cpu_only_stacks
@@ -0,0 +1,246 @@
+import io
+import json
+import logging
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from queue import Queue, Full, Empty
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo, REPORTED_PERCENTILES
+from codeguru_profiler_agent.file_reporter.file_reporter import FILE_FORMATS
+from codeguru_profiler_agent.model.profile import Profile
+from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+from codeguru_profiler_agent.utils.log_exception import log_exception
+from codeguru_profiler_agent.utils.time import current_milli_time
+
+logger = logging.getLogger(__name__)
+
+# only processes of the same host can pull profiles, as they may reveal the code and the activity of the application
+LOCALHOST = "127.0.0.1"
+DEFAULT_PROFILE_SERVER_PORT = 8989
+# the profiler thread answers the requests when it samples, so they wait at most a sampling interval when it is running
+SAMPLE_TIMEOUT_SECONDS = 10
+MAX_CAPTURE_SECONDS = 600
+# bounds the cost of the captures on the profiler thread, which adds each sample to every capture in progress
+MAX_CAPTURES = 4
+MAX_PENDING_REQUESTS = 16
+CONTENT_TYPES = {
+    "json": "application/json",
+    "folded": "text/plain; charset=utf-8",
+    "speedscope": "application/json",
+    "pprof": "application/octet-stream"
+}
+
+
+class ProfileServer:
+    """
+    Serves the profile being collected over HTTP on localhost, so it can be pulled on demand without waiting for the
+    next report, e.g. curl "http://localhost:8989/profile?format=folded&seconds=30". The endpoints are:
+        - /profile: the profile collected since the last report; with seconds=N, a profile of the next N seconds
+          instead. format is "json" (the CodeGuru Profiler format, default), "folded", "speedscope" or "pprof".
+        - /metrics: the timer metrics of the profiler since the last report, in JSON.
+
+    Like the AggregationServer, the server threads never touch the profile being sampled: requests are queued and
+    answered by the ProfilerRunner from the profiler thread after it adds a sample, which only copies the call graph
+    or adds the sample to the profiles being captured; encoding happens on the server threads.
+    """
+
+    def __init__(self, environment=dict()):
+        """
+        :param environment: dependency container dictionary for the current profiler
+        :param profiling_group_name: (required inside environment) name of the profiling group
+        :param host_weight: (required inside environment) scale factor of the profiles, see LocalAggregator
+        :param profile_server_port: (inside environment) port to listen on, 0 picks a free one (default: 8989)
+        :param timer: (inside environment) timer of the profiler, served as metrics
+        :param clock: (inside environment) clock to be used; default is time.time
+        """
+        self._environment = environment
+        self._profiling_group_name = environment["profiling_group_name"]
+        self._host_weight = environment["host_weight"]
+        port = environment.get("profile_server_port")
+        self._port = port if port is not None else DEFAULT_PROFILE_SERVER_PORT
+        self._timer = environment.get("timer")
+        self._clock = environment.get("clock") or time.time
+        self._pending_requests = Queue(maxsize=MAX_PENDING_REQUESTS)
+        self._capture_slots = threading.BoundedSemaphore(MAX_CAPTURES)
+        # only accessed from the profiler thread
+        self._captures = []
+        self._http_server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._http_server.server_address[1] if self._http_server is not None else self._port
+
+    def start(self):
+        if self.is_running():
+            logger.info("Ignored ProfileServer.start() as it is already running!")
+            return
+        try:
+            self._http_server = _ThreadingHTTPServer((LOCALHOST, self._port), _RequestHandler)
+        except OSError as e:
+            # e.g. several processes of the host are profiled and another one already listens on the port
+            logger.info("Unable to start the profile server on port {}: {}".format(self._port, str(e)))
+            return
+        self._http_server.profile_server = self
+        self._thread = threading.Thread(target=self._http_server.serve_forever, name="codeguru-profiler-profile-server",
+                                        daemon=True)
+        self._thread.start()
+        logger.info("Profile server listening on http://{}:{}".format(LOCALHOST, self.port))
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        if self._http_server is None:
+            return
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._http_server = None
+        self._thread = None
+
+    def process_pending_requests(self, profile, sample):
+        """
+        Answers the requests received since the last sample. This is expected to be called from the profiler thread
+        right after the sample was added to the profile.
+
+        The requests received since the last sample all get the same snapshot, which is only read by the encoders, so
+        the call graph is copied at most once per sample however many requests are pending.
+        """
+        snapshot = None
+        while True:
+            try:
+                request = self._pending_requests.get_nowait()
+            except Empty:
+                break
+            if request.end_ms is None:
+                if snapshot is None:
+                    snapshot = profile.snapshot()
+                request.complete(snapshot)
+            else:
+                self._captures.append(request)
+        if not self._captures:
+            return
+        now = current_milli_time(clock=self._clock)
+        for capture in list(self._captures):
+            if now >= capture.end_ms:
+                self._captures.remove(capture)
+                capture.profile.seal()
+                capture.complete(capture.profile)
+            else:
+                capture.profile.add(sample)
+
+    def _serve_profile(self, handler, query):
+        file_format = query.get("format", ["json"])[0]
+        if file_format not in FILE_FORMATS:
+            handler.send_error(400, "Unknown format, expected one of: " + ", ".join(FILE_FORMATS))
+            return
+        seconds = query.get("seconds", [None])[0]
+        if seconds is None:
+            profile = self._request_profile(_ProfileRequest(), SAMPLE_TIMEOUT_SECONDS)
+        else:
+            try:
+                seconds = float(seconds)
+            except ValueError:
+                seconds = 0
+            if not 0 < seconds <= MAX_CAPTURE_SECONDS:
+                handler.send_error(400, "seconds must be between 0 and {}".format(MAX_CAPTURE_SECONDS))
+                return
+            if not self._capture_slots.acquire(blocking=False):
+                handler.send_error(429, "Too many profiles are being captured")
+                return
+            try:
+                profile = self._request_profile(self._capture_request(seconds), seconds + SAMPLE_TIMEOUT_SECONDS)
+            finally:
+                self._capture_slots.release()
+        if profile is None:
+            handler.send_error(503, "The profiler is not sampling")
+            return
+        if profile.is_empty():
+            handler.send_response(204)
+            handler.end_headers()
+            return
+        output_stream = io.BytesIO()
+        create_encoder, _ = FILE_FORMATS[file_format]
+        create_encoder(self._environment).encode(profile=profile, output_stream=output_stream)
+        _send_body(handler, CONTENT_TYPES[file_format], output_stream.getvalue())
+
+    def _capture_request(self, seconds):
+        now = current_milli_time(clock=self._clock)
+        profile = Profile(profiling_group_name=self._profiling_group_name,
+                          sampling_interval_seconds=AgentConfiguration.get().sampling_interval.total_seconds(),
+                          host_weight=self._host_weight, start=now, agent_debug_info=AgentDebugInfo(),
+                          clock=self._clock)
+        return _ProfileRequest(profile=profile, end_ms=now + int(seconds * 1000))
+
+    def _request_profile(self, request, timeout_seconds):
+        try:
+            self._pending_requests.put_nowait(request)
+        except Full:
+            return None
+        return request.wait(timeout_seconds)
+
+    def _serve_metrics(self, handler):
+        # the timer replaces its metrics on reset so we get either the old or the new ones
+        metrics = dict(self._timer.metrics) if self._timer is not None else {}
+        body = json.dumps({name: _metric_to_dict(metric) for name, metric in metrics.items()})
+        _send_body(handler, "application/json", body.encode("utf-8"))
+
+
+class _ProfileRequest:
+    def __init__(self, profile=None, end_ms=None):
+        """
+        :param profile: the profile the samples are captured into until end_ms; None to get a snapshot of the profile
+        :param end_ms: the end of the capture in milliseconds since epoch; None to get a snapshot of the profile
+        """
+        self.profile = profile
+        self.end_ms = end_ms
+        self._done = threading.Event()
+
+    def complete(self, profile):
+        self.profile = profile
+        self._done.set()
+
+    def wait(self, timeout_seconds):
+        return self.profile if self._done.wait(timeout_seconds) else None
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            if url.path == "/profile":
+                self.server.profile_server._serve_profile(self, parse_qs(url.query))
+            elif url.path == "/metrics":
+                self.server.profile_server._serve_metrics(self)
+            else:
+                self.send_error(404)
+        except Exception as e:
+            log_exception(logger, "Failed to serve {}: {}".format(self.path, str(e)))
+            self.send_error(500)
+
+    def log_message(self, format, *args):
+        # the default implementation writes to stderr
+        logger.debug(format, *args)
+
+
+def _metric_to_dict(metric):
+    metric_dict = {"counter": metric.counter, "total": metric.total, "max": metric.max, "average": metric.average()}
+    for percentile_name, percentile in REPORTED_PERCENTILES:
+        metric_dict[percentile_name] = metric.percentile(percentile)
+    return metric_dict
+
+
+def _send_body(handler, content_type, body):
+    handler.send_response(200)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
@@ -1,4 +1,5 @@
 import logging
+import os
 import re
 import datetime
 import uuid
@@ -14,10 +15,13 @@ from codeguru_profiler_agent.profiler_disabler import ProfilerDisabler
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration, AgentConfigurationMerger
 
 from codeguru_profiler_agent.metrics.timer import Timer
-from codeguru_profiler_agent.profiler_runner import ProfilerRunner
+from codeguru_profiler_agent.profiler_runner import ProfilerRunner, BATCHED_TIMER_METRIC_NAMES, \
+    DEFAULT_MAX_SAMPLES_PER_INVOCATION
 from codeguru_profiler_agent.file_reporter.file_reporter import FileReporter
 from codeguru_profiler_agent.local_aggregator import LocalAggregator
 from codeguru_profiler_agent.sdk_reporter.sdk_reporter import SdkReporter
+from codeguru_profiler_agent.socket_reporter.socket_reporter import SocketReporter
+from codeguru_profiler_agent.socket_reporter.aggregation_server import AggregationServer
 from codeguru_profiler_agent.codeguru_client_builder import CodeGuruClientBuilder
 
 INITIAL_MINIMUM_REPORTING_INTERVAL = timedelta(seconds=30)
@@ -35,6 +39,12 @@ DEFAULT_MEMORY_LIMIT_BYTES = 10 * 1024 * 1024
 # This file can be used by the customer as kill switch for the Profiler.
 # TODO FIXME Consider making this work for Windows.
 KILLSWITCH_FILEPATH = "/var/tmp/killProfiler" #nosec
+# Skip issue reported by Bandit, see above.
+# Worker processes and the aggregating process of a host only need to agree on this path; the directory is per user
+# so that other users of the host can not replace the socket, see AggregationServer.
+DEFAULT_AGGREGATION_SOCKET_PATH_FORMAT = "/tmp/codeguru-profiler-{user}/{profiling_group_name}.sock" #nosec
+# same as profile_server.DEFAULT_PROFILE_SERVER_PORT, which is not imported unless the profile server is enabled
+DEFAULT_PROFILE_SERVER_PORT = 8989
 
 logger = logging.getLogger(__name__)
 
@@ -76,10 +86,21 @@ class Profiler:
                 this api (default: dict()). Possible keys:
                     - reporting_interval: delay between profile reports in datetime.timedelta (default: None)
                     - sampling_interval: delay between each sample in datetime.timedelta (default: 1 seconds)
-                    - reporting_mode: Reporting mode to be used, two modes are supported: "codeguru_service" and "file".
-                                      "file" mode is only used for testing at the moment. (default: "codeguru_service")
+                    - reporting_mode: Reporting mode to be used, three modes are supported: "codeguru_service",
+                                      "file" and "socket". "file" mode is only used for testing at the moment.
+                                      "socket" mode sends the profiles to an aggregation server running in another
+                                      process of the same host (default: "codeguru_service")
                     - file_prefix: path + file prefix to use for profile reports when in "file" reporting mode
                                    (default: './profile-{profiling_group_name}' only used when reporting mode is "file")
+                    - file_format: format of the profile reports when in "file" reporting mode: "json" (the CodeGuru
+                                   Profiler format), "folded" (folded stacks for flame graph tools), "speedscope" or
+                                   "pprof" (default: "json")
+                    - file_compression: "gzip", "bz2" or "xz" to compress the profile reports when in "file" reporting
+                                        mode (default: None)
+                    - max_file_count: max number of profile reports to keep when in "file" reporting mode, the
+                                      oldest ones are deleted (default: None, no limit)
+                    - max_total_file_bytes: max total size of the profile reports to keep when in "file" reporting
+                                            mode, the oldest ones are deleted (default: None, no limit)
                     - cpu_limit_percentage: cpu limit (%) for profiler (default: 30)
                     - max_threads: the max number of threads getting sampled (default: 100)
                     - killswitch_filepath: file path pointing to the killswitch file (default: "/var/tmp/killProfiler")
@@ -87,6 +108,52 @@ class Profiler:
                                    representative of the whole fleet (default: 1)
                     - endpoint_url: url used for submitting profile (default: None, will target codeguru prod APIs)
                     - excluded_threads: set of thread names to be excluded from sampling (default: set())
+                    - sample_cpu_time: if True, the cpu time spent by each sampled thread is reported as CPU_TIME
+                                       counts alongside WALL_TIME; only supported on Linux (default: False)
+                    - classify_thread_states: if True, samples are also counted as RUNNABLE, BLOCKED (waiting for I/O
+                                              or a lock) or IDLE (waiting for work) (default: False)
+                    - drop_idle_stacks: if True, stacks of idle threads are not aggregated (default: False)
+                    - sample_asyncio_tasks: if True, the coroutine stacks of pending asyncio tasks are also sampled,
+                                            each under a <task> or <task:NAME> frame; event loops implemented in C,
+                                            e.g. uvloop, are only found when run through asyncio.run
+                                            (default: False)
+                    - max_asyncio_tasks: the max number of asyncio tasks getting sampled (default: 100)
+                    - sample_greenlets: if True, the suspended greenlets (e.g. gevent) of the thread creating the
+                                        profiler are also sampled, up to max_threads of them; requires the greenlet
+                                        package (default: False)
+                    - signal_sampling: if True, the main thread is sampled from a SIGPROF interval timer handler, which
+                                       samples code holding the GIL in long C calls more accurately; the profiler must
+                                       be started from the main thread (default: False)
+                    - group_by_thread_name: if True, a <thread-group:NAME> frame is inserted under the root of each
+                                            thread stack, NAME being the thread name without numeric suffixes, e.g.
+                                            ThreadPoolExecutor-0_12 is in the ThreadPoolExecutor group (default: False)
+                    - group_by_lambda_phase: if True, stacks sampled in AWS lambda are partitioned by the phase of the
+                                             sandbox under a <cold-invoke> (first invocation) or <warm-invoke>
+                                             frame (default: False)
+                    - time_slice_duration: if set, the profile is also kept as consecutive sub-profiles of this
+                                           datetime.timedelta duration, which "file" reporting mode writes separately
+                                           (default: None)
+                    - max_time_slices: the max number of time slices kept per profile, older ones are merged into the
+                                       profile (default: 10)
+                    - timer_mode: "detailed" times each phase of sampling, aggregating and reporting, which is
+                                  reported in the agent debug info; "batched" only times each profiling tick once, as
+                                  needed for the cpu limit checks, and calls the other phases without timing wrappers
+                                  (default: "detailed")
+                    - invocation_sampling_interval: if set, the delay between samples while an AWS lambda function is
+                                                    invoked, in datetime.timedelta, e.g. 10 milliseconds so that short
+                                                    invocations get sampled; it is stretched for long invocations, see
+                                                    max_samples_per_invocation (default: None)
+                    - max_samples_per_invocation: the max number of samples taken at the invocation sampling interval
+                                                  for an invocation as long as the previous one (default: 100)
+                    - aggregation_socket_path: path of the Unix domain socket used to send profiles to an aggregation
+                                               server, in a directory only the current user can write to
+                                               (default: '/tmp/codeguru-profiler-{uid}/{profiling_group_name}.sock')
+                    - run_aggregation_server: if True, this profiler also listens on aggregation_socket_path and merges
+                                              the profiles sent by processes in "socket" reporting mode into its own
+                                              before reporting them (default: False)
+                    - run_profile_server: if True, the profile being collected and the timer metrics can be pulled
+                                          over HTTP from localhost at any time, see ProfileServer (default: False)
+                    - profile_server_port: port the profile server listens on (default: 8989)
         """
         self._profiler_runner_instance = None
         self.environment = {}
@@ -142,12 +209,34 @@ class Profiler:
     def _set_default_environment(profiling_group_name):
         return {
             'timer': Timer(),
+            'timer_mode': 'detailed',
             'profiler_thread_name': 'codeguru-profiler-agent-' + str(uuid.uuid4()).replace('-', ''),
             'reporting_mode': 'codeguru_service',
             'file_prefix': 'profile-{}'.format(re.sub(r"\W", "", profiling_group_name)),
+            'file_format': 'json',
+            'file_compression': None,
+            'max_file_count': None,
+            'max_total_file_bytes': None,
+            'aggregation_socket_path': DEFAULT_AGGREGATION_SOCKET_PATH_FORMAT.format(
+                user=os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", ""),
+                profiling_group_name=re.sub(r"\W", "", profiling_group_name)),
+            'run_aggregation_server': False,
+            'run_profile_server': False,
+            'profile_server_port': DEFAULT_PROFILE_SERVER_PORT,
             'excluded_threads': set(),
+            'sample_cpu_time': False,
+            'classify_thread_states': False,
+            'drop_idle_stacks': False,
+            'sample_asyncio_tasks': False,
+            'max_asyncio_tasks': 100,
+            'sample_greenlets': False,
+            'signal_sampling': False,
+            'group_by_thread_name': False,
+            'group_by_lambda_phase': False,
             'should_profile': True,
             'sampling_interval': DEFAULT_SAMPLING_INTERVAL,
+            'invocation_sampling_interval': None,
+            'max_samples_per_invocation': DEFAULT_MAX_SAMPLES_PER_INVOCATION,
             'reporting_interval': DEFAULT_REPORTING_INTERVAL,
             'minimum_time_reporting': INITIAL_MINIMUM_REPORTING_INTERVAL,
             'max_stack_depth': DEFAULT_MAX_STACK_DEPTH,
@@ -161,15 +250,29 @@ class Profiler:
     def _setup_final_environment(self, environment, environment_override):
         environment.update(environment_override)
 
+        if environment['timer_mode'] == 'batched' and 'timer' not in environment_override:
+            environment['timer'] = Timer(metric_names=BATCHED_TIMER_METRIC_NAMES)
+
         # set additional parameters if needed (costly default init or depend on other parameters)
         if environment.get('initial_sampling_interval') is None:
+            # the jitter spreads the samples of hosts started together, a lambda function is sampled from its first
+            # invocation on instead
+            first_sampling_interval = environment['invocation_sampling_interval'] or \
+                AgentConfiguration.get().sampling_interval
             environment['initial_sampling_interval'] = datetime.timedelta(
-                seconds=SystemRandom().uniform(0, AgentConfiguration.get().sampling_interval.total_seconds()))
+                seconds=SystemRandom().uniform(0, first_sampling_interval.total_seconds()))
         environment['excluded_threads'] = \
             frozenset({environment['profiler_thread_name']}.union(environment['excluded_threads']))
         # TODO delay metadata lookup until we need it
         environment['agent_metadata'] = environment.get('agent_metadata') or AgentMetadata()
         environment['errors_metadata'] = environment.get('errors_metadata') or ErrorsMetadata()
+        if environment['run_aggregation_server']:
+            environment['aggregation_server'] = \
+                environment.get('aggregation_server') or AggregationServer(environment)
+        if environment['run_profile_server'] and environment.get('profile_server') is None:
+            # imported here as http.server takes a while to import and the profile server is rarely enabled
+            from codeguru_profiler_agent.profile_server import ProfileServer
+            environment['profile_server'] = ProfileServer(environment)
         environment['collector'] = environment.get('collector') or self._select_collector(environment)
         environment["profiler_disabler"] = environment.get('profiler_disabler') or ProfilerDisabler(environment)
         return UnmodifiableDict(environment)
@@ -186,6 +289,10 @@ class Profiler:
             return LocalAggregator(
                 reporter=FileReporter(environment=environment),
                 environment=environment)
+        elif reporting_mode == "socket":
+            return LocalAggregator(
+                reporter=SocketReporter(environment=environment),
+                environment=environment)
         else:
             raise ValueError("Invalid reporting mode for CodeGuru Profiler detected: {}".format(reporting_mode))
 
@@ -255,6 +362,20 @@ class Profiler:
             logger.info("Caught exception while trying to stop the CodeGuru Profiler Agent", exc_info=True)
             return False
 
+    def report_if_due(self):
+        """
+        Reports the profile right away, from the calling thread, if the reporting interval is reached. The profiler
+        otherwise only reports from its own thread when it samples; this is for applications that may get frozen or
+        terminated between two samples, e.g. at the end of a lambda invocation.
+
+        :return: True if the profile was reported; False otherwise.
+        """
+        try:
+            return self._profiler_runner.report_if_due()
+        except:
+            logger.info("Caught exception while trying to report the profile", exc_info=True)
+            return False
+
     def pause(self, block=False):
         """
         Pauses all profiler activity until start() is called again.
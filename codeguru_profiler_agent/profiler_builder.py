@@ -1,7 +1,6 @@
 import os
 import logging
 import datetime
-import boto3
 
 from codeguru_profiler_agent.utils.log_exception import log_exception
 
@@ -23,6 +22,8 @@ AWS_LAMBDA_FUNCTION_NAME_ENV_VAR_KEY = "AWS_LAMBDA_FUNCTION_NAME"
 # non documented parameters
 SAMPLING_INTERVAL = "AWS_CODEGURU_PROFILER_SAMPLING_INTERVAL_MS"
 REPORTING_INTERVAL = "AWS_CODEGURU_PROFILER_REPORTING_INTERVAL_MS"
+INVOCATION_SAMPLING_INTERVAL = "AWS_CODEGURU_PROFILER_INVOCATION_SAMPLING_INTERVAL_MS"
+PROFILE_SERVER_PORT = "AWS_CODEGURU_PROFILER_PROFILE_SERVER_PORT"
 
 
 def _read_millis(override, env_name, override_key, env=os.environ):
@@ -34,10 +35,22 @@ def _read_millis(override, env_name, override_key, env=os.environ):
             logger.info("Unable to convert value to a time range for environment variable " + env_name)
 
 
+def _read_profile_server_port(override, env=os.environ):
+    value = env.get(PROFILE_SERVER_PORT)
+    if value:
+        try:
+            override["profile_server_port"] = int(value)
+            override["run_profile_server"] = True
+        except Exception:
+            logger.info("Unable to convert value to a port for environment variable " + PROFILE_SERVER_PORT)
+
+
 def _read_override(env=os.environ):
     override = dict()
     _read_millis(override, SAMPLING_INTERVAL, "sampling_interval", env)
     _read_millis(override, REPORTING_INTERVAL, "reporting_interval", env)
+    _read_millis(override, INVOCATION_SAMPLING_INTERVAL, "invocation_sampling_interval", env)
+    _read_profile_server_port(override, env)
     return override
 
 
@@ -114,7 +127,7 @@ def _check_credential_through_environment(env=os.environ):
 
 
 def build_profiler(pg_name=None, region_name=None, credential_profile=None,
-                   env=os.environ, session_factory=boto3.session.Session, profiler_factory=None, override=None,
+                   env=os.environ, session_factory=None, profiler_factory=None, override=None,
                    should_autocreate_profiling_group=False):
     """
     Creates a Profiler object from given parameters or environment variables
@@ -131,6 +144,10 @@ def build_profiler(pg_name=None, region_name=None, credential_profile=None,
         # We importing Profiler here rather than at the head is to avoid having import loop
         from codeguru_profiler_agent.profiler import Profiler
         profiler_factory = Profiler
+    if session_factory is None:
+        # boto3 takes a while to import, it is only imported when a profiler is built, not during lambda cold starts
+        import boto3
+        session_factory = boto3.session.Session
     try:
         if not _is_enabled(env):
             logger.info("CodeGuru Profiler is not started as it has been explicitly disabled. Set environment " +
@@ -1,12 +1,20 @@
 import logging
+import threading
 
-from codeguru_profiler_agent.metrics.with_timer import with_timer
+from time import process_time
+
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext
+from codeguru_profiler_agent.metrics.with_timer import with_timer, bind_untimed_methods
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
 from codeguru_profiler_agent.sampler import Sampler
 from codeguru_profiler_agent.utils.scheduler import Scheduler
 
 logger = logging.getLogger(__name__)
 
+# the only metrics needed by the ProfilerDisabler cpu usage checks and the overhead reported in the profile
+BATCHED_TIMER_METRIC_NAMES = ("runProfiler", "sampleAndAggregate")
+DEFAULT_MAX_SAMPLES_PER_INVOCATION = 100
+
 
 class ProfilerRunner:
     """
@@ -30,19 +38,41 @@ class ProfilerRunner:
         to sample
         :param profiler_thread_name: (required inside environment) Thread name used for running the
         report_orchestration_scheduler
+        :param aggregation_server: (inside environment) AggregationServer started and stopped with the profiler
+        :param profile_server: (inside environment) ProfileServer started and stopped with the profiler, whose requests
+            are answered after each sample
+        :param timer_mode: (inside environment) "detailed" to time each phase of the profiling command on its own, or
+            "batched" to only time the whole command once per tick (default: "detailed")
+        :param invocation_sampling_interval: (inside environment) shortest delay between samples in datetime.timedelta
+            while a lambda function is invoked, see _sampling_delay (default: None, the sampling interval is used)
+        :param max_samples_per_invocation: (inside environment) number of samples the invocation sampling interval is
+            stretched to for long invocations (default: 100)
         """
         self.timer = environment.get("timer")
+        if environment.get("timer_mode") == "batched":
+            bind_untimed_methods(self, measured_elsewhere=BATCHED_TIMER_METRIC_NAMES)
+            if self.timer is not None:
+                self._run_profiler = self._run_profiler_batched
+        else:
+            bind_untimed_methods(self)
         self.sampler = environment.get("sampler") or Sampler(environment=environment)
+        self.invocation_sampling_interval = environment.get("invocation_sampling_interval")
+        self.max_samples_per_invocation = \
+            environment.get("max_samples_per_invocation") or DEFAULT_MAX_SAMPLES_PER_INVOCATION
 
         self.scheduler = Scheduler(
             command=self._profiling_command,
-            delay_provider=lambda: AgentConfiguration.get().sampling_interval,
+            delay_provider=self._sampling_delay,
             initial_delay=environment["initial_sampling_interval"],
             thread_name=environment["profiler_thread_name"])
         self.collector = environment["collector"]
         self.profiler_disabler = environment["profiler_disabler"]
+        self.aggregation_server = environment.get("aggregation_server")
+        self.profile_server = environment.get("profile_server")
         self.is_profiling_in_progress = False
         self._first_execution = True
+        # held while the profiling command runs so profiles can also be reported from other threads, see report_if_due
+        self._command_lock = threading.Lock()
 
     def start(self):
         """
@@ -54,6 +84,11 @@ class ProfilerRunner:
         if self.profiler_disabler.should_stop_profiling():
             logger.info("Profiler will not start.")
             return False
+        if self.aggregation_server is not None:
+            self.aggregation_server.start()
+        if self.profile_server is not None:
+            self.profile_server.start()
+        self.sampler.start()
         self.scheduler.start()
         return True
 
@@ -61,19 +96,44 @@ class ProfilerRunner:
         self.collector.refresh_configuration()
         self.is_profiling_in_progress = AgentConfiguration.get().should_profile
         if self.is_profiling_in_progress:
-            self.scheduler.update_delay_provider(lambda: AgentConfiguration.get().sampling_interval)
+            self.scheduler.update_delay_provider(self._sampling_delay)
         else:
             # if we should not profile we can simply wait for the reporting interval and call again at that time.
             self.scheduler.update_delay_provider(lambda: AgentConfiguration.get().reporting_interval)
 
+    def _sampling_delay(self):
+        """
+        In AWS lambda the profiler is paused between invocations, so with the default sampling interval of 1 second
+        short invocations mostly get no sample. When an invocation sampling interval is set, the delay while the
+        function is invoked is shortened to it, stretched so that an invocation as long as the previous one gets at most
+        max_samples_per_invocation samples, which bounds the overhead per invocation. The sampling interval stays the
+        upper bound.
+
+        The sample weights are derived from the sample count and the active time of the profile, which does not include
+        the time the profiler is paused between invocations, so the counts are still normalized to wall clock time.
+        """
+        sampling_interval = AgentConfiguration.get().sampling_interval
+        lambda_context = LambdaContext.get()
+        if self.invocation_sampling_interval is None or lambda_context.context is None:
+            return sampling_interval
+        if lambda_context.last_execution_duration is None:
+            # no invocation returned yet, there is nothing to stretch the interval to
+            return min(sampling_interval, self.invocation_sampling_interval)
+        stretched_interval = lambda_context.last_execution_duration / self.max_samples_per_invocation
+        return min(sampling_interval, max(self.invocation_sampling_interval, stretched_interval))
+
     def _profiling_command(self):
+        with self._command_lock:
+            return self._run_profiling_command()
+
+    def _run_profiling_command(self):
         try:
             if self._first_execution:
                 self.collector.setup()
                 self._first_execution = False
             sample_result = self._run_profiler()
             if sample_result.success and sample_result.is_end_of_cycle:
-                if self.profiler_disabler.should_stop_profiling(profile=self.collector.profile):
+                if self.profiler_disabler.should_stop_profiling(profile=self.collector.sealed_profile):
                     return False
                 self.collector.reset()
                 return True
@@ -95,13 +155,57 @@ class ProfilerRunner:
             if self.collector.flush(reset=False):
                 self.is_profiling_in_progress = False
                 return RunProfilerStatus(success=True, is_end_of_cycle=True)
-            self._sample_and_aggregate()
+            sample = self._sample_and_aggregate()
+            if self.profile_server is not None:
+                self._process_profile_requests(sample)
+            return RunProfilerStatus(success=True, is_end_of_cycle=False, has_sampled=True)
         return RunProfilerStatus(success=True, is_end_of_cycle=False)
 
+    def _run_profiler_batched(self):
+        """
+        Times the profiling command with a single pair of clock reads covering its nested phases. The duration of the
+        ticks that sampled is also recorded as sampleAndAggregate, which slightly overestimates the cost of sampling
+        (it includes the flush and kill switch checks and answering the profile server) so the cpu usage checks err on
+        the safe side.
+        """
+        time_start_seconds = process_time()
+        status = ProfilerRunner._run_profiler.__wrapped__(self)
+        duration_seconds = process_time() - time_start_seconds
+        self.timer.record("runProfiler", duration_seconds)
+        if status.has_sampled:
+            self.timer.record("sampleAndAggregate", duration_seconds)
+        return status
+
     @with_timer("sampleAndAggregate")
     def _sample_and_aggregate(self):
         sample = self.sampler.sample()
         self.collector.add(sample)
+        return sample
+
+    @with_timer("processProfileRequests")
+    def _process_profile_requests(self, sample):
+        """
+        The profiles pulled from the profile server are copied on demand; this is timed on its own as well as part of
+        runProfiler so the overall cpu usage check and the reported overhead account for it. Unless the timers are
+        batched, it is left out of sampleAndAggregate, which is compared to the sampling interval.
+        """
+        self.profile_server.process_pending_requests(self.collector.profile, sample)
+
+    def report_if_due(self):
+        """
+        Reports the profile from the calling thread if the reporting interval is reached, e.g. at the end of a lambda
+        invocation, before the sandbox gets frozen; the profiling thread waits for it if it needs to sample meanwhile.
+
+        :return: True if the profile was reported; False otherwise.
+        """
+        with self._command_lock:
+            # the reporter is only set up by the first profiling command; there is nothing to report before that
+            if self._first_execution or not self.collector.flush(reset=False):
+                return False
+            # same as the end of a cycle of the profiling command: the next one refreshes the configuration
+            self.is_profiling_in_progress = False
+            self.collector.reset()
+            return True
 
     def is_running(self):
         return self.scheduler.is_running()
@@ -115,6 +219,11 @@ class ProfilerRunner:
         It terminates the profiling thread and flushes existing profile to the backend.
         """
         self.scheduler.stop()
+        self.sampler.stop()
+        if self.aggregation_server is not None:
+            self.aggregation_server.stop()
+        if self.profile_server is not None:
+            self.profile_server.stop()
         self.collector.flush(force=True)
         self.is_profiling_in_progress = False
 
@@ -125,6 +234,7 @@ class ProfilerRunner:
         :param block: if True, we will not return from this function before the change is applied, default is False.
         """
         self.collector.profile.resume()
+        self.sampler.start()
         self.scheduler.resume(block)
 
     def pause(self, block=False):
@@ -134,10 +244,12 @@ class ProfilerRunner:
         :param block: if True, we will not return from this function before the change is applied, default is False.
         """
         self.scheduler.pause(block)
+        self.sampler.stop()
         self.collector.profile.pause()
 
 
 class RunProfilerStatus:
-    def __init__(self, success, is_end_of_cycle):
+    def __init__(self, success, is_end_of_cycle, has_sampled=False):
         self.success = success
         self.is_end_of_cycle = is_end_of_cycle
+        self.has_sampled = has_sampled
@@ -1,14 +1,24 @@
 import logging
-import random
 import sys
+import threading
 
 import codeguru_profiler_agent.sampling_utils
-from codeguru_profiler_agent.metrics.with_timer import with_timer
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext, PHASES
+from codeguru_profiler_agent.metrics.with_timer import with_timer, bind_untimed_methods
+from codeguru_profiler_agent.model.frame import Frame
 from codeguru_profiler_agent.model.sample import Sample
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+from codeguru_profiler_agent.signal_sampler import SignalSampler
+from codeguru_profiler_agent.thread_grouper import ThreadGrouper
+from codeguru_profiler_agent.thread_state_classifier import ThreadStateClassifier, IDLE, RUNNABLE, BLOCKED
+from codeguru_profiler_agent.utils.greenlet_tracker import GreenletTracker
+from codeguru_profiler_agent.utils.round_robin_selector import RoundRobinSelector
+from codeguru_profiler_agent.utils.thread_cpu_clock import ThreadCpuClock
 
 logger = logging.getLogger(__name__)
 
+LAMBDA_PHASE_FRAMES = {phase: Frame(name="<{}>".format(phase)) for phase in PHASES}
+
 
 class Sampler:
     """
@@ -22,15 +32,96 @@ class Sampler:
     def __init__(self, environment=dict()):
         """
         :param environment: dependency container dictionary for the current profiler
-        :param max_threads: (inside environment) the max number of threads getting sampled
+        :param max_threads: (inside environment) the max number of threads getting sampled; when there are more
+            threads, they are sampled in turns so that each thread is sampled at least once every
+            ceil(threads / max_threads) samples
         :param excluded_threads: (inside environment) set of thread names to be excluded from sampling
+        :param sample_cpu_time: (inside environment) if True, also measure the cpu time spent by each sampled thread
+            between samples; this is ignored on platforms not supporting per-thread cpu clocks (default: False)
+        :param classify_thread_states: (inside environment) if True, tag each stack as RUNNABLE, BLOCKED or IDLE
+            (default: False)
+        :param drop_idle_stacks: (inside environment) if True, stacks of idle threads are not added to the sample,
+            which saves the memory and cpu spent aggregating them (default: False)
+        :param sample_asyncio_tasks: (inside environment) if True, also sample the coroutine stacks of the asyncio tasks
+            pending in the event loops of the sampled threads (default: False)
+        :param max_asyncio_tasks: (inside environment) the max number of asyncio tasks getting sampled (default: 100)
+        :param sample_greenlets: (inside environment) if True, also sample the suspended greenlets of the thread starting
+            the sampler, up to max_threads of them; this requires the greenlet package (default: False)
+        :param signal_sampling: (inside environment) if True, the main thread is sampled from a SIGPROF handler once per
+            sampling interval of process cpu time instead of from the profiler thread, see SignalSampler; the latest of
+            these stacks is the wall clock sample of the main thread and the other ones only count as cpu time. This is
+            ignored on platforms without setitimer (default: False)
+        :param group_by_thread_name: (inside environment) if True, each thread stack starts with a <thread-group:NAME>
+            frame, NAME being the thread name without its numeric suffixes, see ThreadGrouper (default: False)
+        :param group_by_lambda_phase: (inside environment) if True, stacks sampled in AWS lambda start with a
+            <cold-invoke> or <warm-invoke> frame depending on the invocation of the sandbox, see LambdaContext
+            (default: False)
         """
         self._max_threads = environment.get("max_threads") or 100
         self._excluded_threads = environment.get("excluded_threads") or set()
         self._get_stacks = \
             environment.get("get_stacks") or codeguru_profiler_agent.sampling_utils.get_stacks
         self._thread_lister = environment.get("thread_lister") or sys
+        self._thread_selector = RoundRobinSelector(key=lambda thread: thread[0])
+        self._greenlet_selector = RoundRobinSelector(key=lambda greenlet_frame: id(greenlet_frame[0]))
+        self._get_thread_stacks = environment.get("get_thread_stacks") or \
+            codeguru_profiler_agent.sampling_utils.get_thread_stacks
+        self._thread_cpu_clock = None
+        if environment.get("sample_cpu_time"):
+            if ThreadCpuClock.is_supported():
+                self._thread_cpu_clock = environment.get("thread_cpu_clock") or ThreadCpuClock()
+            else:
+                logger.info("Sampling cpu time is not supported on this platform, only wall time will be reported.")
+        self._thread_grouper = None
+        if environment.get("group_by_thread_name"):
+            self._thread_grouper = environment.get("thread_grouper") or ThreadGrouper()
+        self._sample_asyncio_tasks = environment.get("sample_asyncio_tasks") or False
+        self._max_asyncio_tasks = environment.get("max_asyncio_tasks") or 100
+        self._get_asyncio_task_stacks = environment.get("get_asyncio_task_stacks") or \
+            codeguru_profiler_agent.sampling_utils.get_asyncio_task_stacks
+        self._greenlet_tracker = None
+        if environment.get("sample_greenlets"):
+            if environment.get("greenlet_tracker") or GreenletTracker.is_supported():
+                self._greenlet_tracker = environment.get("greenlet_tracker") or GreenletTracker()
+                self._get_greenlet_stacks = environment.get("get_greenlet_stacks") or \
+                    codeguru_profiler_agent.sampling_utils.get_greenlet_stacks
+            else:
+                logger.info("Sampling greenlets requires the greenlet package, only threads will be sampled.")
+        self._signal_sampler = None
+        if environment.get("signal_sampling"):
+            if SignalSampler.is_supported():
+                self._signal_sampler = environment.get("signal_sampler") or SignalSampler()
+            else:
+                logger.info("Signal sampling is not supported on this platform, the main thread will be sampled "
+                            "like other threads.")
+        self._group_by_lambda_phase = environment.get("group_by_lambda_phase") or False
+        self._drop_idle_stacks = environment.get("drop_idle_stacks") or False
+        self._classify_thread_states = environment.get("classify_thread_states") or False
+        self._thread_state_classifier = None
+        if self._classify_thread_states or self._drop_idle_stacks:
+            self._thread_state_classifier = environment.get("thread_state_classifier") or ThreadStateClassifier()
         self.timer = environment.get("timer")
+        bind_untimed_methods(self)
+
+    def start(self):
+        """
+        Starts the samplers that keep running between two calls to sample(). This is expected to be called from the
+        thread starting the profiler, which needs to be the main thread for signal sampling and is the thread whose
+        greenlets are tracked.
+        """
+        if self._greenlet_tracker is not None:
+            self._greenlet_tracker.start()
+        if self._signal_sampler is not None:
+            self._signal_sampler.start()
+
+    def stop(self):
+        """
+        Stops the samplers started by start(), so they add no overhead while the profiler is paused or stopped.
+        """
+        if self._signal_sampler is not None:
+            self._signal_sampler.stop()
+        if self._greenlet_tracker is not None:
+            self._greenlet_tracker.stop()
 
     @with_timer("dumpAllStackTraces")
     def sample(self):
@@ -39,29 +130,133 @@ class Sampler:
         current Python instance. Any exception encountered during sampling process will be propagated.
         """
         all_threads = self._get_all_threads()
-        all_threads_count = len(all_threads)
-        threads_to_sample = self._threads_to_sample_from(all_threads)
+        main_thread_stacks = []
+        if self._signal_sampler is not None and self._signal_sampler.is_running():
+            main_thread_stacks, cpu_time_per_stack = self._signal_sampler.drain()
+        if main_thread_stacks:
+            main_thread_id = threading.main_thread().ident
+            threads = [thread for thread in all_threads if thread[0] != main_thread_id]
+        else:
+            # the main thread did not run python code since the last sample, so we sample it like the other threads
+            threads = all_threads
+        all_threads_count = len(threads)
+        threads_to_sample = self._thread_selector.select(threads, self._max_threads)
         threads_to_sample_count = len(threads_to_sample)
 
-        stacks = self._get_stacks(
-            threads_to_sample=threads_to_sample,
-            excluded_threads=self._excluded_threads,
-            max_depth=AgentConfiguration.get().max_stack_depth)
+        cpu_times = None
+        if self._thread_cpu_clock is None and self._thread_grouper is None:
+            stacks = self._get_stacks(
+                threads_to_sample=threads_to_sample,
+                excluded_threads=self._excluded_threads,
+                max_depth=AgentConfiguration.get().max_stack_depth)
+        else:
+            stacks, cpu_times = self._get_thread_stacks(
+                threads_to_sample=threads_to_sample,
+                excluded_threads=self._excluded_threads,
+                max_depth=AgentConfiguration.get().max_stack_depth,
+                thread_cpu_clock=self._thread_cpu_clock,
+                thread_grouper=self._thread_grouper)
+            alive_thread_ids = [thread_id for thread_id, _ in all_threads]
+            if self._thread_cpu_clock is not None:
+                self._thread_cpu_clock.forget_threads_other_than(alive_thread_ids)
+            if self._thread_grouper is not None:
+                self._thread_grouper.forget_threads_other_than(alive_thread_ids)
+
+        cpu_only_stacks = None
+        if main_thread_stacks:
+            if self._thread_grouper is not None:
+                main_thread = threading.main_thread()
+                group_frame = self._thread_grouper.group_frame(main_thread.ident, main_thread.name)
+                max_depth = AgentConfiguration.get().max_stack_depth
+                main_thread_stacks = [
+                    codeguru_profiler_agent.sampling_utils.with_prefix_frames([group_frame], stack, max_depth)
+                    for stack in main_thread_stacks]
+            # the signal sampler samples once per sampling interval of cpu time of the whole process, so only the latest
+            # stack counts as the wall clock sample of the main thread, like the other threads get one per sample; the
+            # other ones only count as cpu time
+            stacks = stacks + main_thread_stacks[-1:]
+            if cpu_times is not None:
+                cpu_times = cpu_times + [cpu_time_per_stack]
+                cpu_only_stacks = [(stack, cpu_time_per_stack) for stack in main_thread_stacks[:-1]]
+                if self._thread_cpu_clock is not None:
+                    # so that the cpu time counted here is not counted again when the main thread is sampled as a thread
+                    self._thread_cpu_clock.cpu_time_since_last_sample(main_thread_id)
+            threads_to_sample_count += 1
+            all_threads_count += 1
+
+        thread_stacks_count = len(stacks)
+        tasks_to_sample_count = 0
+        seen_tasks_count = 0
+        if self._sample_asyncio_tasks:
+            task_stacks, seen_tasks_count = self._get_asyncio_task_stacks(
+                threads=all_threads,
+                excluded_threads=self._excluded_threads,
+                max_depth=AgentConfiguration.get().max_stack_depth,
+                max_tasks=self._max_asyncio_tasks)
+            stacks = stacks + task_stacks
+            if cpu_times is not None:
+                cpu_times = cpu_times + [0.0] * len(task_stacks)
+            tasks_to_sample_count = len(task_stacks)
+
+        if self._greenlet_tracker is not None:
+            greenlet_frames = self._greenlet_tracker.suspended_greenlets()
+            # like asyncio tasks, suspended greenlets are not counted as threads
+            seen_tasks_count += len(greenlet_frames)
+            greenlet_frames = self._greenlet_selector.select(greenlet_frames, self._max_threads)
+            greenlet_stacks = self._get_greenlet_stacks(
+                greenlet_frames=greenlet_frames,
+                max_depth=AgentConfiguration.get().max_stack_depth)
+            stacks = stacks + greenlet_stacks
+            if cpu_times is not None:
+                cpu_times = cpu_times + [0.0] * len(greenlet_stacks)
+            tasks_to_sample_count += len(greenlet_stacks)
+            del greenlet_frames
+
+        thread_states = None
+        if self._thread_state_classifier is not None:
+            thread_states = [self._thread_state_classifier.classify(stack) for stack in stacks]
+            # a pending task or a suspended greenlet is waiting on something, even when its top frame is ordinary code
+            for i in range(thread_stacks_count, len(stacks)):
+                if thread_states[i] == RUNNABLE:
+                    thread_states[i] = BLOCKED
+            if self._drop_idle_stacks:
+                stacks, cpu_times, thread_states = self._without_idle_stacks(stacks, cpu_times, thread_states)
+            if not self._classify_thread_states:
+                thread_states = None
+
+        if self._group_by_lambda_phase:
+            stacks = self._with_lambda_phase_frame(stacks)
+            if cpu_only_stacks:
+                cpu_only_stacks = list(zip(self._with_lambda_phase_frame([stack for stack, _ in cpu_only_stacks]),
+                                           [cpu_time for _, cpu_time in cpu_only_stacks]))
 
         # Memory usage optimization
         del all_threads
+        del threads
         del threads_to_sample
 
         return Sample(stacks=stacks, attempted_sample_threads_count=threads_to_sample_count,
-                      seen_threads_count=all_threads_count)
+                      seen_threads_count=all_threads_count, cpu_times=cpu_times, thread_states=thread_states,
+                      attempted_sample_tasks_count=tasks_to_sample_count, seen_tasks_count=seen_tasks_count,
+                      cpu_only_stacks=cpu_only_stacks)
+
+    @staticmethod
+    def _with_lambda_phase_frame(stacks):
+        phase_frame = LAMBDA_PHASE_FRAMES.get(LambdaContext.get().phase)
+        if phase_frame is None:
+            return stacks
+        max_depth = AgentConfiguration.get().max_stack_depth
+        return [codeguru_profiler_agent.sampling_utils.with_prefix_frames([phase_frame], stack, max_depth)
+                for stack in stacks]
+
+    @staticmethod
+    def _without_idle_stacks(stacks, cpu_times, thread_states):
+        kept = [i for i, thread_state in enumerate(thread_states) if thread_state != IDLE]
+        if len(kept) == len(stacks):
+            return stacks, cpu_times, thread_states
+        return [stacks[i] for i in kept], \
+            [cpu_times[i] for i in kept] if cpu_times is not None else None, \
+            [thread_states[i] for i in kept]
 
     def _get_all_threads(self):
         return list(self._thread_lister._current_frames().items())
-
-    def _threads_to_sample_from(self, all_threads):
-        if len(all_threads) > self._max_threads:
-            if isinstance(all_threads, dict):
-               all_threads = list(all_threads.keys())
-            return random.sample(all_threads, self._max_threads)  # nosec B311
-        else:
-            return list(all_threads)
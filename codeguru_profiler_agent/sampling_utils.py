@@ -2,9 +2,12 @@
 This module handles all interactions with python sys and traceback library for sampling.
 """
 import linecache
+import random
+import sys
 import threading
 import traceback
 import re
+from codeguru_profiler_agent import endpoint_labels
 from codeguru_profiler_agent.model.frame import Frame
 
 BOTO_CLIENT_PATH = re.compile("[/\\\\]botocore[/\\\\]client.py$")
@@ -13,6 +16,10 @@ TRUNCATED_FRAME = Frame(name="<Truncated>")
 TIME_SLEEP_FRAME = Frame(name="<Sleep>")
 LXML_SCHEMA_FRAME = Frame(name="lxml.etree:XMLSchema:__init__")
 QUEUE_BLOCKING_GET_FRAME = Frame(name="<queue.get>")
+ASYNCIO_TASK_FRAME = Frame(name="<task>")
+ASYNCIO_NAMED_TASK_FRAME_FORMAT = "<task:{}>"
+# asyncio names tasks "Task-<counter>" when no name is given; those would make every task a different root
+ASYNCIO_DEFAULT_TASK_NAME = re.compile(r"^Task-\d+$")
 
 
 def get_stacks(threads_to_sample, excluded_threads, max_depth):
@@ -22,18 +29,217 @@ def get_stacks(threads_to_sample, excluded_threads, max_depth):
     :param threads_to_sample: list of threads to be sampled, expected in the same format as sys._current_frames().items()
     :param excluded_threads: set of thread names to be excluded from sampling
     :param max_depth: the maximum number of frames a stack can have
-    :returns: a list of lists of call stacks of all chosen threads; any thread stacks deeper than max_depth will be truncated and the TRUNCATED_FRAME_NAME will be added as a replacement of the **TOPMOST** frames of the stack
+    :returns: a list of lists of call stacks of all chosen threads; any thread stacks deeper than max_depth will be truncated and the TRUNCATED_FRAME_NAME will be added as a replacement of the **TOPMOST** frames of the stack; stacks of threads serving a request through one of the middleware start with its <endpoint:NAME> frame
     """
+    stacks, _ = _get_stacks(threads_to_sample, excluded_threads, max_depth)
+    return stacks
+
+
+def get_thread_stacks(threads_to_sample, excluded_threads, max_depth, thread_cpu_clock=None, thread_grouper=None):
+    """
+    Same as get_stacks with optional details about each sampled thread.
+
+    :param thread_cpu_clock: the ThreadCpuClock keeping track of the cpu time of each thread between samples; if set,
+        the cpu time each thread spent since its previous sample is returned
+    :param thread_grouper: the ThreadGrouper giving the group of each thread; if set, each stack starts with the
+        <thread-group:NAME> frame of its thread, which counts towards max_depth
+    :returns: a tuple with the list of call stacks (see get_stacks) and the list of cpu times in seconds in the same
+        order as the stacks, or None when thread_cpu_clock is not set
+    """
+    return _get_stacks(threads_to_sample, excluded_threads, max_depth, thread_cpu_clock, thread_grouper)
+
+
+def _get_stacks(threads_to_sample, excluded_threads, max_depth, thread_cpu_clock=None, thread_grouper=None):
     stacks = []
+    cpu_times = [] if thread_cpu_clock is not None else None
     if max_depth < 0:
         max_depth = 0
     for thread_id, end_frame in threads_to_sample:
         if _is_excluded(thread_id, excluded_threads):
             continue
 
-        stacks.append(_extract_frames(end_frame, max_depth))
+        prefix_frames = []
+        if thread_grouper is not None:
+            thread = threading._active.get(thread_id)
+            if thread is None:
+                # the thread terminated since it was checked
+                continue
+            prefix_frames.append(thread_grouper.group_frame(thread_id, thread.name))
+        endpoint_frame = _thread_endpoint_frame(thread_id, end_frame)
+        if endpoint_frame is not None:
+            prefix_frames.append(endpoint_frame)
+        stacks.append(_extract_frames_with_prefix(prefix_frames, end_frame, max_depth))
+        if thread_cpu_clock is not None:
+            cpu_times.append(thread_cpu_clock.cpu_time_since_last_sample(thread_id))
 
-    return stacks
+    return stacks, cpu_times
+
+
+def get_frame_stack(end_frame, max_depth):
+    """
+    Extracts the call stack ending at the given frame, e.g. the frame interrupted by a signal.
+
+    :param end_frame: the frame on top of the stack
+    :param max_depth: the maximum number of frames a stack can have
+    :returns: the call stack, truncated like the thread stacks returned by get_stacks
+    """
+    if max_depth < 0:
+        max_depth = 0
+    # the frame belongs to the calling thread, which may be serving a request in the current asyncio task
+    endpoint = endpoint_labels.endpoints_by_thread_id.get(threading.get_ident()) or \
+        endpoint_labels.current_endpoint.get()
+    endpoint_frame = endpoint_labels.endpoint_frame(endpoint)
+    return _extract_frames_with_prefix([endpoint_frame] if endpoint_frame is not None else [], end_frame, max_depth)
+
+
+def get_asyncio_task_stacks(threads, excluded_threads, max_depth, max_tasks):
+    """
+    Reconstructs the coroutine stacks of the asyncio tasks that are suspended in the event loops run by the given
+    threads. While suspended, the frames of a task are not part of any thread stack so they are found by following
+    the cr_await chain from the coroutine of the task.
+
+    :param threads: list of threads, expected in the same format as sys._current_frames().items(); event loops running
+        in these threads are looked up from their stacks
+    :param excluded_threads: set of thread names whose event loops are ignored
+    :param max_depth: the maximum number of frames a stack can have, including the task frame
+    :param max_tasks: the max number of tasks to sample; when more are pending a random subset is picked
+    :returns: a tuple with the list of call stacks, each under a <task> or <task:NAME> frame, and the number of
+        pending tasks that were seen
+    """
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None or max_depth < 1:
+        # no event loop can be running if asyncio was never imported
+        return [], 0
+
+    tasks = []
+    for thread_id, end_frame in threads:
+        if _is_excluded(thread_id, excluded_threads):
+            continue
+        loop = _find_running_loop(end_frame, asyncio)
+        if loop is not None:
+            tasks.extend(task for task in _all_tasks(asyncio, loop) if not _is_running(task))
+    seen_tasks_count = len(tasks)
+    if seen_tasks_count > max_tasks:
+        tasks = random.sample(tasks, max_tasks)  # nosec B311
+
+    stacks = []
+    for task in tasks:
+        stack = _extract_task_frames(task, max_depth)
+        if stack is not None:
+            stacks.append(stack)
+    return stacks, seen_tasks_count
+
+
+def get_greenlet_stacks(greenlet_frames, max_depth):
+    """
+    Extracts the call stacks of suspended greenlets.
+
+    :param greenlet_frames: list of (greenlet, frame) pairs, frame being the top frame of the suspended greenlet
+    :param max_depth: the maximum number of frames a stack can have
+    :returns: a list of lists of call stacks, truncated like the thread stacks returned by get_stacks
+    """
+    if max_depth < 0:
+        max_depth = 0
+    return [_extract_frames(frame, max_depth) for _, frame in greenlet_frames]
+
+
+def _find_running_loop(end_frame, asyncio):
+    """
+    Finds the event loop run by a thread from its stack. Event loops implemented in C, e.g. uvloop, have no run_forever
+    frame, so they are only found when they are run through asyncio.run (or asyncio.Runner since Python 3.11); the
+    pending tasks of such a loop run with loop.run_forever() or loop.run_until_complete() directly are not sampled.
+    """
+    run_forever_code = asyncio.BaseEventLoop.run_forever.__code__
+    # asyncio.run only exists since Python 3.7 and asyncio.Runner since Python 3.11, which asyncio.run then relies on
+    asyncio_run = getattr(asyncio, "run", None)
+    asyncio_run_code = asyncio_run.__code__ if asyncio_run is not None else None
+    runner = getattr(asyncio, "Runner", None)
+    runner_run_code = runner.run.__code__ if runner is not None else None
+    frame = end_frame
+    while frame is not None:
+        code = frame.f_code
+        if code is run_forever_code:
+            return frame.f_locals.get("self")
+        if code is runner_run_code:
+            return getattr(frame.f_locals.get("self"), "_loop", None)
+        if code is asyncio_run_code and frame.f_locals.get("loop") is not None:
+            return frame.f_locals["loop"]
+        frame = frame.f_back
+    return None
+
+
+def _thread_endpoint_frame(thread_id, end_frame):
+    endpoint = endpoint_labels.endpoints_by_thread_id.get(thread_id)
+    if endpoint is None and endpoint_labels.is_asgi_middleware_used:
+        asyncio = sys.modules.get("asyncio")
+        loop = _find_running_loop(end_frame, asyncio) if asyncio is not None else None
+        if loop is not None:
+            task = _current_task(asyncio, loop)
+            endpoint = endpoint_labels.task_endpoint(task) if task is not None else None
+    return endpoint_labels.endpoint_frame(endpoint)
+
+
+def _all_tasks(asyncio, loop):
+    # asyncio.all_tasks only exists since Python 3.7, the Task.all_tasks it replaced also returns the finished tasks
+    all_tasks = getattr(asyncio, "all_tasks", None)
+    if all_tasks is not None:
+        return all_tasks(loop)
+    return {task for task in asyncio.Task.all_tasks(loop) if not task.done()}
+
+
+def _current_task(asyncio, loop):
+    # asyncio.current_task only exists since Python 3.7
+    current_task = getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+    return current_task(loop)
+
+
+def _task_coro(task):
+    # Task.get_coro() only exists since Python 3.8
+    get_coro = getattr(task, "get_coro", None)
+    return get_coro() if get_coro is not None else getattr(task, "_coro", None)
+
+
+def _is_running(task):
+    """
+    The task currently executing in the event loop thread is already part of the stack of that thread.
+    """
+    return getattr(_task_coro(task), "cr_running", False)
+
+
+def _extract_task_frames(task, max_depth):
+    stack = []
+    awaitable = _task_coro(task)
+    while awaitable is not None and len(stack) < max_depth - 1:
+        frame = _awaitable_frame(awaitable)
+        if frame is None:
+            # reached a future or a coroutine that already finished
+            break
+        stack.append((frame, frame.f_lineno))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) \
+            or getattr(awaitable, "ag_await", None)
+    if not stack:
+        return None
+
+    stack_entries = [_task_frame(task)] + _extract_stack(stack, max_depth - 1)
+    if len(stack_entries) == max_depth:
+        stack_entries[-1] = TRUNCATED_FRAME
+    endpoint_frame = endpoint_labels.endpoint_frame(endpoint_labels.task_endpoint(task))
+    if endpoint_frame is not None:
+        stack_entries = with_prefix_frames([endpoint_frame], stack_entries, max_depth)
+    return stack_entries
+
+
+def _awaitable_frame(awaitable):
+    return getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) \
+        or getattr(awaitable, "ag_frame", None)
+
+
+def _task_frame(task):
+    # task names only exist since Python 3.8
+    task_name = task.get_name() if hasattr(task, "get_name") else None
+    if task_name is None or ASYNCIO_DEFAULT_TASK_NAME.match(task_name):
+        return ASYNCIO_TASK_FRAME
+    return Frame(name=ASYNCIO_NAMED_TASK_FRAME_FORMAT.format(task_name))
 
 
 def _is_zombie(thread):
@@ -109,6 +315,30 @@ def _maybe_append_synthetic_frame(result, frame, line_no):
         result.append(LXML_SCHEMA_FRAME)
 
 
+def _extract_frames_with_prefix(prefix_frames, end_frame, max_depth):
+    """
+    Extracts the stack with synthetic frames (e.g. thread group, endpoint) inserted at its bottom; these count towards
+    max_depth.
+    """
+    if not prefix_frames:
+        return _extract_frames(end_frame, max_depth)
+    if len(prefix_frames) >= max_depth:
+        return prefix_frames[:max_depth]
+    return prefix_frames + _extract_frames(end_frame, max_depth - len(prefix_frames))
+
+
+def with_prefix_frames(prefix_frames, stack, max_depth):
+    """
+    Inserts synthetic frames at the bottom of an already extracted stack; like in _extract_frames_with_prefix they
+    count towards max_depth, and a stack that no longer fits ends with the TRUNCATED_FRAME.
+    """
+    if len(prefix_frames) >= max_depth:
+        return prefix_frames[:max_depth]
+    if len(prefix_frames) + len(stack) <= max_depth:
+        return prefix_frames + stack
+    return prefix_frames + stack[:max_depth - len(prefix_frames) - 1] + [TRUNCATED_FRAME]
+
+
 def _extract_frames(end_frame, max_depth):
     stack = list(traceback.walk_stack(end_frame))[::-1][0:max_depth]
     # When running the sample app with uwsgi for Python 3.8.10 - 3.9.2, the traceback command
@@ -7,6 +7,8 @@ from functools import lru_cache
 import os
 from pathlib import Path
 
+from codeguru_profiler_agent.thread_state_classifier import THREAD_STATES
+
 GZIP_BALANCED_COMPRESSION_LEVEL = 6
 DEFAULT_FRAME_COMPONENT_DELIMITER = ":"
 
@@ -66,6 +68,24 @@ def _remove_prefix_path(module_path, sys_paths):
 
     return module_path
 
+def get_frame_name(node, module_path_extractor):
+    """
+    :returns: the name of the frame of a call graph node as reported, i.e. "module.path:ClassName:function_name" with
+        the components that are not known left out
+    """
+    return DEFAULT_FRAME_COMPONENT_DELIMITER.join(
+        list(filter(None, [module_path_extractor.get_module_path(node.file_path), node.class_name, node.frame_name])))
+
+
+def get_wall_time_milliseconds_per_count(profile):
+    """
+    :returns: the wall clock time a WALL_TIME count stands for, which is the inverse of the WALL_TIME sample weight
+    """
+    if profile.total_sample_count == 0:
+        return float(profile.sampling_interval_ms)
+    return profile.get_active_millis_since_start() * profile.average_thread_weight() / profile.total_sample_count
+
+
 class ProfileEncoder:
     """
     Encodes a given Profile into the JSON version of the ion-based profile format
@@ -135,6 +155,13 @@ class ProfileEncoder:
         def _encode_agent_metadata(self):
             profile_duration_seconds = self._profile.get_active_millis_since_start() / 1000.0
             sample_weight = 1.0 if (profile_duration_seconds == 0) else self._profile.total_sample_count / profile_duration_seconds
+            # when only a subset of the threads is sampled each time, WALL_TIME counts only cover that subset so the
+            # weight is lowered to stand for all the threads that were seen; asyncio tasks and greenlets are not part
+            # of the thread counts. CPU_TIME needs no such compensation: the cpu time of a thread is measured since its
+            # previous sample, so it includes the samples it was skipped for.
+            sample_weight = sample_weight / self._profile.average_thread_weight()
+            cpu_time_sample_weight = self._cpu_time_sample_weight() if self._profile.has_cpu_time else None
+            thread_states = THREAD_STATES if self._profile.has_thread_states else ()
             average_num_threads = 0.0 if (self._profile.total_sample_count == 0) else (self._profile.total_seen_threads_count / self._profile.total_sample_count)
 
             return self._agent_metadata.serialize_to_json(
@@ -144,9 +171,18 @@ class ProfileEncoder:
                         average_num_threads=average_num_threads,
                         memory_usage_mb=self._convert_to_mb(self._profile.get_memory_usage_bytes()),
                         overhead_ms=self._profile.overhead_ms,
-                        total_sample_count = self._profile.total_sample_count
+                        total_sample_count = self._profile.total_sample_count,
+                        cpu_time_sample_weight=cpu_time_sample_weight,
+                        thread_states=thread_states
             )
 
+        def _cpu_time_sample_weight(self):
+            """
+            CPU_TIME counts are expressed in sampling intervals, like WALL_TIME counts, so that both are of the same
+            magnitude; the weight converts them back to seconds.
+            """
+            return 1000.0 / self._profile.sampling_interval_ms
+
         def _convert_to_mb(self, bytes_to_convert):
             return bytes_to_convert / (1024 * 1024)
 
@@ -179,11 +215,16 @@ class ProfileEncoder:
             }
 
         def _convert_runnable_count(self, node):
+            counts = {}
             if node.runnable_count > 0:
+                counts["WALL_TIME"] = node.runnable_count
+            if node.cpu_time_seconds:
+                counts["CPU_TIME"] = node.cpu_time_seconds * self._cpu_time_sample_weight()
+            if node.thread_state_counts:
+                counts.update(node.thread_state_counts)
+            if counts:
                 return {
-                    "counts": {
-                        "WALL_TIME": node.runnable_count
-                    }
+                    "counts": counts
                 }
             return None
 
@@ -207,9 +248,7 @@ class ProfileEncoder:
         def _encode_children_nodes_recursive(self, children_nodes):
             node_map = {}
             for child_node in children_nodes:
-                frame = DEFAULT_FRAME_COMPONENT_DELIMITER.join(
-                    list(filter(None, [self._module_path_extractor.get_module_path(child_node.file_path),
-                                       child_node.class_name, child_node.frame_name])))
+                frame = get_frame_name(child_node, self._module_path_extractor)
                 child_node_map = self._encode_node_recursive(child_node)
                 node_map[frame] = child_node_map
 
@@ -0,0 +1,130 @@
+import logging
+import signal
+import threading
+
+import codeguru_profiler_agent.sampling_utils
+from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 256
+
+
+class SignalSampler:
+    """
+    Samples the main thread from a SIGPROF handler driven by setitimer(ITIMER_PROF), instead of from the profiler
+    thread. The profiler thread has to acquire the GIL to take a sample, so a main thread holding it in long C calls is
+    under-sampled; the signal handler instead runs in the main thread as soon as it executes Python code again and gets
+    its current frame.
+
+    ITIMER_PROF counts the cpu time of the whole process, so the main thread is sampled once per sampling interval of
+    cpu time, i.e. its stacks stand for cpu time rather than for wall clock time, see Sampler. The handler only extracts
+    the stack into a preallocated ring buffer; the stacks are drained by the Sampler on the profiler thread. When the
+    profiler thread does not drain fast enough the oldest stacks are overwritten.
+
+    Note: signal handlers can only be installed from the main thread, and some C extensions do not retry system calls
+    interrupted by a signal (EINTR), which is why this is not the default.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, extract_frames=None):
+        """
+        :param buffer_size: max number of stacks kept between two drains
+        :param extract_frames: function extracting the stack of a frame; default sampling_utils.get_frame_stack
+        """
+        self._buffer = [None] * buffer_size
+        self._extract_frames = extract_frames or codeguru_profiler_agent.sampling_utils.get_frame_stack
+        # the write count is only updated by the handler and the read count only by drain(), so they do not need a lock
+        self._write_count = 0
+        self._read_count = 0
+        self._interval_seconds = None
+        self._max_depth = None
+        self._previous_handler = None
+        self._is_handler_installed = False
+        self.dropped_stacks_count = 0
+
+    @staticmethod
+    def is_supported():
+        return hasattr(signal, "setitimer") and hasattr(signal, "SIGPROF")
+
+    def is_running(self):
+        return self._interval_seconds is not None
+
+    def start(self):
+        """
+        Installs the SIGPROF handler and arms the timer. The handler can only be installed from the main thread, but a
+        signal sampler stopped from another thread can be started again from any thread as its handler is kept.
+
+        :return: True if the signal sampler was started; False otherwise, e.g. if another SIGPROF handler is installed.
+        """
+        if self.is_running():
+            return True
+        if not self._is_handler_installed:
+            if threading.current_thread() is not threading.main_thread():
+                logger.info("Signal sampling can only be started from the main thread, "
+                            "falling back to thread sampling.")
+                return False
+            if signal.getsignal(signal.SIGPROF) not in (signal.SIG_DFL, signal.SIG_IGN, None):
+                logger.info("A SIGPROF handler is already installed, falling back to thread sampling.")
+                return False
+            self._max_depth = AgentConfiguration.get().max_stack_depth
+            self._previous_handler = signal.signal(signal.SIGPROF, self._handle_signal)
+            self._is_handler_installed = True
+        self._arm(AgentConfiguration.get().sampling_interval.total_seconds())
+        return True
+
+    def stop(self):
+        """
+        Disarms the timer and discards the stacks that were not drained; the handler is also uninstalled when called
+        from the main thread.
+        """
+        if self.is_running():
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            self._interval_seconds = None
+            self._read_count = self._write_count
+        if self._is_handler_installed and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGPROF, self._previous_handler)
+            self._is_handler_installed = False
+
+    def drain(self):
+        """
+        Removes and returns the stacks captured since the last drain, oldest first. This is expected to be called from
+        the profiler thread; the timer is re-armed if the sampling interval was changed by the configuration.
+
+        :returns: the list of stacks and the cpu time in seconds each of them stands for
+        """
+        if not self.is_running():
+            return [], 0.0
+        interval_seconds = self._interval_seconds
+        self._max_depth = AgentConfiguration.get().max_stack_depth
+        new_interval_seconds = AgentConfiguration.get().sampling_interval.total_seconds()
+        if new_interval_seconds != interval_seconds:
+            self._arm(new_interval_seconds)
+
+        write_count = self._write_count
+        start = max(self._read_count, write_count - len(self._buffer))
+        self.dropped_stacks_count += start - self._read_count
+        stacks = []
+        for count in range(start, write_count):
+            index = count % len(self._buffer)
+            stack = self._buffer[index]
+            self._buffer[index] = None
+            # the handler may have overwritten the slot meanwhile, and the slot emptied here is read again by the next
+            # drain
+            if stack is not None:
+                stacks.append(stack)
+        self._read_count = write_count
+        return stacks, interval_seconds
+
+    def _arm(self, interval_seconds):
+        self._interval_seconds = interval_seconds
+        signal.setitimer(signal.ITIMER_PROF, interval_seconds, interval_seconds)
+
+    def _handle_signal(self, signum, frame):
+        # this runs in the middle of the application code so nothing can be raised from here
+        try:
+            if frame is None:
+                return
+            self._buffer[self._write_count % len(self._buffer)] = self._extract_frames(frame, self._max_depth)
+            self._write_count += 1
+        except Exception:  # nosec B110
+            pass
@@ -0,0 +1,165 @@
+import logging
+import os
+import socket
+import stat
+import threading
+
+from queue import Queue, Full, Empty
+
+from codeguru_profiler_agent.utils.log_exception import log_exception
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING_AGGREGATES = 256
+DEFAULT_MAX_AGGREGATE_SIZE_BYTES = 10 * 1024 * 1024
+RECEIVE_BUFFER_SIZE_BYTES = 64 * 1024
+CONNECTION_TIMEOUT_SECONDS = 5
+
+
+class AggregationServer:
+    """
+    Listens on a Unix domain socket for profile aggregates sent by SocketReporter instances running in other processes
+    of the same host (e.g. gunicorn workers).
+
+    Received payloads are only queued by the server thread; they are merged into the profile by the LocalAggregator
+    from the profiler thread, so the server never touches the profile being sampled.
+
+    Only processes running as the same user are expected to send their profiles to us: the socket is only accessible
+    to the current user and the server does not start in a directory other users can write to, where they could
+    replace it.
+    """
+
+    def __init__(self, environment=dict()):
+        """
+        :param environment: dependency container dictionary for the current profiler
+        :param aggregation_socket_path: (required inside environment) path of the Unix domain socket to listen on
+        :param max_pending_aggregates: (inside environment) max number of received aggregates waiting to be merged;
+            aggregates received when this is reached are dropped (default: 256)
+        :param max_aggregate_size_bytes: (inside environment) max size of one aggregate payload; bigger aggregates
+            are dropped (default: 10MB)
+        """
+        self._socket_path = environment["aggregation_socket_path"]
+        self._max_aggregate_size_bytes = \
+            environment.get("max_aggregate_size_bytes") or DEFAULT_MAX_AGGREGATE_SIZE_BYTES
+        self._pending_aggregates = Queue(maxsize=environment.get("max_pending_aggregates")
+                                         or DEFAULT_MAX_PENDING_AGGREGATES)
+        self._server_socket = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts listening on the socket. If that fails, e.g. the socket file of another user is in the way, the
+        profiler keeps reporting its own profiles through its reporter, without the ones of the other processes.
+
+        :return: True if the server is listening; False otherwise.
+        """
+        if self.is_running():
+            logger.info("Ignored AggregationServer.start() as it is already running!")
+            return True
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._prepare_socket_directory()
+            self._remove_stale_socket_file()
+            # the socket file is created by bind, the umask makes sure it is never accessible to other users
+            previous_umask = os.umask(0o177)
+            try:
+                server_socket.bind(self._socket_path)
+            finally:
+                os.umask(previous_umask)
+            server_socket.listen()
+        except OSError as e:
+            server_socket.close()
+            logger.info("Unable to start the aggregation server on '{}', profiles of other processes will not be "
+                        "merged: {}".format(self._socket_path, str(e)))
+            return False
+        self._server_socket = server_socket
+        self._thread = threading.Thread(target=self._serve, args=(server_socket,),
+                                        name="codeguru-profiler-aggregation-server", daemon=True)
+        self._thread.start()
+        logger.info("Aggregation server listening on '{}'".format(self._socket_path))
+        return True
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        if self._server_socket is None:
+            return
+        try:
+            self._server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # shutdown fails on some platforms if the socket is not connected, closing is enough for those.
+            pass
+        self._server_socket.close()
+        self._server_socket = None
+        if self._thread is not None:
+            self._thread.join(CONNECTION_TIMEOUT_SECONDS)
+        try:
+            self._remove_stale_socket_file()
+        except OSError as e:
+            logger.info("Unable to remove the aggregation socket file '{}': {}".format(self._socket_path, str(e)))
+
+    def pending_aggregates(self):
+        """
+        Removes and returns all aggregates received so far. This is expected to be called from the profiler thread.
+        """
+        aggregates = []
+        try:
+            while True:
+                aggregates.append(self._pending_aggregates.get_nowait())
+        except Empty:
+            return aggregates
+
+    def _serve(self, server_socket):
+        # stop() resets self._server_socket from another thread, so the socket is passed to the server thread instead
+        while True:
+            try:
+                connection, _ = server_socket.accept()
+            except OSError:
+                # the server socket was closed by stop()
+                return
+            try:
+                self._receive(connection)
+            except Exception as e:
+                log_exception(logger, "Failed to receive a profile aggregate: {}".format(str(e)))
+            finally:
+                connection.close()
+
+    def _receive(self, connection):
+        connection.settimeout(CONNECTION_TIMEOUT_SECONDS)
+        chunks = []
+        received_bytes = 0
+        while True:
+            chunk = connection.recv(RECEIVE_BUFFER_SIZE_BYTES)
+            if not chunk:
+                break
+            received_bytes += len(chunk)
+            if received_bytes > self._max_aggregate_size_bytes:
+                logger.info("Dropping a profile aggregate bigger than {} bytes".format(self._max_aggregate_size_bytes))
+                return
+            chunks.append(chunk)
+        try:
+            self._pending_aggregates.put_nowait(b"".join(chunks))
+        except Full:
+            logger.info("Dropping a profile aggregate as too many are waiting to be merged")
+
+    def _prepare_socket_directory(self):
+        """
+        Creates the directory of the socket, only accessible to the current user, unless it exists; an existing
+        directory is rejected if users other than the current one or root can replace files in it.
+        """
+        directory = os.path.dirname(os.path.abspath(self._socket_path))
+        os.makedirs(directory, mode=stat.S_IRWXU, exist_ok=True)
+        directory_stat = os.stat(directory)
+        if directory_stat.st_uid not in (os.getuid(), 0):
+            raise PermissionError("'{}' is owned by another user".format(directory))
+        is_writable_by_others = directory_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+        if is_writable_by_others and not directory_stat.st_mode & stat.S_ISVTX:
+            raise PermissionError("'{}' is writable by other users".format(directory))
+
+    def _remove_stale_socket_file(self):
+        try:
+            if stat.S_ISSOCK(os.stat(self._socket_path).st_mode):
+                os.remove(self._socket_path)
+        except FileNotFoundError:
+            pass
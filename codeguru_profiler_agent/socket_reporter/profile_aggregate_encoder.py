@@ -0,0 +1,87 @@
+import json
+
+from codeguru_profiler_agent.model.frame import Frame
+from codeguru_profiler_agent.model.profile import Profile
+
+
+class ProfileAggregateEncoder:
+    """
+    Encodes the call graph of a Profile into a compact aggregate that can be shipped to another process on the same
+    host, and decodes such aggregates back into a Profile.
+
+    The aggregate is a JSON document where the call graph is flattened into a list of nodes in pre-order. Each node is
+    an array [parent_index, frame_name, class_name, file_path, start_line, end_line, runnable_count, cpu_time_seconds,
+    thread_state_counts] where cpu_time_seconds and thread_state_counts are null unless cpu time is sampled and thread
+    states are classified, and parent_index points to a previous node of the list (index 0 being the root node, which is not part of the list).
+    This keeps the payload small (no repeated stack prefixes) and lets both sides walk the graph without recursion.
+    """
+
+    def encode(self, profile, output_stream):
+        output_stream.write(json.dumps({
+            "start": int(profile.start),
+            "end": int(profile.end) if profile.end is not None else None,
+            "sampleCount": profile.total_sample_count,
+            "seenThreadsCount": profile.total_seen_threads_count,
+            "attemptedSampleThreadsCount": profile.total_attempted_sample_threads_count,
+            "seenTasksCount": profile.total_seen_tasks_count,
+            "attemptedSampleTasksCount": profile.total_attempted_sample_tasks_count,
+            "hasCpuTime": profile.has_cpu_time,
+            "hasThreadStates": profile.has_thread_states,
+            "nodes": self._encode_nodes(profile.callgraph)
+        }, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _encode_nodes(callgraph):
+        nodes = []
+        to_visit = [(child, 0) for child in reversed(callgraph.children)]
+        while to_visit:
+            node, parent_index = to_visit.pop()
+            nodes.append([parent_index, node.frame_name, node.class_name, node.file_path, node.start_line,
+                          node.end_line, node.runnable_count, node.cpu_time_seconds,
+                          node.thread_state_counts])
+            node_index = len(nodes)
+            to_visit.extend((child, node_index) for child in reversed(node.children))
+        return nodes
+
+    def decode_into(self, payload, profile):
+        """
+        Adds the content of an encoded aggregate into the given profile: the aggregate is decoded into a profile of its
+        own which is merged with Profile.merge, so nodes are matched by frame, runnable counts and thread counters are
+        summed, line ranges are widened and the time range is the union of both.
+
+        :param payload: bytes produced by encode()
+        :param profile: the Profile in which the aggregate is merged
+        """
+        aggregate = json.loads(payload.decode("utf-8"))
+        decoded = Profile(profiling_group_name=profile.profiling_group_name,
+                          sampling_interval_seconds=profile.sampling_interval_ms / 1000,
+                          host_weight=profile.host_weight, start=aggregate["start"],
+                          agent_debug_info=profile.agent_debug_info)
+        graph_nodes = [decoded.callgraph]
+        for parent_index, frame_name, class_name, file_path, start_line, end_line, runnable_count, cpu_time_seconds, \
+                thread_state_counts in aggregate["nodes"]:
+            node = graph_nodes[parent_index].update_current_node_and_get_child(
+                Frame(name=frame_name, class_name=class_name, line_no=start_line, file_path=file_path))
+            node._maybe_update_line_no(end_line)
+            if runnable_count:
+                node.increase_runnable_count(runnable_count)
+            if cpu_time_seconds:
+                node.increase_cpu_time(cpu_time_seconds)
+            if thread_state_counts:
+                for thread_state, count in thread_state_counts.items():
+                    node.increase_thread_state_count(thread_state, count)
+            graph_nodes.append(node)
+
+        decoded.total_sample_count = aggregate["sampleCount"]
+        decoded.total_seen_threads_count = aggregate["seenThreadsCount"]
+        decoded.total_attempted_sample_threads_count = aggregate["attemptedSampleThreadsCount"]
+        decoded.total_seen_tasks_count = aggregate.get("seenTasksCount", 0)
+        decoded.total_attempted_sample_tasks_count = aggregate.get("attemptedSampleTasksCount", 0)
+        decoded.has_cpu_time = aggregate.get("hasCpuTime", False)
+        decoded.has_thread_states = aggregate.get("hasThreadStates", False)
+        end = aggregate.get("end")
+        if end is not None and end > decoded.start:
+            decoded.end = end
+        # the cpu time of the other process is not part of the aggregate, only the one of this process is reported
+        decoded.cpu_time_seconds = None
+        profile.merge(decoded)
@@ -0,0 +1,66 @@
+import io
+import logging
+import socket
+
+from codeguru_profiler_agent.reporter.reporter import Reporter
+from codeguru_profiler_agent.metrics.with_timer import with_timer
+from codeguru_profiler_agent.socket_reporter.profile_aggregate_encoder import ProfileAggregateEncoder
+from codeguru_profiler_agent.utils.log_exception import log_exception
+
+logger = logging.getLogger(__name__)
+
+SOCKET_TIMEOUT_SECONDS = 5
+
+
+class SocketReporter(Reporter):
+    """
+    Ships profiles as compact aggregates to an AggregationServer listening on a Unix domain socket on the same host.
+    This is used by worker processes (e.g. gunicorn workers) so that only the aggregating process pays the cost of
+    encoding and submitting a profile to the CodeGuru Profiler service.
+    """
+
+    def __init__(self, environment=dict()):
+        """
+        :param environment: dependency container dictionary for the current profiler
+        :param aggregation_socket_path: (required inside environment) path of the Unix domain socket the
+            AggregationServer listens on
+        :param profile_aggregate_encoder: (inside environment) encoder for the aggregates;
+            default ProfileAggregateEncoder
+        """
+        self._socket_path = environment["aggregation_socket_path"]
+        self._profile_aggregate_encoder = \
+            environment.get("profile_aggregate_encoder") or ProfileAggregateEncoder()
+        self.timer = environment.get("timer")
+
+    def setup(self):
+        """
+        Socket reporter has static configuration, no expensive resources to be initialized.
+        """
+        pass
+
+    def refresh_configuration(self):
+        """
+        Socket reporter has static configuration, no refresh. The aggregating process is the one calling the backend.
+        """
+        pass
+
+    @with_timer("reportToAggregationServer", measurement="wall-clock-time")
+    def report(self, profile):
+        """
+        Sends the profile aggregate to the aggregation server, one connection per report.
+
+        :param profile: Profile to be encoded and sent
+        :return: True if the aggregate was sent successfully; False otherwise.
+        """
+        try:
+            payload = io.BytesIO()
+            self._profile_aggregate_encoder.encode(profile=profile, output_stream=payload)
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.settimeout(SOCKET_TIMEOUT_SECONDS)
+                connection.connect(self._socket_path)
+                connection.sendall(payload.getvalue())
+            logger.info("Sent profile aggregate to '{}'".format(self._socket_path))
+            return True
+        except Exception as e:
+            log_exception(logger, "Failed to send profile aggregate to '{}': {}".format(self._socket_path, str(e)))
+            return False
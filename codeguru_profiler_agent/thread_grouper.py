@@ -0,0 +1,44 @@
+import re
+
+from codeguru_profiler_agent.model.frame import Frame
+
+THREAD_GROUP_FRAME_FORMAT = "<thread-group:{}>"
+# numeric suffixes that threading, executors and servers append to the names of their threads, e.g.
+# ThreadPoolExecutor-0_12, Thread-3 (worker) or kafka-consumer-2; numbers inside the name, e.g. s3-uploader, are kept
+THREAD_NAME_NUMBERS = re.compile(r"(?:[-_.:#]?\d)+(?=(?: \([^)]*\))?$)")
+
+
+class ThreadGrouper:
+    """
+    Groups threads by their name with numeric suffixes removed, so that all the threads of a pool end up in the same
+    group, e.g. ThreadPoolExecutor-0_12 and ThreadPoolExecutor-1_3 are both in the ThreadPoolExecutor group.
+
+    The group frame of each thread is cached by thread ident so the name is only normalized again when the thread is
+    renamed or its ident is reused by a new thread with a different name.
+    """
+
+    def __init__(self):
+        self._group_frames = {}
+
+    def group_frame(self, thread_id, thread_name):
+        """
+        :returns: the <thread-group:NAME> frame of the thread
+        """
+        cached = self._group_frames.get(thread_id)
+        if cached is not None and cached[0] == thread_name:
+            return cached[1]
+        group_frame = Frame(name=THREAD_GROUP_FRAME_FORMAT.format(self.group_name(thread_name)))
+        self._group_frames[thread_id] = (thread_name, group_frame)
+        return group_frame
+
+    @staticmethod
+    def group_name(thread_name):
+        group_name = THREAD_NAME_NUMBERS.sub("", thread_name, count=1).strip()
+        return group_name or thread_name
+
+    def forget_threads_other_than(self, thread_ids):
+        """
+        Drops the cached groups of threads that are not alive anymore so that the cache does not grow forever.
+        """
+        for thread_id in self._group_frames.keys() - set(thread_ids):
+            del self._group_frames[thread_id]
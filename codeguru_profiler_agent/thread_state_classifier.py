@@ -0,0 +1,104 @@
+"""
+This module tags sampled stacks with the state the thread was most likely in, based on the frames at the top of its
+stack, as Python does not expose the state of a thread.
+"""
+import importlib
+import logging
+
+from codeguru_profiler_agent.sampling_utils import TIME_SLEEP_FRAME, QUEUE_BLOCKING_GET_FRAME
+
+logger = logging.getLogger(__name__)
+
+RUNNABLE = "RUNNABLE"
+BLOCKED = "BLOCKED"
+IDLE = "IDLE"
+THREAD_STATES = (RUNNABLE, BLOCKED, IDLE)
+
+# Blocking calls are implemented in C so they never show up in the stack; what we see on top of the stack is the
+# Python function calling them. Those functions are listed here as "module:qualified name" so that the lookup table
+# can be built from their actual code objects.
+IDLE_FUNCTIONS = (
+    "queue:Queue.get",
+    "selectors:SelectSelector.select",
+    "selectors:_PollLikeSelector.select",
+    "selectors:KqueueSelector.select",
+    "socket:socket.accept",
+)
+BLOCKED_FUNCTIONS = (
+    "threading:Condition.wait",
+    "threading:Thread._wait_for_tstate_lock",
+    "socket:SocketIO.readinto",
+    "socket:create_connection",
+    "socket:socket._sendfile_use_send",
+    "ssl:SSLSocket.read",
+    "ssl:SSLSocket.write",
+    "ssl:SSLSocket.do_handshake",
+    "ssl:SSLSocket.recv",
+    "ssl:SSLSocket.recv_into",
+    "ssl:SSLSocket.sendall",
+    "subprocess:Popen._wait",
+    "subprocess:Popen._communicate",
+)
+SYNTHETIC_FRAME_STATES = {
+    TIME_SLEEP_FRAME.name: IDLE,
+    QUEUE_BLOCKING_GET_FRAME.name: IDLE
+}
+
+# Waiting functions call a few helpers of their own (e.g. Queue.get calls Condition.wait), so we look a few frames
+# below the top of the stack.
+DEFAULT_MAX_CLASSIFIED_FRAMES = 3
+
+
+class ThreadStateClassifier:
+    def __init__(self, idle_functions=IDLE_FUNCTIONS, blocked_functions=BLOCKED_FUNCTIONS,
+                 max_classified_frames=DEFAULT_MAX_CLASSIFIED_FRAMES):
+        """
+        :param idle_functions: functions a thread waiting for work is blocked in, as "module:qualified name"
+        :param blocked_functions: functions a thread waiting for I/O or for a lock is blocked in, as
+            "module:qualified name"
+        :param max_classified_frames: how many frames from the top of the stack are looked at
+        """
+        self._max_classified_frames = max_classified_frames
+        self._idle_code_keys = self._build_code_keys(idle_functions)
+        self._blocked_code_keys = self._build_code_keys(blocked_functions)
+
+    def classify(self, stack):
+        """
+        Returns the state of the thread the stack was sampled from: IDLE if it is waiting for work (sleeping, waiting on
+        a queue or in an event loop), BLOCKED if it is waiting for I/O or a lock and RUNNABLE otherwise.
+        Idle functions take precedence over blocked ones as they usually wait through a lock, e.g. Queue.get.
+
+        :param stack: list of Frame in bottom to top order
+        """
+        top_frames = stack[-self._max_classified_frames:]
+        state = RUNNABLE
+        for frame in top_frames:
+            synthetic_frame_state = SYNTHETIC_FRAME_STATES.get(frame.name)
+            if synthetic_frame_state is not None and frame.file_path is None:
+                return synthetic_frame_state
+            key = (frame.file_path, frame.name)
+            if key in self._idle_code_keys:
+                return IDLE
+            if key in self._blocked_code_keys:
+                state = BLOCKED
+        return state
+
+    @staticmethod
+    def _build_code_keys(functions):
+        """
+        Frames only keep the file and the name of their code object, so the table is keyed on those.
+        Functions that do not exist in this Python version or platform are ignored.
+        """
+        code_keys = set()
+        for function in functions:
+            module_name, qualified_name = function.split(":")
+            try:
+                target = importlib.import_module(module_name)
+                for attribute in qualified_name.split("."):
+                    target = getattr(target, attribute)
+                code = target.__code__
+            except (ImportError, AttributeError):
+                logger.debug("Could not find {} for thread state classification".format(function))
+                continue
+            code_keys.add((code.co_filename, code.co_name))
+        return code_keys
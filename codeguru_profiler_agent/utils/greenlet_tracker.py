@@ -0,0 +1,93 @@
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+MAX_LISTING_ATTEMPTS = 100
+
+
+class GreenletTracker:
+    """
+    Keeps track of the greenlets (e.g. gevent greenlets) running in the thread that started the tracker, so that the
+    suspended ones can be sampled as well: only the greenlet currently running in a thread shows up in
+    sys._current_frames().
+
+    Greenlets are recorded from greenlet's trace hook when they are switched to, and only weakly referenced so that the
+    tracker does not keep finished greenlets alive nor needs to scan the heap with gc.
+    """
+
+    def __init__(self, greenlet_module=None):
+        """
+        :param greenlet_module: the greenlet module; default is importing greenlet, which is an optional dependency
+        """
+        self._greenlet_module = greenlet_module
+        self._greenlets = weakref.WeakSet()
+        self._previous_trace = None
+        self._started = False
+        self._thread_id = None
+
+    @staticmethod
+    def is_supported():
+        try:
+            import greenlet  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def start(self):
+        """
+        Installs the trace hook for the current thread, chained with any hook that was already installed.
+        """
+        if self._started:
+            return
+        if self._greenlet_module is None:
+            import greenlet
+            self._greenlet_module = greenlet
+        self._greenlets.add(self._greenlet_module.getcurrent())
+        self._previous_trace = self._greenlet_module.settrace(self._trace)
+        self._thread_id = threading.get_ident()
+        self._started = True
+
+    def stop(self):
+        """
+        Puts back the trace hook that was installed before start(). The trace hook of greenlet is per thread, so this
+        does nothing when called from another thread than the one that started the tracker.
+        """
+        if not self._started:
+            return
+        if threading.get_ident() != self._thread_id:
+            logger.debug("The greenlet tracker can only be stopped from the thread that started it.")
+            return
+        self._greenlet_module.settrace(self._previous_trace)
+        self._previous_trace = None
+        self._started = False
+
+    def suspended_greenlets(self):
+        """
+        Returns the (greenlet, frame) pairs of the tracked greenlets that are suspended. Running greenlets are left out
+        as they are part of the stack of their thread, and so are finished greenlets, which have no frame.
+        """
+        for _ in range(MAX_LISTING_ATTEMPTS):
+            try:
+                greenlets = list(self._greenlets)
+                break
+            except RuntimeError:
+                # the set changed size because a greenlet was switched to in the meantime
+                continue
+        else:
+            logger.debug("Could not list the tracked greenlets, they are switching too often")
+            return []
+        suspended = []
+        for greenlet in greenlets:
+            frame = greenlet.gr_frame
+            if frame is not None:
+                suspended.append((greenlet, frame))
+        return suspended
+
+    def _trace(self, event, args):
+        if event in ("switch", "throw"):
+            _, target = args
+            self._greenlets.add(target)
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
@@ -0,0 +1,34 @@
+import bisect
+
+
+class RoundRobinSelector:
+    def __init__(self, key=None):
+        """
+        Selects a bounded number of items out of a changing collection (e.g. threads) so that every item that stays
+        in the collection is selected within ceil(len(items) / max_count) calls, which random sampling cannot
+        guarantee. Items are ordered by key and each call resumes after the last item selected by the previous one, so
+        items appearing or disappearing between calls do not reset the rotation.
+
+        :param key: function returning an orderable key for each item, e.g. the thread ident; default is the item itself
+        """
+        self._key = key or (lambda item: item)
+        self._last_selected_key = None
+
+    def select(self, items, max_count):
+        """
+        :param items: the items to select from
+        :param max_count: the max number of items to select
+        :returns: a list of at most max_count items
+        """
+        if len(items) <= max_count:
+            return list(items)
+        keyed_items = sorted(((self._key(item), item) for item in items), key=lambda keyed_item: keyed_item[0])
+        start = 0
+        if self._last_selected_key is not None:
+            keys = [key for key, _ in keyed_items]
+            start = bisect.bisect_right(keys, self._last_selected_key)
+        selected = keyed_items[start:start + max_count]
+        if len(selected) < max_count:
+            selected += keyed_items[:max_count - len(selected)]
+        self._last_selected_key = selected[-1][0]
+        return [item for _, item in selected]
@@ -0,0 +1,62 @@
+import sys
+import threading
+import time
+
+
+class ThreadCpuClock:
+    """
+    Measures how much cpu time each thread spent between two consecutive samples, using the per-thread cpu clocks
+    exposed by pthread (see time.pthread_getcpuclockid). This is only supported on Linux.
+    """
+
+    def __init__(self, get_cpu_clock_id=None, clock_gettime=None, is_thread_alive=None):
+        """
+        :param get_cpu_clock_id: function returning the cpu clock id of a thread from its ident;
+            default is time.pthread_getcpuclockid
+        :param clock_gettime: function returning the time in seconds of a given clock; default is time.clock_gettime
+        :param is_thread_alive: function returning True if the thread of the given ident has not terminated;
+            default checks that the thread is still registered in the threading module
+        """
+        self._get_cpu_clock_id = get_cpu_clock_id or time.pthread_getcpuclockid
+        self._clock_gettime = clock_gettime or time.clock_gettime
+        self._is_thread_alive = is_thread_alive or ThreadCpuClock._is_registered_thread
+        self._last_cpu_time_seconds = {}
+
+    @staticmethod
+    def is_supported():
+        return sys.platform.startswith("linux") and hasattr(time, "pthread_getcpuclockid")
+
+    def cpu_time_since_last_sample(self, thread_id):
+        """
+        Returns the cpu time in seconds the thread spent since the last time this was called for the same thread.
+        The first call for a given thread returns 0 as we do not know when its cpu time was spent.
+        It also returns 0 for a thread that terminated since it was listed, without reading its clock: the behaviour of
+        pthread_getcpuclockid on a thread that was joined or detached is undefined.
+        """
+        try:
+            if not self._is_thread_alive(thread_id):
+                self._last_cpu_time_seconds.pop(thread_id, None)
+                return 0.0
+            cpu_time_seconds = self._clock_gettime(self._get_cpu_clock_id(thread_id))
+        except Exception:
+            # the thread terminated in the meantime
+            self._last_cpu_time_seconds.pop(thread_id, None)
+            return 0.0
+        previous_cpu_time_seconds = self._last_cpu_time_seconds.get(thread_id)
+        self._last_cpu_time_seconds[thread_id] = cpu_time_seconds
+        if previous_cpu_time_seconds is None:
+            return 0.0
+        return max(0.0, cpu_time_seconds - previous_cpu_time_seconds)
+
+    @staticmethod
+    def _is_registered_thread(thread_id):
+        # threads are unregistered when their function returns, before the native thread actually ends
+        return thread_id in threading._active
+
+    def forget_threads_other_than(self, thread_ids):
+        """
+        Drops the last cpu time of threads that are not alive anymore so that this does not grow forever, and so that
+        a new thread reusing the same ident does not get a wrong delta.
+        """
+        for thread_id in self._last_cpu_time_seconds.keys() - set(thread_ids):
+            del self._last_cpu_time_seconds[thread_id]
@@ -0,0 +1,38 @@
+"""
+Runs the microbenchmarks and prints or stores their results as JSON, e.g.
+
+    python -m test.benchmark --threads 100 --depth 50 --fan-out 4 --output benchmark-$(git rev-parse --short HEAD).json
+
+Results of two commits can then be diffed to spot regressions; only compare results from the same host.
+"""
+import argparse
+import json
+import logging
+
+from test.benchmark.benchmarks import run_benchmarks
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m test.benchmark", description="Benchmarks the agent hot paths.")
+    parser.add_argument("--threads", type=int, default=50, help="number of threads in the farm (default: 50)")
+    parser.add_argument("--depth", type=int, default=30, help="depth of the stack of each thread (default: 30)")
+    parser.add_argument("--fan-out", type=int, default=3,
+                        help="number of distinct functions called at each level (default: 3)")
+    parser.add_argument("--iterations", type=int, default=100, help="calls per benchmark (default: 100)")
+    parser.add_argument("-o", "--output", help="file to write the JSON results to (default: standard output)")
+    arguments = parser.parse_args(args)
+
+    # the agent logs at debug level under test/, which would slow down the benchmarks
+    logging.getLogger("codeguru_profiler_agent").setLevel(logging.WARNING)
+    results = run_benchmarks(threads=arguments.threads, depth=arguments.depth, fan_out=arguments.fan_out,
+                             iterations=arguments.iterations)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
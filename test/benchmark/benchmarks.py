@@ -0,0 +1,173 @@
+"""
+Microbenchmarks of the hot paths of the agent: sampling, aggregating and encoding, run against a ThreadFarm.
+
+Each benchmark reports the time per call and per sampled frame, so results stay comparable when the shape of the farm
+changes, and the peak RSS of the process is reported once for the whole run as it never goes down.
+"""
+import io
+import platform
+import shutil
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+
+from datetime import timedelta
+from pathlib import Path
+
+from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo, ErrorsMetadata
+from codeguru_profiler_agent.agent_metadata.agent_metadata import AgentMetadata, DefaultFleetInfo
+from codeguru_profiler_agent.metrics.timer import Timer
+from codeguru_profiler_agent.model.memory_counter import MemoryCounter
+from codeguru_profiler_agent.model.profile import Profile
+from codeguru_profiler_agent.profiler import Profiler, DEFAULT_REPORTING_INTERVAL, INITIAL_MINIMUM_REPORTING_INTERVAL
+from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+from codeguru_profiler_agent.sampler import Sampler
+from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder
+from test.benchmark.thread_farm import ThreadFarm
+
+BENCHMARK_PROFILING_GROUP_NAME = "benchmark"
+MAX_STACK_DEPTH = 1000
+# long enough for the cpu usage checks of the profiler to never stop the profiling command benchmark
+SAMPLING_INTERVAL = timedelta(minutes=1)
+
+
+def run_benchmarks(threads=50, depth=30, fan_out=3, iterations=100):
+    """
+    :returns: the results as a dictionary ready to be dumped as JSON
+    """
+    _set_agent_configuration()
+    with ThreadFarm(threads=threads, depth=depth, fan_out=fan_out):
+        samples = [Sampler(environment={"max_threads": threads + 10}).sample() for _ in range(iterations)]
+        frames_per_sample = sum(len(stack) for stack in samples[0].stacks)
+        benchmarks = {
+            "Sampler.sample": _benchmark_sampler(threads, iterations),
+            "Profile.add": _benchmark_profile_add(samples),
+            "MemoryCounter": _benchmark_memory_counter(samples),
+            "ProfileEncoder.encode": _benchmark_profile_encoder(samples),
+            "ProfilerRunner._profiling_command": _benchmark_profiling_command(threads, iterations),
+        }
+    for name, result in benchmarks.items():
+        frames = result.pop("frames_per_call", frames_per_sample)
+        result["nsPerCall"] = result["totalNs"] / result["calls"]
+        result["nsPerFrame"] = result["nsPerCall"] / frames if frames else None
+
+    return {
+        "commit": _current_commit(),
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"threads": threads, "depth": depth, "fanOut": fan_out, "iterations": iterations},
+        "framesPerSample": frames_per_sample,
+        "peakRssBytes": peak_rss_bytes(),
+        "benchmarks": benchmarks,
+    }
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _benchmark_sampler(threads, iterations):
+    sampler = Sampler(environment={"max_threads": threads + 10})
+    return _timed(sampler.sample, iterations)
+
+
+def _benchmark_profile_add(samples):
+    profile = _new_profile()
+    iterator = iter(samples)
+    return _timed(lambda: profile.add(next(iterator)), len(samples))
+
+
+def _benchmark_memory_counter(samples):
+    memory_counter = MemoryCounter()
+    frames = [frame for stack in samples[0].stacks for frame in stack]
+
+    def count_sample():
+        for frame in frames:
+            memory_counter.count_create_node(frame.name, frame.file_path, frame.class_name)
+            memory_counter.count_add_child()
+
+    return _timed(count_sample, len(samples))
+
+
+def _benchmark_profile_encoder(samples):
+    profile = _new_profile()
+    for sample in samples:
+        profile.add(sample)
+    encoder = ProfileEncoder(environment={"agent_metadata": AgentMetadata(fleet_info=DefaultFleetInfo())})
+    result = _timed(lambda: encoder.encode(profile=profile, output_stream=io.BytesIO()), 10)
+    # encoding walks each node of the call graph once
+    result["frames_per_call"] = _count_nodes(profile)
+    return result
+
+
+def _benchmark_profiling_command(threads, iterations):
+    temporary_directory = tempfile.mkdtemp()
+    try:
+        profiler = Profiler(
+            profiling_group_name=BENCHMARK_PROFILING_GROUP_NAME,
+            environment_override={
+                "reporting_mode": "file",
+                "file_prefix": str(Path(temporary_directory, "benchmark")),
+                "agent_metadata": AgentMetadata(fleet_info=DefaultFleetInfo()),
+                "sampling_interval": SAMPLING_INTERVAL,
+                "max_threads": threads + 10,
+                "max_stack_depth": MAX_STACK_DEPTH,
+            })
+        runner = profiler._profiler_runner
+        # the first execution sets the reporter up
+        runner._profiling_command()
+        return _timed(runner._profiling_command, iterations)
+    finally:
+        _set_agent_configuration()
+        shutil.rmtree(temporary_directory)
+
+
+def _timed(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return {"calls": calls, "totalNs": int((time.perf_counter() - start) * 1e9)}
+
+
+def _count_nodes(profile):
+    count = 0
+    nodes = [profile.callgraph]
+    while nodes:
+        node = nodes.pop()
+        count += 1
+        nodes.extend(node.children)
+    return count
+
+
+def _new_profile():
+    # the profile starts in the past as its end must be after its start, even for samples added right away
+    return Profile(profiling_group_name=BENCHMARK_PROFILING_GROUP_NAME,
+                   sampling_interval_seconds=SAMPLING_INTERVAL.total_seconds(), host_weight=1,
+                   start=int(time.time() * 1000) - 1000,
+                   agent_debug_info=AgentDebugInfo(ErrorsMetadata(), int(time.time() * 1000), Timer()))
+
+
+def _set_agent_configuration():
+    AgentConfiguration.set(AgentConfiguration(
+        should_profile=True,
+        sampling_interval=SAMPLING_INTERVAL,
+        reporting_interval=DEFAULT_REPORTING_INTERVAL,
+        minimum_time_reporting=INITIAL_MINIMUM_REPORTING_INTERVAL,
+        max_stack_depth=MAX_STACK_DEPTH,
+        cpu_limit_percentage=100))
+
+
+def _current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              cwd=str(Path(__file__).parent), check=True).stdout.decode().strip()  # nosec B603 B607
+    except (OSError, subprocess.CalledProcessError):
+        return None
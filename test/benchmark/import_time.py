@@ -0,0 +1,93 @@
+"""
+Measures the time it takes to import the modules loaded by the lambda layer handler during a cold start, with
+python -X importtime in fresh interpreters, and checks it against a budget, e.g.
+
+    python -m test.benchmark.import_time --budget-ms 10
+
+The handler module itself cannot be imported outside of lambda as it loads the customer handler on import, so the
+modules it imports are measured instead.
+
+The layer only contains the source code of the agent and lambda functions can not write the compiled bytecode to it,
+so the agent modules are compiled on each cold start: they are imported from a copy of the package without bytecode,
+which is never written, while the modules of the standard library are loaded from their bytecode like in lambda.
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess  # nosec B404
+import sys
+import tempfile
+
+from pathlib import Path
+
+# modules the lambda runtime bootstrap has already imported when it loads the handler, see
+# https://github.com/aws/aws-lambda-python-runtime-interface-client/blob/main/awslambdaric/bootstrap.py
+LAMBDA_RUNTIME_PRELOADED_MODULES = ("json", "logging", "os", "sys", "time", "traceback", "warnings")
+# the modules lambda_handler imports; lambda_handler itself loads the customer handler on import
+LAMBDA_HANDLER_IMPORTS = (
+    "codeguru_profiler_agent.aws_lambda.profiler_decorator",
+    "codeguru_profiler_agent.aws_lambda.lambda_context",
+)
+DEFAULT_BUDGET_MS = 10
+DEFAULT_RUNS = 7
+REPOSITORY_ROOT = Path(__file__).parent.parent.parent
+
+
+def measure_import_time_us(modules=LAMBDA_HANDLER_IMPORTS, preloaded_modules=LAMBDA_RUNTIME_PRELOADED_MODULES):
+    """
+    :returns: the cumulative import time in microseconds of each of the modules, imported in order in a new interpreter
+        after the preloaded modules; modules already imported before count for nothing
+    """
+    statements = ["import " + module for module in preloaded_modules + modules]
+    layer_directory = tempfile.mkdtemp()
+    try:
+        shutil.copytree(str(REPOSITORY_ROOT / "codeguru_profiler_agent"),
+                        str(Path(layer_directory) / "codeguru_profiler_agent"),
+                        ignore=shutil.ignore_patterns("__pycache__"))
+        completed = subprocess.run(  # nosec B603
+            [sys.executable, "-B", "-X", "importtime", "-c", "; ".join(statements)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=layer_directory, check=True)
+    finally:
+        shutil.rmtree(layer_directory)
+    return parse_import_times_us(completed.stderr.decode(), modules)
+
+
+def parse_import_times_us(importtime_output, modules):
+    """
+    Parses the "import time: self [us] | cumulative | imported package" lines printed by -X importtime.
+    """
+    import_times_us = {module: 0 for module in modules}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        columns = line[len("import time:"):].split("|")
+        module = columns[2].strip()
+        # nested imports are indented, only the top level imports are the ones we asked for
+        if module in import_times_us and columns[2].startswith(" " + module):
+            import_times_us[module] = int(columns[1])
+    return import_times_us
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m test.benchmark.import_time",
+                                     description="Checks the import time of the lambda layer handler.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="max median import time in milliseconds (default: {})".format(DEFAULT_BUDGET_MS))
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help="number of interpreters to measure (default: {})".format(DEFAULT_RUNS))
+    arguments = parser.parse_args(args)
+
+    totals_ms = [sum(measure_import_time_us().values()) / 1000 for _ in range(arguments.runs)]
+    median_ms = statistics.median(totals_ms)
+    print(json.dumps({
+        "modules": list(LAMBDA_HANDLER_IMPORTS),
+        "runsMs": totals_ms,
+        "medianMs": median_ms,
+        "budgetMs": arguments.budget_ms,
+    }, indent=2))
+    return 0 if median_ms <= arguments.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import json
+
+from test.benchmark.__main__ import main
+from test.benchmark.benchmarks import run_benchmarks
+
+
+class TestBenchmarks:
+    def test_it_reports_the_time_per_frame_of_each_benchmark(self):
+        results = run_benchmarks(threads=2, depth=5, fan_out=2, iterations=2)
+
+        assert results["framesPerSample"] > 0
+        assert set(results["benchmarks"].keys()) == {"Sampler.sample", "Profile.add", "MemoryCounter",
+                                                     "ProfileEncoder.encode", "ProfilerRunner._profiling_command"}
+        for result in results["benchmarks"].values():
+            assert result["nsPerFrame"] > 0
+
+    def test_it_writes_the_results_as_json(self, tmp_path):
+        output = tmp_path / "results.json"
+
+        main(["--threads", "2", "--depth", "5", "--iterations", "2", "--output", str(output)])
+
+        assert json.loads(output.read_text())["parameters"]["depth"] == 5
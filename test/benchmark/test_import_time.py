@@ -0,0 +1,22 @@
+from test.benchmark.import_time import main, parse_import_times_us
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       261 |        261 |     _datetime
+import time:      1292 |       1791 |   datetime
+import time:       959 |       4941 | codeguru_profiler_agent.aws_lambda.profiler_decorator
+"""
+
+
+class TestImportTime:
+    def test_it_parses_the_cumulative_import_time_of_top_level_imports(self):
+        assert parse_import_times_us(IMPORTTIME_OUTPUT, ("codeguru_profiler_agent.aws_lambda.profiler_decorator",
+                                                         "datetime")) == {
+            "codeguru_profiler_agent.aws_lambda.profiler_decorator": 4941,
+            "datetime": 0
+        }
+
+    def test_it_fails_when_over_budget(self):
+        assert main(["--budget-ms", "0", "--runs", "1"]) == 1
+
+    def test_it_succeeds_within_budget(self):
+        assert main(["--budget-ms", "100000", "--runs", "1"]) == 0
@@ -0,0 +1,65 @@
+import threading
+
+PARKED_TIMEOUT_SECONDS = 600
+
+
+class ThreadFarm:
+    """
+    Runs a farm of threads parked at the top of synthetic stacks, to be sampled by the benchmarks.
+
+    Each thread calls depth functions before parking; at each level the function called is one of fan_out distinct
+    functions, picked from the thread index and the level, so that the threads build a call graph with up to fan_out
+    children per node, as application threads running different code paths would.
+    """
+
+    def __init__(self, threads, depth, fan_out):
+        self.threads_count = threads
+        self.depth = depth
+        self.fan_out = fan_out
+        self.branches = [self._make_branch(index) for index in range(fan_out)]
+        self._ready = threading.Barrier(threads + 1)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        for index in range(self.threads_count):
+            thread = threading.Thread(name="benchmark-farm-{}".format(index), target=self._run, args=(index,),
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._ready.wait(PARKED_TIMEOUT_SECONDS)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def next_branch(self, path, depth):
+        return self.branches[(path * 7 + depth) % self.fan_out]
+
+    def park(self):
+        self._ready.wait(PARKED_TIMEOUT_SECONDS)
+        self._stop.wait(PARKED_TIMEOUT_SECONDS)
+
+    def _run(self, index):
+        self.next_branch(index, self.depth)(self, self.depth - 1, index)
+
+    @staticmethod
+    def _make_branch(index):
+        # each branch needs its own code object to show up as a distinct frame
+        namespace = {}
+        exec(  # nosec B102: the code is a constant template
+            "def branch_{}(farm, depth, path):\n"
+            "    if depth <= 0:\n"
+            "        return farm.park()\n"
+            "    return farm.next_branch(path, depth)(farm, depth - 1, path)\n".format(index),
+            namespace)
+        return namespace["branch_{}".format(index)]
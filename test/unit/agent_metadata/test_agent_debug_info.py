@@ -34,9 +34,25 @@ class TestAgentDebugInfo:
         serialized_json = subject.serialize_to_json()
         assert serialized_json["genericMetrics"] == {
             "metric1_timings_max": 12350000,
-            "metric1_timings_average": 12347500.0
+            "metric1_timings_average": 12347500.0,
+            "metric1_timings_p50": 12350000,
+            "metric1_timings_p90": 12350000,
+            "metric1_timings_p99": 12350000,
+            "metric1_timings_p999": 12350000
         }
 
+    def test_it_returns_the_percentiles_of_generic_metrics(self):
+        timer = Timer()
+        for _ in range(499):
+            timer.record("metric1", 0.001)
+        timer.record("metric1", 0.5)
+        subject = AgentDebugInfo(timer=timer)
+
+        generic_metrics = subject.serialize_to_json()["genericMetrics"]
+        assert 0.001 <= generic_metrics["metric1_timings_p50"] < 0.001 * 1.0625
+        assert 0.001 <= generic_metrics["metric1_timings_p99"] < 0.001 * 1.0625
+        assert generic_metrics["metric1_timings_p999"] == 0.5
+
 
 class TestErrorsMetadata:
     class TestSerializeToJson:
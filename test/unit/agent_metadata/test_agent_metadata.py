@@ -1,6 +1,14 @@
+import os
+import shutil
+import tempfile
+import time
+
 import pytest
+from unittest.mock import patch, MagicMock
 from codeguru_profiler_agent.agent_metadata.agent_metadata import look_up_fleet_info, AgentInfo, AgentMetadata
 from codeguru_profiler_agent.agent_metadata.aws_ec2_instance import AWSEC2Instance
+from codeguru_profiler_agent.agent_metadata.aws_fargate_task import AWSFargateTask
+from codeguru_profiler_agent.agent_metadata.fleet_info_cache import FleetInfoCache
 from codeguru_profiler_agent.agent_metadata.fleet_info import DefaultFleetInfo, http_get
 
 
@@ -28,6 +36,110 @@ class TestAgentMetadata:
 
                 assert subject == test_fleet_info
 
+        class TestWhenFetchersAreSlow:
+            def test_it_returns_the_preferred_fleet_info_found_within_the_deadline(self):
+                test_fleet_info = AWSEC2Instance(host_name="testHost", host_type="testType")
+
+                def slow_fetcher():
+                    time.sleep(5)
+                    return AWSEC2Instance(host_name="slowHost", host_type="testType")
+
+                start = time.monotonic()
+                subject = look_up_fleet_info(platform_metadata_fetchers=(slow_fetcher, lambda: test_fleet_info),
+                                             deadline_seconds=0.1)
+
+                assert subject == test_fleet_info
+                assert time.monotonic() - start < 1
+
+            def test_it_prefers_the_first_fetcher_when_both_answer(self):
+                first = AWSEC2Instance(host_name="firstHost", host_type="testType")
+                second = AWSEC2Instance(host_name="secondHost", host_type="testType")
+
+                def slower_first_fetcher():
+                    time.sleep(0.05)
+                    return first
+
+                subject = look_up_fleet_info(platform_metadata_fetchers=(slower_first_fetcher, lambda: second))
+
+                assert subject == first
+
+        class TestPlatformSniffing:
+            @pytest.fixture(autouse=True)
+            def around(self):
+                self.dmi_id_path = tempfile.mkdtemp()
+                self.ec2_fleet_info = AWSEC2Instance(host_name="testHost", host_type="testType")
+                self.fargate_fleet_info = AWSFargateTask(task_arn="testTaskArn", cpu_limit=1, memory_limit_in_mb=512)
+                with patch.object(AWSEC2Instance, "look_up_metadata", return_value=self.ec2_fleet_info) as ec2, \
+                        patch.object(AWSFargateTask, "look_up_metadata", return_value=self.fargate_fleet_info) as fargate:
+                    self.ec2_look_up = ec2
+                    self.fargate_look_up = fargate
+                    yield
+                shutil.rmtree(self.dmi_id_path)
+
+            def test_in_lambda_it_does_not_query_any_endpoint(self):
+                subject = look_up_fleet_info(env={"AWS_LAMBDA_FUNCTION_NAME": "test-function"},
+                                             dmi_id_path=self.dmi_id_path)
+
+                assert isinstance(subject, DefaultFleetInfo)
+                self.ec2_look_up.assert_not_called()
+                self.fargate_look_up.assert_not_called()
+
+            def test_on_fargate_it_only_queries_the_task_metadata_endpoint(self):
+                subject = look_up_fleet_info(env={"ECS_CONTAINER_METADATA_URI_V4": "http://169.254.170.2/v4/test",
+                                                  "AWS_EXECUTION_ENV": "AWS_ECS_FARGATE"},
+                                             dmi_id_path=self.dmi_id_path)
+
+                assert subject == self.fargate_fleet_info
+                self.fargate_look_up.assert_called_once_with(url="http://169.254.170.2/v4/test")
+                self.ec2_look_up.assert_not_called()
+
+            def test_it_does_not_query_ec2_metadata_when_the_hardware_vendor_is_not_amazon(self):
+                self._write_dmi_file("sys_vendor", "QEMU\n")
+
+                subject = look_up_fleet_info(env={}, dmi_id_path=self.dmi_id_path)
+
+                assert isinstance(subject, DefaultFleetInfo)
+                self.ec2_look_up.assert_not_called()
+
+            def test_it_queries_ec2_metadata_when_the_hardware_vendor_is_amazon(self):
+                self._write_dmi_file("sys_vendor", "Amazon EC2\n")
+
+                subject = look_up_fleet_info(env={}, dmi_id_path=self.dmi_id_path)
+
+                assert subject == self.ec2_fleet_info
+
+            def test_it_queries_ec2_metadata_when_the_hardware_vendor_is_unknown(self):
+                subject = look_up_fleet_info(env={}, dmi_id_path=os.path.join(self.dmi_id_path, "missing"))
+
+                assert subject == self.ec2_fleet_info
+
+            def _write_dmi_file(self, file_name, content):
+                with open(os.path.join(self.dmi_id_path, file_name), "w") as dmi_file:
+                    dmi_file.write(content)
+
+        class TestWithCache:
+            def test_it_returns_the_cached_fleet_info_without_fetching(self):
+                cached_fleet_info = AWSEC2Instance(host_name="cachedHost", host_type="testType")
+                fleet_info_cache = MagicMock(name="fleet_info_cache", spec=FleetInfoCache)
+                fleet_info_cache.load.return_value = cached_fleet_info
+                fetcher = MagicMock(name="fetcher")
+
+                subject = look_up_fleet_info(platform_metadata_fetchers=(fetcher,), fleet_info_cache=fleet_info_cache)
+
+                assert subject is cached_fleet_info
+                fetcher.assert_not_called()
+
+            def test_it_saves_the_fleet_info_it_looked_up(self):
+                test_fleet_info = AWSEC2Instance(host_name="testHost", host_type="testType")
+                fleet_info_cache = MagicMock(name="fleet_info_cache", spec=FleetInfoCache)
+                fleet_info_cache.load.return_value = None
+
+                subject = look_up_fleet_info(platform_metadata_fetchers=(lambda: test_fleet_info,),
+                                             fleet_info_cache=fleet_info_cache)
+
+                assert subject == test_fleet_info
+                fleet_info_cache.save.assert_called_once_with(test_fleet_info)
+
     class TestAgentMetadataInit:
         class TestWhenFleetInfoIsNotAvailable:
             def test_it_returns_default_agent_metadata(self):
@@ -37,6 +149,21 @@ class TestAgentMetadata:
                 assert subject.fleet_info is not None
                 assert subject.runtime_version[0] == "3"
 
+    class TestSerializeToJson:
+        def test_it_describes_each_profile_it_is_serialized_for(self):
+            subject = AgentMetadata(fleet_info=DefaultFleetInfo())
+
+            def serialize(duration_ms, total_sample_count):
+                return subject.serialize_to_json(sample_weight=1.0, duration_ms=duration_ms, cpu_time_seconds=1.0,
+                                                 average_num_threads=1.0, overhead_ms=0, memory_usage_mb=1,
+                                                 total_sample_count=total_sample_count)
+
+            whole_profile = serialize(duration_ms=181000, total_sample_count=180)
+            time_slice = serialize(duration_ms=60000, total_sample_count=60)
+
+            assert (whole_profile["durationInMs"], whole_profile["numTimesSampled"]) == (181000, 180)
+            assert (time_slice["durationInMs"], time_slice["numTimesSampled"]) == (60000, 60)
+
     class TestAgentInfo:
         class TestEqual:
             def test_it_does_equality_correctly(self):
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+from test.pytestutils import before
+
+from codeguru_profiler_agent.agent_metadata.aws_ec2_instance import AWSEC2Instance
+from codeguru_profiler_agent.agent_metadata.aws_fargate_task import AWSFargateTask
+from codeguru_profiler_agent.agent_metadata.fleet_info import DefaultFleetInfo
+from codeguru_profiler_agent.agent_metadata.fleet_info_cache import FleetInfoCache
+
+
+class TestFleetInfoCache:
+    @before
+    def before(self):
+        self.temporary_directory = tempfile.mkdtemp()
+        self.boot_id_path = os.path.join(self.temporary_directory, "boot_id")
+        self._write_boot_id("first-boot")
+        self.cache_file_path = os.path.join(self.temporary_directory, "fleet-info.json")
+        self.subject = FleetInfoCache(file_path=self.cache_file_path, boot_id_path=self.boot_id_path)
+        yield
+        shutil.rmtree(self.temporary_directory)
+
+    def test_it_returns_none_when_nothing_was_saved(self):
+        assert self.subject.load() is None
+
+    def test_it_loads_the_saved_ec2_instance(self):
+        self.subject.save(AWSEC2Instance(host_name="testHost", host_type="testType"))
+
+        loaded = self.subject.load()
+
+        assert loaded.serialize_to_map() == AWSEC2Instance(host_name="testHost", host_type="testType").serialize_to_map()
+
+    def test_it_loads_the_saved_fargate_task(self):
+        fargate_task = AWSFargateTask(task_arn="testTaskArn", cpu_limit=2, memory_limit_in_mb=1024)
+        self.subject.save(fargate_task)
+
+        assert self.subject.load().serialize_to_map() == fargate_task.serialize_to_map()
+
+    def test_it_only_lets_the_current_user_read_the_cache_file(self):
+        self.subject.save(AWSEC2Instance(host_name="testHost", host_type="testType"))
+
+        assert os.stat(self.cache_file_path).st_mode & 0o077 == 0
+
+    def test_it_ignores_the_cache_after_a_reboot(self):
+        self.subject.save(AWSEC2Instance(host_name="testHost", host_type="testType"))
+        self._write_boot_id("second-boot")
+
+        assert self.subject.load() is None
+
+    def test_it_does_not_save_the_default_fleet_info(self):
+        self.subject.save(DefaultFleetInfo())
+
+        assert not os.path.exists(self.cache_file_path)
+
+    def test_it_ignores_a_corrupted_cache_file(self):
+        with open(self.cache_file_path, "w") as cache_file:
+            cache_file.write("{not json")
+
+        assert self.subject.load() is None
+
+    def test_it_is_disabled_when_the_boot_id_is_not_available(self):
+        subject = FleetInfoCache(file_path=self.cache_file_path,
+                                 boot_id_path=os.path.join(self.temporary_directory, "missing"))
+        subject.save(AWSEC2Instance(host_name="testHost", host_type="testType"))
+
+        assert subject.load() is None
+        assert not os.path.exists(self.cache_file_path)
+
+    def _write_boot_id(self, boot_id):
+        with open(self.boot_id_path, "w") as boot_id_file:
+            boot_id_file.write(boot_id + "\n")
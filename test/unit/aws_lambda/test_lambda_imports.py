@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+import pytest
+
+import codeguru_profiler_agent
+from codeguru_profiler_agent.profiler import Profiler
+from test.benchmark.import_time import LAMBDA_HANDLER_IMPORTS
+
+SLOW_MODULES = ("boto3", "botocore", "unittest.mock", "urllib.request", "uuid", "datetime",
+                "codeguru_profiler_agent.profiler", "codeguru_profiler_agent.agent_metadata.aws_lambda")
+
+
+class TestLambdaImports:
+    @pytest.mark.parametrize("slow_module", SLOW_MODULES)
+    def test_lambda_handler_imports_do_not_import_slow_modules(self, slow_module):
+        code = "; ".join(["import sys"] + ["import " + module for module in LAMBDA_HANDLER_IMPORTS]
+                         + ["print({!r} in sys.modules)".format(slow_module)])
+
+        output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True).stdout
+
+        assert output.strip() == b"False"
+
+    def test_public_classes_are_imported_on_first_access(self):
+        assert codeguru_profiler_agent.Profiler is Profiler
+
+    def test_it_raises_attribute_error_for_unknown_attributes(self):
+        with pytest.raises(AttributeError):
+            codeguru_profiler_agent.NotAnAttribute
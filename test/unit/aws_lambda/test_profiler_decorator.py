@@ -2,11 +2,13 @@ import pytest
 import time
 import codeguru_profiler_agent.aws_lambda.profiler_decorator
 
+from datetime import timedelta
 from unittest.mock import MagicMock
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
 from codeguru_profiler_agent import with_lambda_profiler
 from codeguru_profiler_agent import Profiler
-from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext
+import codeguru_profiler_agent.aws_lambda.lambda_context
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext, COLD_INVOKE_PHASE, WARM_INVOKE_PHASE
 
 
 class TestWithLambdaProfiler:
@@ -66,6 +68,85 @@ class TestWithLambdaProfiler:
         assert (self.counter == 2)
 
 
+class TestLambdaPhase:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.mock_profiler = MagicMock(name="profiler", spec=Profiler)
+        self.mock_profiler.start.return_value = True
+        self.context = MagicMock()
+        codeguru_profiler_agent.aws_lambda.profiler_decorator.clear_static_profiler()
+        codeguru_profiler_agent.aws_lambda.lambda_context._singleton = None
+        self.phases = []
+
+        @with_lambda_profiler(profiler_factory=lambda *args, **kwargs: self.mock_profiler)
+        def handler_function(event, context):
+            self.phases.append(LambdaContext.get().phase)
+
+        self.handler = handler_function
+        yield
+        codeguru_profiler_agent.aws_lambda.profiler_decorator.clear_static_profiler()
+        codeguru_profiler_agent.aws_lambda.lambda_context._singleton = None
+
+    def test_there_is_no_phase_before_the_first_invocation(self):
+        assert LambdaContext.get().phase is None
+
+    def test_the_first_invocation_is_cold_and_the_next_ones_are_warm(self):
+        self.handler({}, self.context)
+        self.handler({}, self.context)
+        self.handler({}, self.context)
+
+        assert self.phases == [COLD_INVOKE_PHASE, WARM_INVOKE_PHASE, WARM_INVOKE_PHASE]
+
+
+class TestFlushAtEndOfInvocation:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.mock_profiler = MagicMock(name="profiler", spec=Profiler)
+        self.mock_profiler.start.return_value = True
+        self.context = MagicMock()
+        self.context.get_remaining_time_in_millis.return_value = 10000
+        codeguru_profiler_agent.aws_lambda.profiler_decorator.clear_static_profiler()
+        yield
+        codeguru_profiler_agent.aws_lambda.profiler_decorator.clear_static_profiler()
+
+    def handler(self, **kwargs):
+        @with_lambda_profiler(profiler_factory=lambda *args, **kwargs: self.mock_profiler, **kwargs)
+        def handler_function(event, context):
+            return "response"
+
+        return handler_function
+
+    def test_it_reports_after_the_function_returns(self):
+        assert self.handler(flush_at_end_of_invocation=True)({}, self.context) == "response"
+
+        self.mock_profiler.report_if_due.assert_called_once()
+
+    def test_it_does_not_report_by_default(self):
+        self.handler(env={})({}, self.context)
+
+        self.mock_profiler.report_if_due.assert_not_called()
+
+    def test_it_is_enabled_by_the_environment_variable(self):
+        self.handler(env={"AWS_CODEGURU_PROFILER_FLUSH_AT_END_OF_INVOCATION": "true"})({}, self.context)
+
+        self.mock_profiler.report_if_due.assert_called_once()
+
+    def test_it_does_not_report_when_the_invocation_is_about_to_time_out(self):
+        self.context.get_remaining_time_in_millis.return_value = 100
+
+        self.handler(flush_at_end_of_invocation=True)({}, self.context)
+
+        self.mock_profiler.report_if_due.assert_not_called()
+
+    def test_it_does_not_wait_for_the_report_longer_than_the_budget(self):
+        self.mock_profiler.report_if_due.side_effect = lambda: time.sleep(1)
+
+        start = time.time()
+        self.handler(flush_at_end_of_invocation=True, max_flush_wait_ms=50)({}, self.context)
+
+        assert time.time() - start < 0.5
+
+
 class TestWithParameters:
     @pytest.fixture(autouse=True)
     def around(self):
@@ -112,4 +193,4 @@ class TestWithParameters:
 
     def test_last_call_duration_is_set_in_lambda_context_singleton(self):
         self.handler({}, self.context)
-        assert LambdaContext.get().last_execution_duration
+        assert LambdaContext.get().last_execution_duration > timedelta()
@@ -0,0 +1,37 @@
+from codeguru_profiler_agent.file_reporter.call_graph_walker import walk_call_graph, ENTER, LEAVE
+from codeguru_profiler_agent.model.call_graph_node import CallGraphNode
+from codeguru_profiler_agent.model.frame import Frame
+
+
+def _call_graph(*stacks):
+    root = CallGraphNode("ALL", class_name=None, file_path=None, line_no=None)
+    for stack in stacks:
+        node = root
+        for frame_name in stack:
+            node = node.update_current_node_and_get_child(Frame(frame_name))
+    return root
+
+
+class TestWalkCallGraph:
+    def test_it_enters_and_leaves_each_node_depth_first(self):
+        call_graph = _call_graph(["bottom", "top"], ["bottom", "other_top"])
+
+        events = [(event, node.frame_name, [path_node.frame_name for path_node in path])
+                  for event, node, path in walk_call_graph(call_graph)]
+
+        assert events == [
+            (ENTER, "bottom", ["bottom"]),
+            (ENTER, "top", ["bottom", "top"]),
+            (LEAVE, "top", ["bottom", "top"]),
+            (ENTER, "other_top", ["bottom", "other_top"]),
+            (LEAVE, "other_top", ["bottom", "other_top"]),
+            (LEAVE, "bottom", ["bottom"])
+        ]
+
+    def test_it_walks_stacks_deeper_than_the_recursion_limit(self):
+        call_graph = _call_graph(["frame{}".format(i) for i in range(5000)])
+
+        assert sum(1 for event, _, _ in walk_call_graph(call_graph) if event is ENTER) == 5000
+
+    def test_it_does_not_visit_the_root(self):
+        assert list(walk_call_graph(_call_graph())) == []
@@ -1,3 +1,5 @@
+import datetime
+import gzip
 import tempfile
 import pytest
 import shutil
@@ -9,6 +11,7 @@ from pathlib import Path
 from codeguru_profiler_agent.file_reporter.file_reporter import FileReporter
 from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder
 from test.help_utils import FILE_PREFIX
+from test.unit.sdk_reporter.test_sdk_profile_encoder import example_profile
 
 class TestFileReporter:
     class TestReport:
@@ -55,3 +58,151 @@ class TestFileReporter:
 
             with open(output_file) as output_file_content:
                 assert (output_file_content.read() == "output-from-encoder")
+
+        def test_it_writes_each_time_slice_to_its_own_file(self):
+            time_slice = MagicMock(name="time_slice", start=1528887859058)
+            self.profile.time_slices = [time_slice]
+
+            self.report()
+
+            self.profile_encoder.encode.assert_called_with(profile=time_slice, output_stream=ANY)
+            assert len(list(Path(self.file_prefix).parent.glob("*-slice-*.json"))) == 1
+
+    class TestReportToFilePath:
+        @pytest.fixture(autouse=True)
+        def around(self):
+            self.temporary_directory = tempfile.mkdtemp()
+            self.file_path = str(Path(self.temporary_directory, "profile.folded"))
+            self.profile_encoder = MagicMock(name="profile_encoder", spec=ProfileEncoder)
+            self.profile = MagicMock(name="profile", time_slices=[])
+            self.subject = FileReporter(
+                environment={
+                    "file_prefix": FILE_PREFIX,
+                    "file_path": self.file_path,
+                    "profile_encoder": self.profile_encoder
+                })
+            yield
+            shutil.rmtree(self.temporary_directory)
+
+        def test_it_writes_the_profile_to_the_file_path(self):
+            assert self.subject.report(profile=self.profile) == self.file_path
+
+        def test_it_names_the_time_slice_files_after_the_file_path(self):
+            self.profile.time_slices = [MagicMock(name="time_slice", start=1528887859058)]
+
+            self.subject.report(profile=self.profile)
+
+            assert len(list(Path(self.temporary_directory).glob("profile-slice-*.folded"))) == 1
+
+    class TestFileFormat:
+        @pytest.fixture(autouse=True)
+        def around(self):
+            self.temporary_directory = tempfile.mkdtemp()
+            self.file_prefix = str(Path(self.temporary_directory, FILE_PREFIX))
+            yield
+            shutil.rmtree(self.temporary_directory)
+
+        def test_it_uses_the_encoder_and_file_extension_of_the_file_format(self):
+            subject = FileReporter(environment={"file_prefix": self.file_prefix, "file_format": "pprof"})
+
+            output_filename = subject.report(profile=example_profile())
+
+            assert output_filename.endswith(".pb.gz")
+            with open(output_filename, "rb") as output_file:
+                assert gzip.decompress(output_file.read())
+
+        def test_it_writes_folded_stacks(self):
+            subject = FileReporter(environment={"file_prefix": self.file_prefix, "file_format": "folded"})
+
+            output_filename = subject.report(profile=example_profile())
+
+            assert output_filename.endswith(".folded")
+            assert "bottom;middle;top 1" in Path(output_filename).read_text().splitlines()
+
+        def test_it_rejects_an_unknown_file_format(self):
+            with pytest.raises(ValueError):
+                FileReporter(environment={"file_prefix": self.file_prefix, "file_format": "xml"})
+
+    class TestArchive:
+        @pytest.fixture(autouse=True)
+        def around(self):
+            self.temporary_directory = tempfile.mkdtemp()
+            self.file_prefix = str(Path(self.temporary_directory, FILE_PREFIX))
+            self.timestamp = datetime.datetime(2018, 6, 13, 11, 4, 19)
+            yield
+            shutil.rmtree(self.temporary_directory)
+
+        def reporter(self, **environment):
+            environment.update({"file_prefix": self.file_prefix, "file_format": "folded"})
+            return FileReporter(environment=environment)
+
+        def report_files(self):
+            return sorted(path.name for path in Path(self.temporary_directory).iterdir())
+
+        def test_it_compresses_the_files(self):
+            output_filename = self.reporter(file_compression="gzip").report(profile=example_profile())
+
+            assert output_filename.endswith(".folded.gz")
+            with gzip.open(output_filename, "rt") as output_file:
+                assert "bottom;middle;top 1" in output_file.read().splitlines()
+
+        def test_it_rejects_an_unknown_file_compression(self):
+            with pytest.raises(ValueError):
+                self.reporter(file_compression="zip")
+
+        def test_it_does_not_overwrite_a_report_of_the_same_second(self):
+            reporter = self.reporter()
+
+            first_filename = reporter.report(profile=example_profile(), timestamp=self.timestamp)
+            second_filename = reporter.report(profile=example_profile(), timestamp=self.timestamp)
+
+            assert first_filename != second_filename
+            assert second_filename.endswith("-1.folded")
+            assert len(self.report_files()) == 2
+
+        def test_it_does_not_leave_temporary_files(self):
+            self.reporter().report(profile=example_profile())
+
+            assert not [name for name in self.report_files() if name.endswith(".tmp")]
+
+        def test_it_deletes_the_oldest_files_beyond_the_max_file_count(self):
+            reporter = self.reporter(max_file_count=2)
+
+            filenames = [reporter.report(profile=example_profile(), timestamp=self.timestamp + datetime.timedelta(
+                minutes=minutes)) for minutes in range(3)]
+
+            assert self.report_files() == sorted(Path(filename).name for filename in filenames[1:])
+
+        def test_it_deletes_the_oldest_files_beyond_the_max_total_bytes_but_keeps_the_latest_one(self):
+            reporter = self.reporter(max_total_file_bytes=1)
+
+            filenames = [reporter.report(profile=example_profile(), timestamp=self.timestamp + datetime.timedelta(
+                minutes=minutes)) for minutes in range(2)]
+
+            assert self.report_files() == [Path(filenames[1]).name]
+
+        def test_it_does_not_delete_other_files(self):
+            Path(self.temporary_directory, "other.folded").write_text("a;b 1\n")
+
+            self.reporter(max_file_count=1).report(profile=example_profile())
+
+            assert "other.folded" in self.report_files()
+
+        def test_it_does_not_delete_the_files_of_a_longer_file_prefix(self):
+            longer_prefix_filename = FileReporter(environment={
+                "file_prefix": self.file_prefix + "p", "file_format": "folded"}).report(profile=example_profile())
+
+            self.reporter(max_file_count=1).report(profile=example_profile())
+
+            assert Path(longer_prefix_filename).name in self.report_files()
+            assert len(self.report_files()) == 2
+
+        def test_it_deletes_the_time_slice_files_and_the_files_with_a_counter(self):
+            reporter = self.reporter(max_file_count=1)
+            reporter.report(profile=example_profile(), timestamp=self.timestamp)
+            reporter.report(profile=example_profile(), timestamp=self.timestamp)
+            Path(self.file_prefix + "2018-06-13T11-04-19-slice-2018-06-13T11-04-00.folded").write_text("a;b 1\n")
+
+            filename = reporter.report(profile=example_profile(), timestamp=self.timestamp)
+
+            assert self.report_files() == [Path(filename).name]
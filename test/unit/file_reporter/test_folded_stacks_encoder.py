@@ -0,0 +1,21 @@
+import io
+
+from test.pytestutils import before
+
+from codeguru_profiler_agent.file_reporter.folded_stacks_encoder import FoldedStacksEncoder
+from test.unit.sdk_reporter.test_sdk_profile_encoder import example_profile
+
+
+class TestFoldedStacksEncoder:
+    @before
+    def before(self):
+        self.output_stream = io.BytesIO()
+        FoldedStacksEncoder().encode(profile=example_profile(), output_stream=self.output_stream)
+        self.lines = self.output_stream.getvalue().decode("utf-8").splitlines()
+
+    def test_it_writes_one_line_per_stack_with_its_sample_count(self):
+        assert sorted(self.lines) == [
+            "bottom;middle 1",
+            "bottom;middle;different_top 1",
+            "bottom;middle;top 1"
+        ]
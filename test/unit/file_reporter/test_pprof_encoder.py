@@ -0,0 +1,110 @@
+import gzip
+import io
+
+from test.pytestutils import before
+
+from codeguru_profiler_agent.file_reporter.pprof_encoder import PprofEncoder, _varint
+from test.unit.sdk_reporter.test_sdk_profile_encoder import example_profile
+
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_fields(data):
+    """
+    :returns: the (field number, value) pairs of a protocol buffers message, values being ints or bytes
+    """
+    fields = []
+    offset = 0
+    while offset < len(data):
+        key, offset = read_varint(data, offset)
+        if key & 0x7 == 0:
+            value, offset = read_varint(data, offset)
+        else:
+            length, offset = read_varint(data, offset)
+            value = data[offset:offset + length]
+            offset += length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def read_packed_varints(data):
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = read_varint(data, offset)
+        values.append(value)
+    return values
+
+
+def field_values(fields, field_number):
+    return [value for number, value in fields if number == field_number]
+
+
+class TestPprofEncoder:
+    @before
+    def before(self):
+        self.output_stream = io.BytesIO()
+        PprofEncoder().encode(profile=example_profile(), output_stream=self.output_stream)
+        self.fields = read_fields(gzip.decompress(self.output_stream.getvalue()))
+        self.strings = [string.decode("utf-8") for string in field_values(self.fields, 6)]
+        self.function_names = {}
+        for function in field_values(self.fields, 5):
+            function_fields = read_fields(function)
+            self.function_names[field_values(function_fields, 1)[0]] = \
+                self.strings[field_values(function_fields, 2)[0]]
+
+    def test_the_string_table_starts_with_the_empty_string(self):
+        assert self.strings[0] == ""
+
+    def test_it_writes_the_sample_types(self):
+        sample_types = [[self.strings[value] for _, value in read_fields(sample_type)]
+                        for sample_type in field_values(self.fields, 1)]
+        assert sample_types == [["samples", "count"], ["wall", "nanoseconds"]]
+
+    def test_it_writes_one_sample_per_stack_from_the_leaf_to_the_root(self):
+        stacks = []
+        for sample in field_values(self.fields, 2):
+            sample_fields = read_fields(sample)
+            location_ids = read_packed_varints(field_values(sample_fields, 1)[0])
+            stacks.append([self.function_names[location_id] for location_id in location_ids])
+
+        assert sorted(stacks) == [
+            ["different_top", "middle", "bottom"],
+            ["middle", "bottom"],
+            ["top", "middle", "bottom"]
+        ]
+
+    def test_it_writes_the_sample_count_and_wall_time_of_each_stack(self):
+        values = [read_packed_varints(field_values(read_fields(sample), 2)[0])
+                  for sample in field_values(self.fields, 2)]
+
+        # 7200 seconds active, 1 sample taken from 10 of 15 threads
+        assert values == [[1, 10800 * 1000000000]] * 3
+
+    def test_it_writes_the_time_and_duration_of_the_profile(self):
+        assert field_values(self.fields, 9) == [1514764800000 * 1000000]
+        assert field_values(self.fields, 10) == [7200000 * 1000000]
+        assert field_values(self.fields, 12) == [1000 * 1000000]
+
+
+class TestVarint:
+    def test_it_encodes_small_values_in_one_byte(self):
+        assert _varint(0) == b"\x00"
+        assert _varint(127) == b"\x7f"
+
+    def test_it_encodes_bigger_values_over_several_bytes(self):
+        assert _varint(300) == b"\xac\x02"
+
+    def test_it_encodes_negative_values_as_their_64_bits_twos_complement(self):
+        assert _varint(-1) == b"\xff" * 9 + b"\x01"
+        assert read_varint(_varint(-2), 0) == (2 ** 64 - 2, 10)
@@ -0,0 +1,41 @@
+import io
+import json
+
+from test.pytestutils import before
+
+from codeguru_profiler_agent.file_reporter.speedscope_encoder import SpeedscopeEncoder, SPEEDSCOPE_SCHEMA
+from test.unit.sdk_reporter.test_sdk_profile_encoder import example_profile
+
+
+class TestSpeedscopeEncoder:
+    @before
+    def before(self):
+        self.profile = example_profile()
+        output_stream = io.BytesIO()
+        SpeedscopeEncoder().encode(profile=self.profile, output_stream=output_stream)
+        self.result = json.loads(output_stream.getvalue().decode("utf-8"))
+        self.evented_profile = self.result["profiles"][0]
+        self.frame_names = [frame["name"] for frame in self.result["shared"]["frames"]]
+
+    def test_it_writes_a_speedscope_file(self):
+        assert self.result["$schema"] == SPEEDSCOPE_SCHEMA
+        assert self.evented_profile["type"] == "evented"
+        assert self.evented_profile["unit"] == "milliseconds"
+        assert sorted(self.frame_names) == ["bottom", "different_top", "middle", "top"]
+
+    def test_every_opened_frame_is_closed_in_order(self):
+        stack = []
+        for event in self.evented_profile["events"]:
+            if event["type"] == "O":
+                stack.append(event["frame"])
+            else:
+                assert stack.pop() == event["frame"]
+        assert stack == []
+
+    def test_the_self_time_of_frames_is_their_share_of_the_active_time(self):
+        # a single sample of 3 stacks, taken from 10 of 15 threads during the active time
+        milliseconds_per_sample = self.profile.get_active_millis_since_start() * 1.5
+        assert self.evented_profile["endValue"] == 3 * milliseconds_per_sample
+        top = self.frame_names.index("top")
+        open_at, close_at = [event["at"] for event in self.evented_profile["events"] if event["frame"] == top]
+        assert close_at - open_at == milliseconds_per_sample
@@ -0,0 +1,37 @@
+import pytest
+
+from test.pytestutils import before
+from codeguru_profiler_agent.metrics.histogram import LogLinearHistogram
+
+
+class TestLogLinearHistogram:
+    @before
+    def before(self):
+        self.subject = LogLinearHistogram()
+
+    def test_it_returns_zero_when_empty(self):
+        assert self.subject.percentile(50) == 0
+
+    @pytest.mark.parametrize("value", [0.000001, 0.0042, 0.1, 1, 3.7, 12345000])
+    def test_it_returns_percentiles_within_the_relative_error(self, value):
+        self.subject.record(value)
+
+        assert value <= self.subject.percentile(50) <= value * 1.0625
+
+    def test_it_returns_the_value_at_each_percentile(self):
+        for value in range(1, 101):
+            self.subject.record(value / 1000)
+
+        assert 0.050 <= self.subject.percentile(50) <= 0.050 * 1.0625
+        assert 0.090 <= self.subject.percentile(90) <= 0.090 * 1.0625
+        assert 0.099 <= self.subject.percentile(99) <= 0.099 * 1.0625
+        assert 0.100 <= self.subject.percentile(99.9) <= 0.100 * 1.0625
+
+    def test_it_counts_values_out_of_range_in_the_first_and_last_buckets(self):
+        self.subject.record(0)
+        self.subject.record(-1)
+        self.subject.record(2 ** 50)
+
+        assert self.subject.count == 3
+        assert self.subject.counts[0] == 2
+        assert self.subject.counts[-1] == 1
@@ -38,3 +38,14 @@ class TestAverage:
         self.subject.add(15)
 
         assert (self.subject.average() == 10)
+
+
+class TestPercentile:
+    @before
+    def before(self):
+        self.subject = Metric()
+
+    def test_it_does_not_return_more_than_the_max(self):
+        self.subject.add(10)
+
+        assert (self.subject.percentile(99) == 10)
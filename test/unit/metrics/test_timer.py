@@ -22,6 +22,15 @@ class TestTimer:
             assert (self.subject.metrics["test-record"].total == 30)
             assert (self.subject.metrics["test-record"].counter == 2)
 
+        def test_it_ignores_metrics_it_does_not_record(self):
+            subject = Timer(metric_names=["test-record"])
+
+            subject.record("other-record", 12)
+
+            assert (not "other-record" in subject.metrics)
+            assert (not subject.is_recorded("other-record"))
+            assert (subject.is_recorded("test-record"))
+
     class TestReset:
         def test_metrics_get_reset(self):
             subject = Timer()
@@ -2,13 +2,13 @@ import platform
 import sys
 from test.pytestutils import before
 
-from codeguru_profiler_agent.metrics.with_timer import with_timer
+from codeguru_profiler_agent.metrics.with_timer import with_timer, bind_untimed_methods
 from codeguru_profiler_agent.metrics.timer import Timer
 
 
 class TargetClass:
-    def __init__(self):
-        self.timer = Timer()
+    def __init__(self, timer=None):
+        self.timer = timer or Timer()
 
     @with_timer(metric_name="test-foo-wall", measurement="wall-clock-time")
     def foo_wall(self):
@@ -46,3 +46,21 @@ class TestWithTimer:
         assert (self.test_class.timer.metrics["test-foo-cpu"].max > 0)
         assert (self.test_class.timer.metrics["test-foo-cpu"].total ==
                 self.test_class.timer.metrics["test-foo-cpu"].max)
+
+
+class TestBindUntimedMethods:
+    def test_it_binds_methods_whose_metric_is_not_recorded_without_timer(self):
+        test_class = TargetClass(timer=Timer(metric_names=["test-foo-cpu"]))
+
+        bind_untimed_methods(test_class)
+
+        assert test_class.foo_wall.__func__ is TargetClass.foo_wall.__wrapped__
+        assert test_class.foo_cpu.__func__ is TargetClass.foo_cpu
+
+    def test_it_binds_methods_measured_elsewhere_without_timer(self):
+        test_class = TargetClass()
+
+        bind_untimed_methods(test_class, measured_elsewhere=["test-foo-cpu"])
+        test_class.foo_cpu()
+
+        assert "test-foo-cpu" not in test_class.timer.metrics
@@ -0,0 +1,57 @@
+import asyncio
+import sys
+
+import pytest
+
+from test.pytestutils import before
+from codeguru_profiler_agent import endpoint_labels
+from codeguru_profiler_agent.endpoint_labels import current_endpoint, task_endpoint
+from codeguru_profiler_agent.middleware.asgi_middleware import AsgiEndpointMiddleware
+
+SCOPE = {"type": "http", "method": "GET", "path": "/users/42"}
+
+
+class TestAsgiEndpointMiddleware:
+    @before
+    def before(self):
+        self.recorded_endpoints = []
+        yield
+        endpoint_labels.is_asgi_middleware_used = False
+
+    async def app(self, scope, receive, send):
+        self.recorded_endpoints.append(current_endpoint.get())
+
+    def test_it_records_the_endpoint_while_the_application_is_awaited(self):
+        asyncio.run(AsgiEndpointMiddleware(self.app)(SCOPE, None, None))
+
+        assert self.recorded_endpoints == ["GET /users/42"]
+        assert current_endpoint.get() is None
+
+    def test_it_ignores_lifespan_events(self):
+        asyncio.run(AsgiEndpointMiddleware(self.app)({"type": "lifespan"}, None, None))
+
+        assert self.recorded_endpoints == [None]
+
+    def test_it_records_the_endpoint_of_the_task_serving_the_request(self):
+        async def app(scope, receive, send):
+            self.recorded_endpoints.append(task_endpoint(asyncio.current_task()))
+
+        asyncio.run(AsgiEndpointMiddleware(app)(SCOPE, None, None))
+
+        assert self.recorded_endpoints == ["GET /users/42"]
+
+    @pytest.mark.skipif(sys.version_info < (3, 12), reason="the context of C tasks can only be read from Python 3.12")
+    def test_tasks_created_while_serving_a_request_inherit_its_endpoint(self):
+        async def app(scope, receive, send):
+            task = asyncio.get_running_loop().create_task(asyncio.sleep(0))
+            self.recorded_endpoints.append(task_endpoint(task))
+            await task
+
+        asyncio.run(AsgiEndpointMiddleware(app)(SCOPE, None, None))
+
+        assert self.recorded_endpoints == ["GET /users/42"]
+
+    def test_it_enables_looking_up_the_endpoint_of_running_tasks(self):
+        AsgiEndpointMiddleware(self.app)
+
+        assert endpoint_labels.is_asgi_middleware_used
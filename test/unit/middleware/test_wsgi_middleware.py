@@ -0,0 +1,54 @@
+import threading
+import timeit
+
+from codeguru_profiler_agent.endpoint_labels import endpoints_by_thread_id
+from codeguru_profiler_agent.middleware.wsgi_middleware import WsgiEndpointMiddleware
+
+ENVIRON = {"REQUEST_METHOD": "GET", "PATH_INFO": "/users/42"}
+
+
+class TestWsgiEndpointMiddleware:
+    def test_it_records_the_endpoint_while_the_application_is_called(self):
+        recorded_endpoints = []
+
+        def app(environ, start_response):
+            recorded_endpoints.append(endpoints_by_thread_id.get(threading.get_ident()))
+            return [b"ok"]
+
+        response = WsgiEndpointMiddleware(app)(ENVIRON, None)
+
+        assert response == [b"ok"]
+        assert recorded_endpoints == ["GET /users/42"]
+        assert threading.get_ident() not in endpoints_by_thread_id
+
+    def test_it_removes_the_endpoint_when_the_application_raises(self):
+        def app(environ, start_response):
+            raise ValueError("failed")
+
+        try:
+            WsgiEndpointMiddleware(app)(ENVIRON, None)
+        except ValueError:
+            pass
+
+        assert threading.get_ident() not in endpoints_by_thread_id
+
+    def test_it_restores_the_endpoint_of_an_outer_middleware(self):
+        inner = WsgiEndpointMiddleware(lambda environ, start_response: [])
+        recorded_endpoints = []
+
+        def app(environ, start_response):
+            inner({"REQUEST_METHOD": "GET", "PATH_INFO": "/inner"}, start_response)
+            recorded_endpoints.append(endpoints_by_thread_id.get(threading.get_ident()))
+            return []
+
+        WsgiEndpointMiddleware(app)(ENVIRON, None)
+
+        assert recorded_endpoints == ["GET /users/42"]
+
+    def test_its_overhead_per_request_is_small(self):
+        middleware = WsgiEndpointMiddleware(lambda environ, start_response: [])
+
+        seconds_per_request = min(timeit.repeat(lambda: middleware(ENVIRON, None), number=10000, repeat=3)) / 10000
+
+        # a generous bound so that this does not fail on slow hosts; this is around 1 microsecond
+        assert seconds_per_request < 0.0001
@@ -185,6 +185,56 @@ class TestInteractionWithMemoryCounter:
         mock_memory_counter.count_first_child.assert_not_called()
         mock_memory_counter.count_add_child.assert_called_once()
 
+    def test_new_children_share_the_memory_counter(self):
+        mock_memory_counter = _mock_memory_counter()
+        call_graph_node = CallGraphNode("foo", class_name=None, file_path=None, line_no=None,
+                                        memory_counter=mock_memory_counter)
+        child = call_graph_node.update_current_node_and_get_child(Frame("new_child_frame"))
+        mock_memory_counter.reset_mock()
+
+        child.update_current_node_and_get_child(Frame("new_grand_child_frame"))
+
+        mock_memory_counter.count_create_node.assert_called_once()
+        mock_memory_counter.count_first_child.assert_called_once()
+
+
+class TestMergeAndGetChild(TestCallGraphNode):
+    @before
+    def before(self):
+        super().before()
+        self.other = CallGraphNode("dummy_frame", None, file_path="file_path/file.py", line_no=123)
+
+    def test_when_child_does_not_exist_it_adds_a_copy_of_the_other_child(self):
+        other_child = self.other.update_current_node_and_get_child(
+            Frame("child_frame", class_name="TestClass", file_path="file_path/file.py", line_no=10))
+        other_child.increase_runnable_count(3)
+
+        node = self.subject.merge_and_get_child(other_child)
+
+        assert (node in self.subject.children)
+        assert (node is not other_child)
+        assert ((node.frame_name, node.class_name, node.file_path) == ("child_frame", "TestClass", "file_path/file.py"))
+        assert ((node.start_line, node.end_line, node.runnable_count) == (10, 10, 3))
+
+    def test_when_child_exists_it_sums_counts_and_unions_line_ranges(self):
+        existing_node = self.subject.update_current_node_and_get_child(Frame("child_frame", line_no=20))
+        existing_node.increase_runnable_count(1)
+        other_child = self.other.update_current_node_and_get_child(Frame("child_frame", line_no=10))
+        other_child.increase_runnable_count(2)
+
+        node = self.subject.merge_and_get_child(other_child)
+
+        assert (node is existing_node)
+        assert ((node.start_line, node.end_line, node.runnable_count) == (10, 20, 3))
+
+    def test_it_does_not_merge_the_grand_children(self):
+        other_child = self.other.update_current_node_and_get_child(Frame("child_frame"))
+        other_child.update_current_node_and_get_child(Frame("grand_child_frame"))
+
+        node = self.subject.merge_and_get_child(other_child)
+
+        assert (node.children == ())
+
 
 class TestIncreaseRunnableCount:
     def test_it_increases_the_runnable_count_by_one(self):
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import Mock
+from unittest.mock import Mock, ANY
 
 from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo, ErrorsMetadata
 from codeguru_profiler_agent.model.frame import Frame
@@ -283,6 +283,50 @@ class TestAdd(TestProfile):
 
         assert (self.subject.total_seen_threads_count == (56 + 78))
 
+    def test_it_keeps_the_task_counts_apart_from_the_thread_counts(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=2, seen_threads_count=2,
+                                attempted_sample_tasks_count=1, seen_tasks_count=3))
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=2, seen_threads_count=2,
+                                attempted_sample_tasks_count=2, seen_tasks_count=4))
+
+        assert (self.subject.total_attempted_sample_threads_count == 4)
+        assert (self.subject.total_seen_threads_count == 4)
+        assert (self.subject.total_attempted_sample_tasks_count == 1 + 2)
+        assert (self.subject.total_seen_tasks_count == 3 + 4)
+
+    def test_it_adds_the_cpu_time_of_each_stack_to_its_top_frame(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1"), Frame("frame2")], [Frame("frame1")]],
+                                cpu_times=[0.25, 0.5]))
+        self.subject.add(Sample(stacks=[[Frame("frame1"), Frame("frame2")]], cpu_times=[0.125]))
+
+        frame1 = self.subject.callgraph.children[0]
+        assert (self.subject.has_cpu_time is True)
+        assert (frame1.cpu_time_seconds == 0.5)
+        assert (frame1.children[0].cpu_time_seconds == 0.375)
+
+    def test_it_counts_the_thread_state_of_each_stack_on_its_top_frame(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")], [Frame("frame1")], [Frame("frame2")]],
+                                thread_states=["RUNNABLE", "BLOCKED", "IDLE"]))
+
+        assert (self.subject.has_thread_states is True)
+        assert (self.subject.callgraph.children[0].thread_state_counts == {"RUNNABLE": 1, "BLOCKED": 1})
+        assert (self.subject.callgraph.children[0].runnable_count == 2)
+        assert (self.subject.callgraph.children[1].thread_state_counts == {"IDLE": 1})
+
+    def test_cpu_only_stacks_add_cpu_time_but_no_wall_clock_sample(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], cpu_times=[0.5],
+                                cpu_only_stacks=[([Frame("frame1")], 0.25), ([Frame("frame2")], 0.25)]))
+
+        assert (_convert_profile_into_dict(self.subject)["children"]["frame1"]["count"] == 1)
+        assert (_convert_profile_into_dict(self.subject)["children"]["frame2"]["count"] == 0)
+        assert ([child.cpu_time_seconds for child in self.subject.callgraph.children] == [0.75, 0.25])
+
+    def test_when_samples_have_no_cpu_times_it_does_not_track_cpu_time(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]]))
+
+        assert (self.subject.has_cpu_time is False)
+        assert (self.subject.callgraph.children[0].cpu_time_seconds is None)
+
 
 class TestStartTime(TestProfile):
     @before
@@ -477,6 +521,253 @@ class TestGetAverageThreadWeight(TestProfile):
         assert (self.subject.average_thread_weight() == 1.5)
 
 
+class TestSeal(TestProfile):
+    @before
+    def before(self):
+        super().before()
+        self.turn_clock(1)
+        self.subject.add(Sample(stacks=[[Frame("frame1")]]))
+        self.turn_clock(1)
+        self.subject.seal()
+        self.turn_clock(10)
+
+    def test_it_is_sealed(self):
+        assert self.subject.is_sealed()
+
+    def test_it_freezes_the_active_duration(self):
+        assert (self.subject.get_active_millis_since_start() == 2000)
+
+    def test_it_keeps_the_end_at_the_last_sample(self):
+        assert (self.subject.end == self.test_start_time + 1000)
+
+    def test_it_freezes_the_cpu_time(self):
+        cpu_time_seconds = self.subject.cpu_time_seconds
+        sum(i * i for i in range(100000))
+
+        assert (self.subject.cpu_time_seconds == cpu_time_seconds)
+
+    def test_it_freezes_the_debug_info(self):
+        self.subject.agent_debug_info = Mock()
+
+        assert (self.subject.serialize_agent_debug_info_to_json() == {"processId": ANY, "errorsCount": ANY})
+
+
+class TestSnapshot(TestProfile):
+    @before
+    def before(self):
+        super().before()
+        self.turn_clock(1)
+        self.subject.start_time_slice(Profile(profiling_group_name="foo", sampling_interval_seconds=1.0, host_weight=2,
+                                              start=self.test_start_time + 1000, agent_debug_info=AgentDebugInfo(),
+                                              clock=self.mock_clock), max_time_slices=10)
+        self.turn_clock(1)
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=1, seen_threads_count=1))
+        self.turn_clock(1)
+        self.snapshot = self.subject.snapshot()
+
+    def test_it_copies_the_call_graph_including_the_time_slices(self):
+        assert (self.snapshot.callgraph.children[0].frame_name == "frame1")
+        assert (self.snapshot.callgraph.children[0].runnable_count == 1)
+
+    def test_it_copies_the_counters(self):
+        assert (self.snapshot.total_sample_count == 1)
+        assert (self.snapshot.total_seen_threads_count == 1)
+
+    def test_it_is_sealed_with_the_active_duration_so_far(self):
+        self.turn_clock(10)
+
+        assert self.snapshot.is_sealed()
+        assert (self.snapshot.get_active_millis_since_start() == 3000)
+
+    def test_it_leaves_the_profile_untouched(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=1, seen_threads_count=1))
+
+        assert not self.subject.is_sealed()
+        assert (self.subject.current_time_slice is not None)
+        assert (self.snapshot.total_sample_count == 1)
+
+
+class TestRestartAt(TestProfile):
+    @before
+    def before(self):
+        super().before()
+        self.turn_clock(5)
+        self.subject.restart_at(self.test_start_time + 5000)
+        self.turn_clock(1)
+
+    def test_it_moves_the_start(self):
+        assert (self.subject.start == self.test_start_time + 5000)
+
+    def test_it_only_counts_the_active_time_since_restart(self):
+        assert (self.subject.get_active_millis_since_start() == 1000)
+
+
+class TestMerge(TestProfile):
+    @before
+    def before(self):
+        super().before()
+        self.turn_clock(1)
+        self.other = Profile(
+            profiling_group_name="foo",
+            sampling_interval_seconds=1.0,
+            host_weight=2,
+            start=self.test_start_time,
+            agent_debug_info=AgentDebugInfo(ErrorsMetadata()),
+            clock=self.mock_clock
+        )
+
+    def test_it_unions_the_call_graphs_and_sums_the_counts(self):
+        self.subject.add(Sample(stacks=[[Frame("method_one"), Frame("method_two")],
+                                        [Frame("method_one")]]))
+        self.other.add(Sample(stacks=[[Frame("method_one"), Frame("method_two")],
+                                      [Frame("method_one"), Frame("method_three")]]))
+
+        self.subject.merge(self.other)
+
+        assert (_convert_profile_into_dict(self.subject) == {
+            "count": 0,
+            "children": {
+                "method_one": {
+                    "count": 1,
+                    "children": {
+                        "method_two": {"count": 2, "children": {}},
+                        "method_three": {"count": 1, "children": {}}
+                    }
+                }
+            }
+        })
+
+    def test_it_does_not_modify_the_other_profile(self):
+        self.other.add(Sample(stacks=[[Frame("method_one")]]))
+
+        self.subject.merge(self.other)
+        self.subject.merge(self.other)
+
+        assert (_convert_profile_into_dict(self.other) == {
+            "count": 0,
+            "children": {"method_one": {"count": 1, "children": {}}}
+        })
+
+    def test_it_unions_the_line_ranges(self):
+        self.subject.add(Sample(stacks=[[Frame("method_one", line_no=10)]]))
+        self.other.add(Sample(stacks=[[Frame("method_one", line_no=5)]]))
+        self.other.add(Sample(stacks=[[Frame("method_one", line_no=20)]]))
+
+        self.subject.merge(self.other)
+
+        assert (_convert_profile_into_dict(self.subject)["children"]["method_one"]["line"] == [5, 20])
+
+    def test_it_sums_sample_and_thread_counts(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=1, seen_threads_count=2))
+        self.other.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=3, seen_threads_count=4))
+        self.other.add(Sample(stacks=[[Frame("frame1")]], attempted_sample_threads_count=5, seen_threads_count=6))
+
+        self.subject.merge(self.other)
+
+        assert (self.subject.total_sample_count == 3)
+        assert (self.subject.total_attempted_sample_threads_count == 9)
+        assert (self.subject.total_seen_threads_count == 12)
+
+    def test_it_handles_deep_stacks_without_recursion(self):
+        deep_stack = [Frame("frame_" + str(i)) for i in range(5000)]
+        self.other.add(Sample(stacks=[deep_stack]))
+
+        self.subject.merge(self.other)
+
+        node = self.subject.callgraph
+        while node.children:
+            node = node.children[0]
+        assert (node.frame_name == "frame_4999")
+        assert (node.runnable_count == 1)
+
+    def test_it_accounts_new_nodes_in_the_memory_counter(self):
+        self.other.add(Sample(stacks=[[Frame("method_one"), Frame("method_two")]]))
+        reference = Profile(profiling_group_name="foo", sampling_interval_seconds=1.0, host_weight=2,
+                            start=self.test_start_time, agent_debug_info=AgentDebugInfo(ErrorsMetadata()),
+                            clock=self.mock_clock)
+        reference.add(Sample(stacks=[[Frame("method_one"), Frame("method_two")]]))
+
+        self.subject.merge(self.other)
+        memory_after_first_merge = self.subject.get_memory_usage_bytes()
+        self.subject.merge(self.other)
+
+        assert (memory_after_first_merge == reference.get_memory_usage_bytes())
+        assert (self.subject.get_memory_usage_bytes() == memory_after_first_merge)
+
+    def test_when_profiles_overlap_it_keeps_the_active_duration(self):
+        self.other.add(Sample(stacks=[[Frame("frame1")]]))
+        self.turn_clock(3)
+
+        self.subject.merge(self.other)
+
+        assert (self.subject.get_active_millis_since_start() == 4000)
+
+    def test_when_profiles_are_consecutive_it_sums_the_active_durations(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]]))
+        self.turn_clock(9)
+        later = Profile(profiling_group_name="foo", sampling_interval_seconds=1.0, host_weight=2,
+                        start=self.test_start_time + 10000, agent_debug_info=AgentDebugInfo(ErrorsMetadata()),
+                        clock=self.mock_clock)
+        self.turn_clock(5)
+        later.add(Sample(stacks=[[Frame("frame1")]]))
+
+        later.merge(self.subject)
+
+        # 1 second of active time in the first profile, 5 seconds in the later one
+        assert (later.start == self.test_start_time)
+        assert (later.end == self.test_start_time + 15000)
+        assert (later.get_active_millis_since_start() == 6000)
+
+    def test_when_a_later_paused_profile_is_merged_into_an_earlier_paused_one_it_sums_the_active_durations(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]]))
+        self.subject.pause()
+        self.turn_clock(1)
+        later = Profile(profiling_group_name="foo", sampling_interval_seconds=1.0, host_weight=2,
+                        start=self.test_start_time + 2000, agent_debug_info=AgentDebugInfo(ErrorsMetadata()),
+                        clock=self.mock_clock)
+        self.turn_clock(2)
+        later.add(Sample(stacks=[[Frame("frame1")]]))
+        later.pause()
+        self.turn_clock(5)
+
+        self.subject.merge(later)
+
+        # 1 second of active time in the first profile, 2 seconds in the later one
+        assert (self.subject.start == self.test_start_time)
+        assert (self.subject.end == self.test_start_time + 4000)
+        assert (self.subject.get_active_millis_since_start() == 3000)
+
+    def test_it_sums_cpu_time_and_overhead(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]]))
+        self.other.add(Sample(stacks=[[Frame("frame1")]]))
+        self.other.cpu_time_seconds = 2.0
+        self.other.set_overhead_ms(datetime.timedelta(seconds=1))
+        cpu_time_before_merge = self.subject.cpu_time_seconds
+
+        self.subject.merge(self.other)
+
+        assert (self.subject.cpu_time_seconds == cpu_time_before_merge + 2.0)
+        assert (self.subject.overhead_ms == 1000)
+
+    def test_it_sums_the_thread_state_counts_of_the_nodes(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], thread_states=["BLOCKED"]))
+        self.other.add(Sample(stacks=[[Frame("frame1")], [Frame("frame1")]], thread_states=["BLOCKED", "RUNNABLE"]))
+
+        self.subject.merge(self.other)
+
+        assert (self.subject.has_thread_states is True)
+        assert (self.subject.callgraph.children[0].thread_state_counts == {"BLOCKED": 2, "RUNNABLE": 1})
+
+    def test_it_sums_the_cpu_time_of_the_nodes(self):
+        self.subject.add(Sample(stacks=[[Frame("frame1")]], cpu_times=[0.25]))
+        self.other.add(Sample(stacks=[[Frame("frame1")], [Frame("frame2")]], cpu_times=[0.5, 0.125]))
+
+        self.subject.merge(self.other)
+
+        assert (self.subject.has_cpu_time is True)
+        assert ([child.cpu_time_seconds for child in self.subject.callgraph.children] == [0.75, 0.125])
+
+
 def _convert_profile_into_dict(profile):
     return _convert_node_into_dict(profile.callgraph)
 
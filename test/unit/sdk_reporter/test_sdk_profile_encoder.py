@@ -107,7 +107,14 @@ class TestInsideTheResult(TestSdkProfileEncoder):
 
     def test_it_includes_the_sample_weight_in_the_agent_metadata(self):
         # Given the example profile, sample_weight = 1 / (1514772000000 - 1514764800000) = ~0.00013888
-        assert (0.000138 < self.decoded_json_result()["agentMetadata"]["sampleWeights"]["WALL_TIME"] < 0.000139)
+        # divided by the average thread weight, 15 seen threads / 10 attempted = 1.5, so ~0.00009259
+        assert (0.0000925 < self.decoded_json_result()["agentMetadata"]["sampleWeights"]["WALL_TIME"] < 0.0000926)
+
+    def test_it_does_not_compensate_the_sample_weight_for_the_tasks_that_were_not_sampled(self):
+        self.profile.add(Sample(stacks=[[Frame("task")]], attempted_sample_tasks_count=1, seen_tasks_count=100))
+
+        # 2 samples during 7200 seconds, divided by the average thread weight of 1.5 only, so ~0.00018518
+        assert (0.0001851 < self.decoded_json_result()["agentMetadata"]["sampleWeights"]["WALL_TIME"] < 0.0001852)
 
     def test_it_includes_profile_duration_in_the_agent_metadata(self):
         assert (self.decoded_json_result()["agentMetadata"]["durationInMs"] == 7200000)
@@ -314,6 +321,47 @@ class TestInsideTheResult(TestSdkProfileEncoder):
         })
 
 
+class TestWhenCpuTimeIsSampled(TestSdkProfileEncoder):
+    @before
+    def before(self):
+        super().before()
+        self.profile.add(Sample(stacks=[[Frame("bottom"), Frame("middle")]], cpu_times=[0.5]))
+
+    def test_it_includes_the_cpu_time_counts_alongside_the_wall_time_counts(self):
+        assert (self.decoded_json_result()["callgraph"]["children"]["bottom"]["children"]["middle"]["counts"] == {
+            "WALL_TIME": 2,
+            "CPU_TIME": 0.5
+        })
+
+    def test_it_does_not_include_cpu_time_counts_for_frames_without_cpu_time(self):
+        assert ("CPU_TIME" not in self.decoded_json_result()["callgraph"]["children"]["bottom"]["children"]["middle"]
+                ["children"]["top"]["counts"])
+
+    def test_it_includes_the_cpu_time_sample_weight_in_the_agent_metadata(self):
+        assert (self.decoded_json_result()["agentMetadata"]["sampleWeights"]["CPU_TIME"] == 1.0)
+
+
+class TestWhenThreadStatesAreClassified(TestSdkProfileEncoder):
+    @before
+    def before(self):
+        super().before()
+        self.profile.add(Sample(stacks=[[Frame("bottom"), Frame("middle")], [Frame("bottom"), Frame("middle")]],
+                                thread_states=["RUNNABLE", "BLOCKED"]))
+
+    def test_it_includes_the_thread_state_counts_alongside_the_wall_time_counts(self):
+        assert (self.decoded_json_result()["callgraph"]["children"]["bottom"]["children"]["middle"]["counts"] == {
+            "WALL_TIME": 3,
+            "RUNNABLE": 1,
+            "BLOCKED": 1
+        })
+
+    def test_it_uses_the_wall_time_sample_weight_for_the_thread_states(self):
+        sample_weights = self.decoded_json_result()["agentMetadata"]["sampleWeights"]
+        assert (sample_weights["RUNNABLE"] == sample_weights["WALL_TIME"])
+        assert (sample_weights["BLOCKED"] == sample_weights["WALL_TIME"])
+        assert (sample_weights["IDLE"] == sample_weights["WALL_TIME"])
+
+
 class TestWhenGzippingIsEnabled(TestSdkProfileEncoder):
     @before
     def before(self):
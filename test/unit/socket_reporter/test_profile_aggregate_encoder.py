@@ -0,0 +1,117 @@
+import io
+
+from unittest.mock import Mock
+
+from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo, ErrorsMetadata
+from codeguru_profiler_agent.model.frame import Frame
+from codeguru_profiler_agent.model.profile import Profile
+from codeguru_profiler_agent.model.sample import Sample
+from codeguru_profiler_agent.socket_reporter.profile_aggregate_encoder import ProfileAggregateEncoder
+from test.pytestutils import before
+
+TEST_START_TIME = 1603884061556
+
+
+def _new_profile():
+    clock = Mock(return_value=(TEST_START_TIME + 1000) / 1000)
+    return Profile(profiling_group_name="foo", sampling_interval_seconds=1.0, host_weight=1, start=TEST_START_TIME,
+                   agent_debug_info=AgentDebugInfo(ErrorsMetadata()), clock=clock)
+
+
+def _encode(profile):
+    stream = io.BytesIO()
+    ProfileAggregateEncoder().encode(profile=profile, output_stream=stream)
+    return stream.getvalue()
+
+
+def _find_node(node, *frame_names):
+    for frame_name in frame_names:
+        node = next(child for child in node.children if child.frame_name == frame_name)
+    return node
+
+
+class TestProfileAggregateEncoder:
+    @before
+    def before(self):
+        self.worker_profile = _new_profile()
+        self.worker_profile.add(Sample(stacks=[
+            [Frame("main", file_path="app.py", line_no=1), Frame("handle", class_name="Handler", line_no=10)],
+            [Frame("main", file_path="app.py", line_no=1), Frame("handle", class_name="Handler", line_no=20)],
+            [Frame("main", file_path="app.py", line_no=1)]
+        ], attempted_sample_threads_count=3, seen_threads_count=4))
+        self.aggregating_profile = _new_profile()
+        self.aggregating_profile.add(Sample(stacks=[[Frame("main", file_path="app.py", line_no=5)]],
+                                            attempted_sample_threads_count=1, seen_threads_count=1))
+
+    def test_it_rebuilds_the_call_graph(self):
+        target = _new_profile()
+
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=target)
+
+        assert [child.frame_name for child in target.callgraph.children] == ["main"]
+        assert [child.frame_name for child in _find_node(target.callgraph, "main").children] == ["handle"]
+
+    def test_it_sums_runnable_counts_of_matching_nodes(self):
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=self.aggregating_profile)
+
+        assert _find_node(self.aggregating_profile.callgraph, "main").runnable_count == 2
+        assert _find_node(self.aggregating_profile.callgraph, "main", "handle").runnable_count == 2
+
+    def test_it_sums_cpu_times_of_matching_nodes(self):
+        self.worker_profile.add(Sample(stacks=[[Frame("main", file_path="app.py", line_no=1)]], cpu_times=[0.5]))
+        self.aggregating_profile.add(Sample(stacks=[[Frame("main", file_path="app.py", line_no=5)]], cpu_times=[0.25]))
+
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=self.aggregating_profile)
+
+        assert self.aggregating_profile.has_cpu_time
+        assert _find_node(self.aggregating_profile.callgraph, "main").cpu_time_seconds == 0.75
+        assert _find_node(self.aggregating_profile.callgraph, "main", "handle").cpu_time_seconds is None
+
+    def test_it_keeps_frame_details(self):
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=self.aggregating_profile)
+
+        handle_node = _find_node(self.aggregating_profile.callgraph, "main", "handle")
+        assert handle_node.class_name == "Handler"
+        assert _find_node(self.aggregating_profile.callgraph, "main").file_path == "app.py"
+
+    def test_it_widens_line_ranges(self):
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=self.aggregating_profile)
+
+        main_node = _find_node(self.aggregating_profile.callgraph, "main")
+        handle_node = _find_node(self.aggregating_profile.callgraph, "main", "handle")
+        assert (main_node.start_line, main_node.end_line) == (1, 5)
+        assert (handle_node.start_line, handle_node.end_line) == (10, 20)
+
+    def test_it_sums_sample_and_thread_counts(self):
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=self.aggregating_profile)
+
+        assert self.aggregating_profile.total_sample_count == 2
+        assert self.aggregating_profile.total_seen_threads_count == 5
+        assert self.aggregating_profile.total_attempted_sample_threads_count == 4
+
+    def test_it_sums_task_counts(self):
+        self.worker_profile.add(Sample(stacks=[], attempted_sample_tasks_count=1, seen_tasks_count=3))
+
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=self.aggregating_profile)
+
+        assert self.aggregating_profile.total_seen_tasks_count == 3
+        assert self.aggregating_profile.total_attempted_sample_tasks_count == 1
+
+    def test_it_merges_the_time_range_of_the_aggregate(self):
+        target = Profile(profiling_group_name="foo", sampling_interval_seconds=1.0, host_weight=1,
+                         start=TEST_START_TIME + 500, agent_debug_info=AgentDebugInfo(ErrorsMetadata()),
+                         clock=Mock(return_value=(TEST_START_TIME + 1000) / 1000))
+
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=target)
+
+        assert target.start == TEST_START_TIME
+        assert target.cpu_time_seconds is None
+
+    def test_it_encodes_deep_stacks_without_recursion(self):
+        deep_stack = [Frame("frame_" + str(i)) for i in range(5000)]
+        self.worker_profile.add(Sample(stacks=[deep_stack]))
+        target = _new_profile()
+
+        ProfileAggregateEncoder().decode_into(payload=_encode(self.worker_profile), profile=target)
+
+        assert _find_node(target.callgraph, *[frame.name for frame in deep_stack]).runnable_count == 1
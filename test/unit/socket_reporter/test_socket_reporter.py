@@ -0,0 +1,125 @@
+import os
+import shutil
+import socket
+import tempfile
+import pytest
+
+from unittest.mock import MagicMock, ANY, patch
+
+from codeguru_profiler_agent.socket_reporter.aggregation_server import AggregationServer
+from codeguru_profiler_agent.socket_reporter.profile_aggregate_encoder import ProfileAggregateEncoder
+from codeguru_profiler_agent.socket_reporter.socket_reporter import SocketReporter
+from test.help_utils import wait_for
+
+
+class TestSocketReporter:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.temporary_directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temporary_directory, "aggregation.sock")
+        self.profile_aggregate_encoder = MagicMock(name="profile_aggregate_encoder", spec=ProfileAggregateEncoder)
+        self.profile_aggregate_encoder.encode.side_effect = \
+            lambda **args: args["output_stream"].write(b"output-from-encoder")
+        self.profile = MagicMock(name="profile")
+        self.environment = {
+            "aggregation_socket_path": self.socket_path,
+            "profile_aggregate_encoder": self.profile_aggregate_encoder
+        }
+        self.server = AggregationServer(environment=self.environment)
+        self.subject = SocketReporter(environment=self.environment)
+        yield
+        self.server.stop()
+        shutil.rmtree(self.temporary_directory)
+
+    def test_it_calls_the_encoder_with_the_profile(self):
+        self.subject.report(self.profile)
+
+        self.profile_aggregate_encoder.encode.assert_called_once_with(profile=self.profile, output_stream=ANY)
+
+    def test_it_sends_the_aggregate_to_the_server(self):
+        self.server.start()
+
+        assert self.subject.report(self.profile)
+
+        received = []
+        wait_for(lambda: received.extend(self.server.pending_aggregates()) or received)
+        assert received == [b"output-from-encoder"]
+
+    def test_it_returns_false_when_no_server_is_listening(self):
+        assert not self.subject.report(self.profile)
+
+
+class TestAggregationServer:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.temporary_directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temporary_directory, "aggregation.sock")
+        self.subject = AggregationServer(environment={
+            "aggregation_socket_path": self.socket_path
+        })
+        self.subject.start()
+        yield
+        self.subject.stop()
+        shutil.rmtree(self.temporary_directory)
+
+    def test_it_restricts_the_socket_to_the_current_user(self):
+        assert os.stat(self.socket_path).st_mode & 0o077 == 0
+
+    def test_stop_removes_the_socket_file_and_stops_the_thread(self):
+        self.subject.stop()
+
+        assert not os.path.exists(self.socket_path)
+        assert not self.subject.is_running()
+
+    def test_it_drops_aggregates_bigger_than_the_max_aggregate_size(self):
+        self.subject.stop()
+        self.subject = AggregationServer(environment={
+            "aggregation_socket_path": self.socket_path,
+            "max_aggregate_size_bytes": 10,
+            "memory_limit_bytes": 1024
+        })
+        self.subject.start()
+
+        for payload in [b"x" * 11, b"y" * 10]:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(self.socket_path)
+                connection.sendall(payload)
+
+        received = []
+        wait_for(lambda: received.extend(self.subject.pending_aggregates()) or received)
+        assert received == [b"y" * 10]
+
+
+class TestAggregationServerStart:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.temporary_directory = tempfile.mkdtemp()
+        self.socket_directory = os.path.join(self.temporary_directory, "codeguru-profiler")
+        self.socket_path = os.path.join(self.socket_directory, "aggregation.sock")
+        self.subject = AggregationServer(environment={
+            "aggregation_socket_path": self.socket_path
+        })
+        yield
+        self.subject.stop()
+        shutil.rmtree(self.temporary_directory)
+
+    def test_it_creates_the_socket_directory_only_accessible_to_the_current_user(self):
+        assert self.subject.start()
+
+        assert os.stat(self.socket_directory).st_mode & 0o777 == 0o700
+        assert self.subject.is_running()
+
+    def test_it_does_not_start_in_a_directory_other_users_can_write_to(self):
+        os.mkdir(self.socket_directory)
+        os.chmod(self.socket_directory, 0o777)
+
+        assert not self.subject.start()
+
+        assert not os.path.exists(self.socket_path)
+        assert not self.subject.is_running()
+
+    def test_it_does_not_start_when_the_stale_socket_file_cannot_be_removed(self):
+        with patch.object(self.subject, "_remove_stale_socket_file", side_effect=PermissionError("denied")):
+            assert not self.subject.start()
+
+        assert not self.subject.is_running()
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+from unittest import mock
+
+from test.pytestutils import before
+from codeguru_profiler_agent import endpoint_labels
+from codeguru_profiler_agent.endpoint_labels import endpoint_frame, set_endpoint, endpoints_by_thread_id, \
+    current_endpoint, OTHER_ENDPOINT_FRAME
+
+
+class TestEndpointLabels:
+    @before
+    def before(self):
+        endpoint_labels._endpoint_frames.clear()
+        yield
+        endpoint_labels._endpoint_frames.clear()
+        endpoints_by_thread_id.pop(threading.get_ident(), None)
+
+    @pytest.mark.parametrize("endpoint, expected_frame_name", [
+        ("GET /users", "<endpoint:GET /users>"),
+        ("GET /users/42/orders/7", "<endpoint:GET /users/{id}/orders/{id}>"),
+        ("DELETE /items/0b5a5f2e-6a3c-4c7e-9d1e-0f8e4c2b1a3d", "<endpoint:DELETE /items/{id}>"),
+        ("GET /blobs/0123456789abcdef0123", "<endpoint:GET /blobs/{id}>"),
+        ("GET /v2/users", "<endpoint:GET /v2/users>"),
+    ])
+    def test_it_replaces_identifiers_in_the_path(self, endpoint, expected_frame_name):
+        assert endpoint_frame(endpoint).name == expected_frame_name
+
+    def test_it_returns_none_without_endpoint(self):
+        assert endpoint_frame(None) is None
+
+    def test_it_caches_the_endpoint_frames(self):
+        assert endpoint_frame("GET /users/42") is endpoint_frame("GET /users/42")
+
+    def test_it_returns_the_other_frame_when_there_are_too_many_endpoints(self):
+        with mock.patch.object(endpoint_labels, "MAX_ENDPOINT_FRAMES", 2):
+            endpoint_frame("GET /a")
+            endpoint_frame("GET /b")
+
+            assert endpoint_frame("GET /c") is OTHER_ENDPOINT_FRAME
+            assert endpoint_frame("GET /a").name == "<endpoint:GET /a>"
+
+    def test_paths_with_different_identifiers_share_one_endpoint_frame(self):
+        with mock.patch.object(endpoint_labels, "MAX_ENDPOINT_FRAMES", 2):
+            for user_id in range(10):
+                endpoint_frame("GET /users/{}".format(user_id))
+
+            assert endpoint_frame("GET /users/11").name == "<endpoint:GET /users/{id}>"
+            assert endpoint_frame("GET /orders/1").name == "<endpoint:GET /orders/{id}>"
+
+    def test_set_endpoint_replaces_the_endpoint_of_the_current_thread(self):
+        endpoints_by_thread_id[threading.get_ident()] = "GET /users/alice"
+
+        set_endpoint("GET /users/<name>")
+
+        assert endpoints_by_thread_id[threading.get_ident()] == "GET /users/<name>"
+
+    def test_set_endpoint_replaces_the_endpoint_of_the_current_context(self):
+        token = current_endpoint.set("GET /users/alice")
+        try:
+            set_endpoint("GET /users/<name>")
+
+            assert current_endpoint.get() == "GET /users/<name>"
+        finally:
+            current_endpoint.reset(token)
+
+    def test_set_endpoint_does_nothing_outside_of_a_request(self):
+        set_endpoint("GET /users/<name>")
+
+        assert threading.get_ident() not in endpoints_by_thread_id
+        assert current_endpoint.get() is None
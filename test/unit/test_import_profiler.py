@@ -0,0 +1,123 @@
+import importlib
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+from test.pytestutils import before
+
+from codeguru_profiler_agent.agent_metadata.agent_metadata import AgentMetadata
+from codeguru_profiler_agent.agent_metadata.fleet_info import DefaultFleetInfo
+from codeguru_profiler_agent.import_profiler import ImportProfiler, ImportNode
+from codeguru_profiler_agent.sdk_reporter.profile_encoder import ProfileEncoder
+
+
+class TestImportProfiler:
+    @before
+    def before(self):
+        self.temporary_directory = tempfile.mkdtemp()
+        self._write_module("import_profiler_test_parent", "import import_profiler_test_child\nVALUE = 1\n")
+        self._write_module("import_profiler_test_child", "VALUE = 2\n")
+        sys.path.insert(0, self.temporary_directory)
+        importlib.invalidate_caches()
+        self.import_profiler = ImportProfiler()
+        yield
+        self.import_profiler.stop()
+        sys.path.remove(self.temporary_directory)
+        for module_name in ("import_profiler_test_parent", "import_profiler_test_child"):
+            sys.modules.pop(module_name, None)
+        shutil.rmtree(self.temporary_directory)
+
+    def test_it_records_the_tree_of_imported_modules(self):
+        self.import_profiler.start()
+        import import_profiler_test_parent  # noqa: F401
+        self.import_profiler.stop()
+
+        parent = self.import_profiler.root.children["import_profiler_test_parent"]
+        child = parent.children["import_profiler_test_child"]
+        assert child.cumulative_seconds > 0
+        assert parent.cumulative_seconds >= child.cumulative_seconds
+
+    def test_imported_modules_get_their_original_loader_back(self):
+        self.import_profiler.start()
+        import import_profiler_test_parent
+        self.import_profiler.stop()
+
+        assert type(import_profiler_test_parent.__loader__).__name__ == "SourceFileLoader"
+        assert import_profiler_test_parent.__spec__.loader is import_profiler_test_parent.__loader__
+
+    def test_it_does_not_record_imports_once_stopped(self):
+        self.import_profiler.start()
+        self.import_profiler.stop()
+        import import_profiler_test_parent  # noqa: F401
+
+        assert self.import_profiler.root.children == {}
+        assert not self.import_profiler.is_running()
+
+    def test_it_gives_the_original_finders_back_once_stopped(self):
+        finders = list(sys.meta_path)
+
+        self.import_profiler.start()
+        self.import_profiler.stop()
+
+        assert all(finder is original for finder, original in zip(sys.meta_path, finders))
+        assert len(sys.meta_path) == len(finders)
+
+    def test_it_searches_a_missing_module_once(self):
+        class CountingFinder:
+            searches = 0
+
+            def find_spec(self, fullname, path=None, target=None):
+                if fullname == "import_profiler_test_missing":
+                    CountingFinder.searches += 1
+                return None
+        sys.meta_path.append(CountingFinder())
+        try:
+            self.import_profiler.start()
+            assert importlib.util.find_spec("import_profiler_test_missing") is None
+            self.import_profiler.stop()
+        finally:
+            sys.meta_path.pop()
+
+        assert CountingFinder.searches == 1
+
+    def _write_module(self, module_name, code):
+        with open(os.path.join(self.temporary_directory, module_name + ".py"), "w") as module_file:
+            module_file.write(code)
+
+
+class TestToProfile:
+    @before
+    def before(self):
+        self.import_profiler = ImportProfiler()
+        self.import_profiler.start_time_ms = 1000000
+        parent = ImportNode("parent")
+        parent.cumulative_seconds = 0.5
+        child = ImportNode("child")
+        child.cumulative_seconds = 0.2
+        parent.children["child"] = child
+        self.import_profiler.root.children["parent"] = parent
+
+    def test_counts_are_the_self_time_in_microseconds(self):
+        profile = self.import_profiler.to_profile("test-group")
+
+        parent = profile.callgraph.children[0]
+        assert parent.frame_name == "parent"
+        assert parent.runnable_count == 300000
+        assert parent.children[0].frame_name == "child"
+        assert parent.children[0].runnable_count == 200000
+
+    def test_the_sampling_interval_is_a_whole_number_of_milliseconds(self):
+        profile = self.import_profiler.to_profile("test-group")
+
+        assert profile.sampling_interval_ms == 1
+
+    def test_the_sample_weight_converts_the_counts_to_seconds(self):
+        profile = self.import_profiler.to_profile("test-group")
+
+        assert profile.get_active_millis_since_start() == 500
+        assert profile.total_sample_count / (profile.get_active_millis_since_start() / 1000) == 1000000
+        # the profile can be encoded like sampled profiles
+        assert "parent" in ProfileEncoder.debug_pretty_encode(profile, environment={
+            "agent_metadata": AgentMetadata(fleet_info=DefaultFleetInfo())})
@@ -18,6 +18,7 @@ from codeguru_profiler_agent.metrics.timer import Timer
 from codeguru_profiler_agent.metrics.metric import Metric
 from codeguru_profiler_agent.model.profile import Profile
 from codeguru_profiler_agent.model.sample import Sample
+from codeguru_profiler_agent.model.frame import Frame
 
 CURRENT_TIME_FOR_TESTING_MILLI = 1528887859058
 CURRENT_TIME_FOR_TESTING_SECOND = 1528887859.058
@@ -381,3 +382,158 @@ class TestLastFlushWasWithinMinTimeForReporting(TestLocalAggregator):
     def test_exception_raised_when_memory_usage_exceeded(self):
         with pytest.raises(OverMemoryLimitException):
             self.subject.add(self.sample)
+
+
+class TestWhenAggregationServerIsConfigured(TestLocalAggregator):
+    @before
+    def before(self):
+        super().before()
+        self.mock_profile.get_memory_usage_bytes = MagicMock(return_value=DEFAULT_MEMORY_LIMIT_BYTES - 1)
+        self.mock_profile.is_empty = MagicMock(return_value=False)
+        self.mock_profile.start = CURRENT_TIME_FOR_TESTING_MILLI
+        self.mock_aggregation_server = MagicMock(name="aggregation_server")
+        self.mock_aggregation_server.pending_aggregates.return_value = [b"aggregate1", b"aggregate2"]
+        self.mock_profile_aggregate_encoder = MagicMock(name="profile_aggregate_encoder")
+        self.environment["aggregation_server"] = self.mock_aggregation_server
+        self.environment["profile_aggregate_encoder"] = self.mock_profile_aggregate_encoder
+        self.subject = LocalAggregator(**self.configuration)
+        self.sample = Sample([["method1", "method2"]])
+
+    def test_it_merges_pending_aggregates_when_adding_a_sample(self):
+        self.move_clock_to(ONE_SECOND)
+        self.subject.add(self.sample)
+
+        self.mock_profile_aggregate_encoder.decode_into.assert_has_calls([
+            call(payload=b"aggregate1", profile=self.mock_profile),
+            call(payload=b"aggregate2", profile=self.mock_profile)
+        ])
+
+    def test_it_merges_pending_aggregates_before_reporting(self):
+        self.move_clock_to(self.reporting_interval + ONE_SECOND)
+        merged_before_report = []
+        self.mock_reporter.report.side_effect = \
+            lambda profile: merged_before_report.append(self.mock_profile_aggregate_encoder.decode_into.call_count)
+
+        self.subject.flush()
+
+        assert merged_before_report == [2]
+
+    def test_it_keeps_going_when_an_aggregate_cannot_be_merged(self):
+        self.move_clock_to(ONE_SECOND)
+        self.mock_profile_aggregate_encoder.decode_into.side_effect = [ValueError("corrupted"), None]
+
+        self.subject.add(self.sample)
+
+        assert self.mock_profile_aggregate_encoder.decode_into.call_count == 2
+
+
+class TestProfileSwap(TestLocalAggregator):
+    @before
+    def before(self):
+        super().before()
+        del self.environment["profile_factory"]
+        self.timer.metrics = {}
+        self.subject = LocalAggregator(**self.configuration)
+        self.move_clock_to(ONE_SECOND)
+        self.subject.add(Sample([[Frame("method1")]], seen_threads_count=1))
+        self.move_clock_to(self.reporting_interval + ONE_SECOND)
+
+    def test_it_reports_a_sealed_profile(self):
+        reported_profile = self.subject.profile
+
+        self.subject.flush()
+
+        self.mock_reporter.report.assert_called_once_with(reported_profile)
+        assert reported_profile.is_sealed()
+
+    def test_sampling_continues_into_a_new_profile_while_reporting(self):
+        reported_profile = self.subject.profile
+
+        def sample_while_reporting(profile):
+            self.move_clock_to(self.reporting_interval + 2 * ONE_SECOND)
+            self.subject.add(Sample([[Frame("method2")]], seen_threads_count=1))
+
+        self.mock_reporter.report.side_effect = sample_while_reporting
+
+        self.subject.flush()
+
+        assert self.subject.profile is not reported_profile
+        assert self.subject.profile.total_sample_count == 1
+        assert reported_profile.total_sample_count == 1
+
+    def test_when_flushing_without_reset_it_keeps_the_sealed_profile_until_reset(self):
+        reported_profile = self.subject.profile
+
+        self.subject.flush(reset=False)
+        new_profile = self.subject.profile
+
+        assert self.subject.sealed_profile is reported_profile
+        self.subject.reset()
+        assert self.subject.sealed_profile is None
+        assert self.subject.profile is new_profile
+
+    def test_the_new_profile_starts_when_it_is_swapped_in(self):
+        self.subject.flush()
+
+        assert self.subject.profile.start == current_milli_time(self.clock)
+
+    def test_the_new_profile_stays_paused_when_the_reported_one_was_paused(self):
+        self.subject.profile.pause()
+
+        self.subject.flush()
+        self.move_clock_to(self.reporting_interval + timedelta(hours=1))
+        self.subject.profile.resume()
+
+        assert self.subject.profile.get_active_millis_since_start() == 0
+
+    def test_the_new_profile_is_not_paused_when_the_reported_one_was_not(self):
+        self.subject.flush()
+        self.move_clock_to(self.reporting_interval + 2 * ONE_SECOND)
+
+        assert self.subject.profile.get_active_millis_since_start() == 1000
+
+
+class TestTimeSlices(TestLocalAggregator):
+    @before
+    def before(self):
+        super().before()
+        del self.environment["profile_factory"]
+        self.environment["time_slice_duration"] = timedelta(minutes=1)
+        self.environment["max_time_slices"] = 2
+        self.timer.metrics = {}
+        self.subject = LocalAggregator(**self.configuration)
+
+    def add_sample_at(self, duration_timedelta, frame_name):
+        self.move_clock_to(duration_timedelta)
+        self.subject.add(Sample([[Frame(frame_name)]], seen_threads_count=1))
+
+    def test_it_starts_a_new_time_slice_every_time_slice_duration(self):
+        self.add_sample_at(ONE_SECOND, "method1")
+        self.add_sample_at(2 * ONE_SECOND, "method1")
+        self.add_sample_at(timedelta(minutes=1, seconds=2), "method2")
+
+        time_slices = self.subject.profile.time_slices
+        assert [time_slice.total_sample_count for time_slice in time_slices] == [2, 1]
+        assert self.subject.profile.total_sample_count == 3
+
+    def test_it_merges_the_oldest_time_slices_into_the_profile(self):
+        self.add_sample_at(ONE_SECOND, "method1")
+        self.add_sample_at(timedelta(minutes=1, seconds=2), "method2")
+        self.add_sample_at(timedelta(minutes=2, seconds=3), "method3")
+
+        profile = self.subject.profile
+        assert len(profile.time_slices) == 2
+        assert [child.frame_name for child in profile.callgraph.children] == ["method1"]
+
+    def test_the_reported_profile_holds_all_the_samples_and_its_time_slices(self):
+        self.add_sample_at(ONE_SECOND, "method1")
+        self.add_sample_at(timedelta(minutes=1, seconds=2), "method2")
+        reported_profile = self.subject.profile
+        self.move_clock_to(self.reporting_interval + ONE_SECOND)
+
+        self.subject.flush()
+
+        assert sorted(child.frame_name for child in reported_profile.callgraph.children) == ["method1", "method2"]
+        assert len(reported_profile.time_slices) == 2
+        assert all(time_slice.is_sealed() for time_slice in reported_profile.time_slices)
+        assert self.subject.profile.time_slices == []
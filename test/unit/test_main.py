@@ -1,5 +1,10 @@
 import pytest
 import os
+import shutil
+import tempfile
+from unittest import mock
+
+import codeguru_profiler_agent.__main__
 from codeguru_profiler_agent.__main__ import main
 from codeguru_profiler_agent.profiler_builder import PG_NAME_ENV, ENABLED_ENV
 
@@ -98,6 +103,40 @@ class TestMain:
         assert profiler is not None
         assert isinstance(profiler, Profiler)
 
+    def test_it_writes_the_import_profile_instead_of_sampling_when_profiling_imports(self):
+        temporary_directory = tempfile.mkdtemp()
+        args = ['--profile-imports', self.script_file_name, '--where', 'zoo', 'foo']
+        try:
+            with mock.patch.object(codeguru_profiler_agent.__main__, "IMPORT_PROFILE_FILE_PREFIX",
+                                   os.path.join(temporary_directory, "imports-")):
+                main(args, start_profiler=lambda *args: pytest.fail("the sampling profiler should not start"))
+            assert self._script_was_called()
+            assert [file_name.startswith("imports-") for file_name in os.listdir(temporary_directory)] == [True]
+        finally:
+            shutil.rmtree(temporary_directory)
+
+    def test_it_writes_the_profile_to_the_output_file_instead_of_sending_it(self):
+        temporary_directory = tempfile.mkdtemp()
+        output_path = os.path.join(temporary_directory, "profile.folded")
+        script_file_name = os.path.join(temporary_directory, "sleeping_script.py")
+        with open(script_file_name, "w") as script_file:
+            script_file.write("import time\ntime.sleep(0.5)\n")
+        args = ['-o', output_path, script_file_name]
+        try:
+            main(args, env={"AWS_CODEGURU_PROFILER_SAMPLING_INTERVAL_MS": "10"},
+                 start_profiler=lambda *args: pytest.fail("the profiler sending profiles should not start"))
+            with open(output_path) as output_file:
+                assert "sleeping_script:<module>" in output_file.read()
+        finally:
+            shutil.rmtree(temporary_directory)
+
+    def test_it_infers_the_output_format_from_the_output_file_extension(self):
+        from codeguru_profiler_agent.__main__ import _output_format_of
+        assert _output_format_of("profile.folded") == "folded"
+        assert _output_format_of("profile.speedscope.json") == "speedscope"
+        assert _output_format_of("profile.pb.gz") == "pprof"
+        assert _output_format_of("profile.json") == "json"
+
     def _script_was_called(self):
         return os.path.exists(self.flag_file_name)
 
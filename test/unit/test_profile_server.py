@@ -0,0 +1,171 @@
+import gzip
+import json
+import threading
+import pytest
+
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import codeguru_profiler_agent.profile_server
+from codeguru_profiler_agent.agent_metadata.agent_debug_info import AgentDebugInfo
+from codeguru_profiler_agent.agent_metadata.agent_metadata import AgentMetadata
+from codeguru_profiler_agent.agent_metadata.fleet_info import DefaultFleetInfo
+from codeguru_profiler_agent.metrics.timer import Timer
+from codeguru_profiler_agent.model.frame import Frame
+from codeguru_profiler_agent.model.profile import Profile
+from codeguru_profiler_agent.model.sample import Sample
+from codeguru_profiler_agent.profile_server import ProfileServer, _ProfileRequest
+from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+from test.help_utils import wait_for
+
+START_TIME_MS = 1603884061556
+
+
+class TestProfileServer:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        AgentConfiguration.set(AgentConfiguration(
+            should_profile=True,
+            sampling_interval=timedelta(seconds=1),
+            reporting_interval=timedelta(minutes=5),
+            max_stack_depth=1000))
+        self.now_seconds = START_TIME_MS / 1000
+        self.timer = Timer()
+        self.profile = Profile(profiling_group_name="test-group", sampling_interval_seconds=1.0, host_weight=1,
+                               start=START_TIME_MS, agent_debug_info=AgentDebugInfo(), clock=self.clock)
+        self.subject = ProfileServer(environment={
+            "profiling_group_name": "test-group",
+            "host_weight": 1,
+            "profile_server_port": 0,
+            "timer": self.timer,
+            "clock": self.clock,
+            "agent_metadata": AgentMetadata(fleet_info=DefaultFleetInfo())
+        })
+        self.subject.start()
+        self.sampling = threading.Event()
+        self.profiler_thread = threading.Thread(target=self.sample_until_stopped, daemon=True)
+        self.profiler_thread.start()
+        yield
+        self.sampling.set()
+        self.profiler_thread.join()
+        self.subject.stop()
+
+    def clock(self):
+        return self.now_seconds
+
+    def sample_until_stopped(self):
+        # plays the role of the profiler thread, the clock moves one second per sample
+        while not self.sampling.wait(0.01):
+            self.now_seconds += 1
+            sample = Sample(stacks=[[Frame("bottom"), Frame("top")]], attempted_sample_threads_count=1,
+                            seen_threads_count=1)
+            self.profile.add(sample)
+            self.subject.process_pending_requests(self.profile, sample)
+
+    def get(self, path):
+        return urlopen("http://127.0.0.1:{}{}".format(self.subject.port, path), timeout=10)
+
+    def test_it_serves_the_profile_being_collected(self):
+        with self.get("/profile?format=folded") as response:
+            assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
+            line = response.read().decode("utf-8").splitlines()[0]
+        assert line.startswith("bottom;top ")
+
+    def test_it_serves_the_profile_in_the_codeguru_profiler_format_by_default(self):
+        with self.get("/profile") as response:
+            assert json.loads(response.read().decode("utf-8"))["callgraph"]["children"]["bottom"]
+
+    def test_it_captures_the_profile_of_the_next_seconds(self):
+        wait_for(lambda: self.profile.total_sample_count > 0)
+
+        with self.get("/profile?format=pprof&seconds=3") as response:
+            body = response.read()
+        assert gzip.decompress(body)
+
+    def test_a_captured_profile_only_has_the_samples_of_the_capture(self):
+        wait_for(lambda: self.profile.total_sample_count > 5, timeout_seconds=5)
+
+        with self.get("/profile?format=folded&seconds=3") as response:
+            line = response.read().decode("utf-8").splitlines()[0]
+        # the clock moves one second per sample, and the capture ends at the first sample after it expired
+        assert line in ("bottom;top 2", "bottom;top 3")
+
+    def test_it_serves_the_timer_metrics(self):
+        self.timer.record("sampleAndAggregate", 0.5)
+
+        with self.get("/metrics") as response:
+            metrics = json.loads(response.read().decode("utf-8"))
+        assert metrics["sampleAndAggregate"]["counter"] == 1
+        assert metrics["sampleAndAggregate"]["max"] == 0.5
+
+    def test_it_serves_the_percentiles_of_the_timer_metrics(self):
+        for duration in range(1, 101):
+            self.timer.record("sampleAndAggregate", duration / 100)
+
+        with self.get("/metrics") as response:
+            metrics = json.loads(response.read().decode("utf-8"))
+        assert metrics["sampleAndAggregate"]["p50"] == pytest.approx(0.5, rel=0.0625)
+        assert metrics["sampleAndAggregate"]["p999"] == pytest.approx(1.0, rel=0.0625)
+
+    def test_it_rejects_an_unknown_format(self):
+        with pytest.raises(HTTPError) as error:
+            self.get("/profile?format=xml")
+        assert error.value.code == 400
+
+    def test_it_rejects_a_capture_that_is_too_long(self):
+        with pytest.raises(HTTPError) as error:
+            self.get("/profile?seconds=3600")
+        assert error.value.code == 400
+
+    def test_it_answers_not_found_for_other_paths(self):
+        with pytest.raises(HTTPError) as error:
+            self.get("/other")
+        assert error.value.code == 404
+
+    def test_it_answers_unavailable_when_the_profiler_is_not_sampling(self, monkeypatch):
+        monkeypatch.setattr(codeguru_profiler_agent.profile_server, "SAMPLE_TIMEOUT_SECONDS", 0.1)
+        self.sampling.set()
+        self.profiler_thread.join()
+
+        with pytest.raises(HTTPError) as error:
+            self.get("/profile")
+        assert error.value.code == 503
+
+
+class TestProcessPendingRequests:
+    def test_the_requests_received_since_the_last_sample_share_one_snapshot(self):
+        subject = ProfileServer(environment={"profiling_group_name": "test-group", "host_weight": 1})
+        profile = MagicMock(name="profile", spec=Profile)
+        requests = [_ProfileRequest(), _ProfileRequest(), _ProfileRequest()]
+        for request in requests:
+            subject._pending_requests.put_nowait(request)
+
+        subject.process_pending_requests(profile, Sample(stacks=[[Frame("bottom")]]))
+
+        profile.snapshot.assert_called_once()
+        assert [request.wait(0) for request in requests] == [profile.snapshot.return_value] * 3
+
+    def test_it_does_not_take_a_snapshot_without_pending_requests(self):
+        subject = ProfileServer(environment={"profiling_group_name": "test-group", "host_weight": 1})
+        profile = MagicMock(name="profile", spec=Profile)
+
+        subject.process_pending_requests(profile, Sample(stacks=[[Frame("bottom")]]))
+
+        profile.snapshot.assert_not_called()
+
+
+class TestWhenThePortIsInUse:
+    def test_it_does_not_start(self):
+        first_server = ProfileServer(environment={"profiling_group_name": "test-group", "host_weight": 1,
+                                                  "profile_server_port": 0})
+        first_server.start()
+        try:
+            subject = ProfileServer(environment={"profiling_group_name": "test-group", "host_weight": 1,
+                                                 "profile_server_port": first_server.port})
+            subject.start()
+            assert not subject.is_running()
+        finally:
+            first_server.stop()
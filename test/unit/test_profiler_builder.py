@@ -132,6 +132,27 @@ class TestProfilerBuilder:
                                                      environment_override={
                                                          "reporting_interval": datetime.timedelta(seconds=60)})
 
+    class TestWhenInvocationSamplingIntervalIsInEnvironment:
+        def test_it_uses_correct_invocation_sampling_interval(self):
+            env = {"AWS_CODEGURU_PROFILER_INVOCATION_SAMPLING_INTERVAL_MS": "10"}
+            profiler_factory = MagicMock(spec=Profiler)
+            subject = build_profiler(pg_name="my_profiling_group", env=env,
+                                     profiler_factory=profiler_factory)
+            profiler_factory.assert_called_once_with(profiling_group_name=ANY, region_name=ANY, aws_session=ANY,
+                                                     environment_override={
+                                                         "invocation_sampling_interval": datetime.timedelta(
+                                                             milliseconds=10)})
+
+    class TestWhenProfileServerPortIsInEnvironment:
+        def test_it_runs_the_profile_server_on_that_port(self):
+            env = {"AWS_CODEGURU_PROFILER_PROFILE_SERVER_PORT": "9000"}
+            profiler_factory = MagicMock(spec=Profiler)
+            subject = build_profiler(pg_name="my_profiling_group", env=env,
+                                     profiler_factory=profiler_factory)
+            profiler_factory.assert_called_once_with(profiling_group_name=ANY, region_name=ANY, aws_session=ANY,
+                                                     environment_override={
+                                                         "run_profile_server": True, "profile_server_port": 9000})
+
     class TestWhenMalformedReportingIntervalIsInEnvironment:
         def test_it_still_creates_a_profiler(self):
             env = {"AWS_CODEGURU_PROFILER_REPORTING_INTERVAL_MS": "12.5"}
@@ -1,14 +1,20 @@
 from datetime import timedelta
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext
 from test.pytestutils import before
 from test.help_utils import wait_for
 from unittest.mock import MagicMock
-from time import sleep
+from time import sleep, process_time
 
-from codeguru_profiler_agent.profiler_runner import ProfilerRunner
+from codeguru_profiler_agent.metrics.timer import Timer
+from codeguru_profiler_agent.profiler_runner import ProfilerRunner, BATCHED_TIMER_METRIC_NAMES
 from codeguru_profiler_agent.profiler_disabler import ProfilerDisabler
 from codeguru_profiler_agent.local_aggregator import LocalAggregator
 from codeguru_profiler_agent.sampler import Sampler
+from codeguru_profiler_agent.profile_server import ProfileServer
+from codeguru_profiler_agent.agent_metadata.agent_debug_info import ErrorsMetadata
+from codeguru_profiler_agent.model.frame import Frame
+from codeguru_profiler_agent.model.sample import Sample
 
 
 class TestProfilerRunner:
@@ -42,11 +48,19 @@ class TestProfilerRunner:
         self.is_time_to_report = False
         self.mock_collector.flush.side_effect = lambda *args, **kwargs: self.is_time_to_report
         self.mock_collector.profile = None  # we need this as we pass the profile object to the disabler, None is fine
+        self.mock_collector.sealed_profile = None
         self.profiler_runner = ProfilerRunner(self.environment)
 
         yield
         self.profiler_runner.stop()
 
+    def test_it_starts_and_stops_the_sampler(self):
+        self.profiler_runner.start()
+        self.profiler_runner.stop()
+
+        self.mock_sampler.start.assert_called_once()
+        self.mock_sampler.stop.assert_called()
+
     def test_when_runner_executes_for_the_first_time(self):
         self.profiler_runner._profiling_command()
         self.mock_collector.refresh_configuration.assert_called_once()
@@ -81,6 +95,85 @@ class TestProfilerRunner:
         self.mock_collector.flush.assert_called_once()
         self.mock_collector.add.assert_not_called()
 
+    def test_report_if_due_reports_and_resets_the_profile(self):
+        self.profiler_runner._profiling_command()
+        self.is_time_to_report = True
+
+        assert self.profiler_runner.report_if_due()
+
+        self.mock_collector.flush.assert_called_with(reset=False)
+        self.mock_collector.reset.assert_called_once()
+        assert not self.profiler_runner.is_profiling_in_progress
+
+    def test_report_if_due_does_not_report_when_not_due(self):
+        self.profiler_runner._profiling_command()
+
+        assert not self.profiler_runner.report_if_due()
+
+        self.mock_collector.reset.assert_not_called()
+
+    def test_report_if_due_does_not_report_before_the_first_profiling_command(self):
+        self.is_time_to_report = True
+
+        assert not self.profiler_runner.report_if_due()
+
+        self.mock_collector.flush.assert_not_called()
+
+    def test_in_batched_timer_mode_it_times_each_tick_once_for_the_cpu_usage_checks(self):
+        timer = Timer(metric_names=BATCHED_TIMER_METRIC_NAMES)
+        self.profiler_runner = ProfilerRunner(dict(self.environment, timer=timer, timer_mode="batched"))
+
+        self.profiler_runner._profiling_command()
+        self.profiler_runner._profiling_command()
+
+        assert timer.metrics["runProfiler"].counter == 2
+        assert timer.metrics["sampleAndAggregate"].counter == 2
+        assert timer.metrics["sampleAndAggregate"].total == timer.metrics["runProfiler"].total
+
+    def test_in_batched_timer_mode_it_does_not_count_reporting_ticks_as_sampling(self):
+        timer = Timer(metric_names=BATCHED_TIMER_METRIC_NAMES)
+        self.profiler_runner = ProfilerRunner(dict(self.environment, timer=timer, timer_mode="batched"))
+        self.is_time_to_report = True
+
+        self.profiler_runner._profiling_command()
+
+        assert timer.metrics["runProfiler"].counter == 1
+        assert "sampleAndAggregate" not in timer.metrics
+
+    def test_it_lets_the_profile_server_answer_its_requests_after_sampling(self):
+        mock_profile_server = MagicMock(name="profile_server", spec=ProfileServer)
+        self.profiler_runner = ProfilerRunner(dict(self.environment, profile_server=mock_profile_server))
+
+        self.profiler_runner._profiling_command()
+
+        mock_profile_server.process_pending_requests.assert_called_once_with(
+            self.mock_collector.profile, self.mock_sampler.sample.return_value)
+
+    def test_answering_the_profile_server_is_timed_as_part_of_the_profiler_run_but_not_as_sampling(self):
+        def busy_profile_server(profile, sample):
+            start = process_time()
+            while process_time() - start < 0.05:
+                pass
+        mock_profile_server = MagicMock(name="profile_server", spec=ProfileServer)
+        mock_profile_server.process_pending_requests.side_effect = busy_profile_server
+        timer = Timer()
+        self.profiler_runner = ProfilerRunner(dict(self.environment, profile_server=mock_profile_server, timer=timer))
+
+        self.profiler_runner._profiling_command()
+
+        assert timer.metrics["processProfileRequests"].total >= 0.05
+        assert timer.metrics["sampleAndAggregate"].total < 0.05
+        assert timer.metrics["runProfiler"].total >= 0.05
+
+    def test_when_it_reports_it_does_not_answer_the_profile_server(self):
+        mock_profile_server = MagicMock(name="profile_server", spec=ProfileServer)
+        self.profiler_runner = ProfilerRunner(dict(self.environment, profile_server=mock_profile_server))
+        self.is_time_to_report = True
+
+        self.profiler_runner._profiling_command()
+
+        mock_profile_server.process_pending_requests.assert_not_called()
+
     def test_when_disabler_says_to_stop_profiling_it_does_not_start(self):
         self.mock_disabler.should_stop_profiling.return_value = True
 
@@ -110,3 +203,105 @@ class TestProfilerRunner:
 
         assert self.profiler_runner.scheduler._get_next_delay_seconds() == 151
         self.mock_collector.add.assert_not_called()
+
+
+class TestInvocationSamplingInterval:
+    @before
+    def before(self):
+        AgentConfiguration.set(AgentConfiguration(should_profile=True,
+                                                  sampling_interval=timedelta(seconds=1),
+                                                  reporting_interval=timedelta(seconds=100)))
+        self.environment = {
+            "collector": MagicMock(name="collector", spec=LocalAggregator),
+            "profiler_disabler": MagicMock(name="profile", spec=ProfilerDisabler),
+            "sampler": MagicMock(name="sampler", spec=Sampler),
+            "initial_sampling_interval": timedelta(),
+            "profiler_thread_name": "codeguru-profiler-agent-TestInvocationSamplingInterval",
+            "invocation_sampling_interval": timedelta(milliseconds=10),
+            "max_samples_per_invocation": 50
+        }
+        self.lambda_context = LambdaContext.get()
+        self.lambda_context.context = MagicMock(name="context")
+        self.lambda_context.last_execution_duration = timedelta()
+        yield
+        self.lambda_context.context = None
+        self.lambda_context.last_execution_duration = None
+
+    def test_it_samples_at_the_invocation_sampling_interval_in_lambda(self):
+        profiler_runner = ProfilerRunner(self.environment)
+        assert profiler_runner._sampling_delay() == timedelta(milliseconds=10)
+
+    def test_it_samples_at_the_invocation_sampling_interval_during_the_first_invocation(self):
+        self.lambda_context.last_execution_duration = None
+        profiler_runner = ProfilerRunner(self.environment)
+        assert profiler_runner._sampling_delay() == timedelta(milliseconds=10)
+
+    def test_it_stretches_the_interval_to_bound_the_samples_of_long_invocations(self):
+        self.lambda_context.last_execution_duration = timedelta(seconds=2)
+        profiler_runner = ProfilerRunner(self.environment)
+        assert profiler_runner._sampling_delay() == timedelta(milliseconds=40)
+
+    def test_it_does_not_exceed_the_sampling_interval(self):
+        self.lambda_context.last_execution_duration = timedelta(minutes=5)
+        profiler_runner = ProfilerRunner(self.environment)
+        assert profiler_runner._sampling_delay() == timedelta(seconds=1)
+
+    def test_it_uses_the_sampling_interval_outside_of_lambda(self):
+        self.lambda_context.context = None
+        profiler_runner = ProfilerRunner(self.environment)
+        assert profiler_runner._sampling_delay() == timedelta(seconds=1)
+
+    def test_it_uses_the_sampling_interval_when_not_set(self):
+        del self.environment["invocation_sampling_interval"]
+        profiler_runner = ProfilerRunner(self.environment)
+        assert profiler_runner._sampling_delay() == timedelta(seconds=1)
+
+
+class TestReportIfDueWhilePaused:
+    @before
+    def before(self):
+        self.now_seconds = 1603884061.556
+        AgentConfiguration.set(AgentConfiguration(should_profile=True,
+                                                  sampling_interval=timedelta(seconds=1),
+                                                  minimum_time_reporting=timedelta(seconds=1),
+                                                  reporting_interval=timedelta(seconds=100),
+                                                  max_stack_depth=1000))
+        self.mock_reporter = MagicMock(name="reporter")
+        self.collector = LocalAggregator(reporter=self.mock_reporter, environment={
+            "profiling_group_name": "test-group",
+            "host_weight": 1,
+            "errors_metadata": ErrorsMetadata(),
+            "memory_limit_bytes": 10 * 1024 * 1024,
+            "clock": lambda: self.now_seconds,
+            "timer": Timer()
+        })
+        self.mock_disabler = MagicMock(name="profile", spec=ProfilerDisabler)
+        self.mock_disabler.should_stop_profiling.return_value = False
+        self.mock_disabler.should_stop_sampling.return_value = False
+        self.mock_sampler = MagicMock(name="sampler", spec=Sampler)
+        self.mock_sampler.sample.return_value = Sample(stacks=[[Frame("frame1")]], seen_threads_count=1,
+                                                       attempted_sample_threads_count=1)
+        self.profiler_runner = ProfilerRunner({
+            "collector": self.collector,
+            "profiler_disabler": self.mock_disabler,
+            "sampler": self.mock_sampler,
+            "initial_sampling_interval": timedelta(),
+            "profiler_thread_name": "codeguru-profiler-agent-TestReportIfDueWhilePaused"
+        })
+        yield
+        self.profiler_runner.stop()
+
+    def test_the_time_frozen_after_the_report_is_not_counted_as_active(self):
+        self.now_seconds += 1
+        self.profiler_runner._profiling_command()
+        self.now_seconds += 100
+        self.profiler_runner.pause()
+
+        assert self.profiler_runner.report_if_due()
+        # the sandbox is frozen between invocations
+        self.now_seconds += 3600
+        self.profiler_runner.resume()
+        self.now_seconds += 1
+
+        self.mock_reporter.report.assert_called_once()
+        assert self.collector.profile.get_active_millis_since_start() == 1000
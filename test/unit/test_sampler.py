@@ -1,10 +1,21 @@
+import threading
+
+import codeguru_profiler_agent.aws_lambda.lambda_context
+from codeguru_profiler_agent.aws_lambda.lambda_context import LambdaContext, COLD_INVOKE_PHASE
 from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
 from test.pytestutils import before
 import unittest.mock as mock
-from mock import create_autospec, MagicMock, ANY
+from mock import create_autospec, MagicMock, ANY, call
 
+from codeguru_profiler_agent.model.frame import Frame
 from codeguru_profiler_agent.sampler import Sampler
-from codeguru_profiler_agent.sampling_utils import get_stacks
+from codeguru_profiler_agent.signal_sampler import SignalSampler
+from codeguru_profiler_agent.sampling_utils import get_stacks, get_thread_stacks, get_asyncio_task_stacks, \
+    get_greenlet_stacks
+from codeguru_profiler_agent.thread_grouper import ThreadGrouper
+from codeguru_profiler_agent.thread_state_classifier import ThreadStateClassifier, RUNNABLE, BLOCKED, IDLE
+from codeguru_profiler_agent.utils.greenlet_tracker import GreenletTracker
+from codeguru_profiler_agent.utils.thread_cpu_clock import ThreadCpuClock
 
 
 class TestSampler:
@@ -86,6 +97,22 @@ class TestWhenThereAreMoreThreadsThanMaxThreads(TestSampler):
 
         assert self.mock_get_stacks.call_args in allowed_results
 
+    def test_it_samples_the_other_threads_on_the_next_sample(self):
+        self.subject.sample()
+        first_sampled_threads = self.mock_get_stacks.call_args[1]["threads_to_sample"]
+
+        self.subject.sample()
+        second_sampled_threads = self.mock_get_stacks.call_args[1]["threads_to_sample"]
+
+        assert (first_sampled_threads + second_sampled_threads ==
+                [("fake_thread_1", "fake_thread_frames_1"), ("fake_thread_2", "fake_thread_frames_2")])
+
+    def test_it_records_how_many_threads_were_seen_and_attempted(self):
+        result = self.subject.sample()
+
+        assert (result.attempted_sample_threads_count == 1)
+        assert (result.seen_threads_count == 2)
+
 
 class TestWhenACustomStackDepthLimitIsSpecified(TestSampler):
     @before
@@ -129,3 +156,374 @@ class TestWhenExcludedThreadsAreSpecified(TestSampler):
             threads_to_sample=ANY,
             excluded_threads={"exclude_me"},
             max_depth=ANY)
+
+
+class TestWhenCpuTimeIsSampled(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.mock_get_thread_stacks = create_autospec(get_thread_stacks)
+        self.mock_get_thread_stacks.return_value = ([["dummy_stack_sample"]], [0.5])
+        self.mock_thread_cpu_clock = MagicMock(name="thread_cpu_clock", spec=ThreadCpuClock)
+        self.environment["sample_cpu_time"] = True
+        self.environment["get_thread_stacks"] = self.mock_get_thread_stacks
+        self.environment["thread_cpu_clock"] = self.mock_thread_cpu_clock
+
+    def test_it_returns_the_cpu_times_with_the_stacks(self):
+        with mock.patch.object(ThreadCpuClock, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        self.mock_get_stacks.assert_not_called()
+        self.mock_get_thread_stacks.assert_called_once_with(
+            threads_to_sample=ANY,
+            excluded_threads=ANY,
+            max_depth=ANY,
+            thread_cpu_clock=self.mock_thread_cpu_clock,
+            thread_grouper=None)
+        assert (result.stacks == [["dummy_stack_sample"]])
+        assert (result.cpu_times == [0.5])
+
+    def test_it_forgets_the_cpu_time_of_threads_that_are_gone(self):
+        with mock.patch.object(ThreadCpuClock, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        sampler.sample()
+
+        forgotten_threads_call = self.mock_thread_cpu_clock.forget_threads_other_than.call_args
+        assert (set(forgotten_threads_call[0][0]) == {"fake_thread_1", "fake_thread_2"})
+
+    def test_when_cpu_clocks_are_not_supported_it_only_samples_stacks(self):
+        with mock.patch.object(ThreadCpuClock, "is_supported", return_value=False):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        self.mock_get_thread_stacks.assert_not_called()
+        self.mock_get_stacks.assert_called_once()
+        assert (result.cpu_times is None)
+
+
+class TestWhenThreadStatesAreClassified(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.mock_get_stacks.return_value = [["running_stack"], ["idle_stack"]]
+        self.mock_thread_state_classifier = MagicMock(name="thread_state_classifier", spec=ThreadStateClassifier)
+        self.mock_thread_state_classifier.classify.side_effect = \
+            lambda stack: IDLE if stack == ["idle_stack"] else RUNNABLE
+        self.environment["thread_state_classifier"] = self.mock_thread_state_classifier
+
+    def test_it_returns_the_thread_states_with_the_stacks(self):
+        self.environment["classify_thread_states"] = True
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.stacks == [["running_stack"], ["idle_stack"]])
+        assert (result.thread_states == [RUNNABLE, IDLE])
+
+    def test_when_idle_stacks_are_dropped_it_only_returns_the_other_stacks(self):
+        self.environment["classify_thread_states"] = True
+        self.environment["drop_idle_stacks"] = True
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.stacks == [["running_stack"]])
+        assert (result.thread_states == [RUNNABLE])
+        assert (result.attempted_sample_threads_count == 2)
+
+    def test_it_can_drop_idle_stacks_without_reporting_thread_states(self):
+        self.environment["drop_idle_stacks"] = True
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.stacks == [["running_stack"]])
+        assert (result.thread_states is None)
+
+    def test_when_it_is_not_enabled_it_does_not_classify_stacks(self):
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        self.mock_thread_state_classifier.classify.assert_not_called()
+        assert (result.thread_states is None)
+
+
+class TestWhenAsyncioTasksAreSampled(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.thread_stack = [Frame("thread_stack")]
+        self.task_stack = [Frame("<task>"), Frame("task_stack")]
+        self.mock_get_stacks.return_value = [self.thread_stack]
+        self.mock_get_asyncio_task_stacks = create_autospec(get_asyncio_task_stacks)
+        self.mock_get_asyncio_task_stacks.return_value = ([self.task_stack], 3)
+        self.environment["sample_asyncio_tasks"] = True
+        self.environment["max_asyncio_tasks"] = 1
+        self.environment["get_asyncio_task_stacks"] = self.mock_get_asyncio_task_stacks
+
+    def test_it_adds_the_task_stacks_to_the_thread_stacks(self):
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        self.mock_get_asyncio_task_stacks.assert_called_once_with(
+            threads=ANY, excluded_threads=ANY, max_depth=1000, max_tasks=1)
+        assert (result.stacks == [self.thread_stack, self.task_stack])
+
+    def test_it_counts_tasks_apart_from_threads(self):
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.attempted_sample_threads_count == 2)
+        assert (result.seen_threads_count == 2)
+        assert (result.attempted_sample_tasks_count == 1)
+        assert (result.seen_tasks_count == 3)
+
+    def test_it_classifies_pending_tasks_running_ordinary_code_as_blocked(self):
+        self.environment["classify_thread_states"] = True
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.thread_states == [RUNNABLE, BLOCKED])
+
+
+class TestWhenGreenletsAreSampled(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.mock_get_stacks.return_value = [[Frame("thread_stack")]]
+        self.mock_greenlet_tracker = MagicMock(name="greenlet_tracker", spec=GreenletTracker)
+        self.mock_greenlet_tracker.suspended_greenlets.return_value = \
+            [("greenlet_1", "greenlet_frame_1"), ("greenlet_2", "greenlet_frame_2"), ("greenlet_3", "greenlet_frame_3")]
+        self.mock_get_greenlet_stacks = create_autospec(get_greenlet_stacks)
+        self.mock_get_greenlet_stacks.side_effect = \
+            lambda greenlet_frames, max_depth: [[Frame(frame)] for _, frame in greenlet_frames]
+        self.environment["sample_greenlets"] = True
+        self.environment["greenlet_tracker"] = self.mock_greenlet_tracker
+        self.environment["get_greenlet_stacks"] = self.mock_get_greenlet_stacks
+
+    def test_it_tracks_greenlets_while_it_is_started(self):
+        sampler = Sampler(environment=self.environment)
+        self.mock_greenlet_tracker.start.assert_not_called()
+
+        sampler.start()
+        self.mock_greenlet_tracker.start.assert_called_once()
+        self.mock_greenlet_tracker.stop.assert_not_called()
+
+        sampler.stop()
+        self.mock_greenlet_tracker.stop.assert_called_once()
+
+    def test_stopping_restores_the_previous_greenlet_trace_function(self):
+        previous_trace = MagicMock(name="previous_trace")
+        greenlet_module = MagicMock(name="greenlet_module")
+        greenlet_module.settrace.return_value = previous_trace
+        self.environment["greenlet_tracker"] = GreenletTracker(greenlet_module=greenlet_module)
+        sampler = Sampler(environment=self.environment)
+
+        sampler.start()
+        sampler.stop()
+
+        assert greenlet_module.settrace.call_args_list[-1] == call(previous_trace)
+
+    def test_it_adds_the_greenlet_stacks_to_the_thread_stacks(self):
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (len(result.stacks) == 1 + 3)
+
+    def test_it_counts_greenlets_apart_from_threads(self):
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.attempted_sample_threads_count == 2)
+        assert (result.seen_threads_count == 2)
+        assert (result.attempted_sample_tasks_count == 3)
+        assert (result.seen_tasks_count == 3)
+
+    def test_it_samples_at_most_max_threads_greenlets(self):
+        self.environment["max_threads"] = 2
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (len(self.mock_get_greenlet_stacks.call_args[1]["greenlet_frames"]) == 2)
+        assert (result.attempted_sample_tasks_count == 2)
+        assert (result.seen_tasks_count == 3)
+
+
+class TestWhenSignalSamplingIsEnabled(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.main_thread_id = threading.main_thread().ident
+        self._current_frames_reply[self.main_thread_id] = "main_thread_frames"
+        self.main_thread_stack = [Frame("main_thread_stack")]
+        self.thread_stack = [Frame("thread_stack")]
+        self.mock_get_stacks.return_value = [self.thread_stack]
+        self.mock_signal_sampler = MagicMock(name="signal_sampler", spec=SignalSampler)
+        self.mock_signal_sampler.is_running.return_value = True
+        self.mock_signal_sampler.drain.return_value = ([self.main_thread_stack, self.main_thread_stack], 2.7)
+        self.environment["signal_sampling"] = True
+        self.environment["signal_sampler"] = self.mock_signal_sampler
+
+    def test_it_starts_and_stops_the_signal_sampler(self):
+        with mock.patch.object(SignalSampler, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        sampler.start()
+        sampler.stop()
+
+        self.mock_signal_sampler.start.assert_called_once()
+        self.mock_signal_sampler.stop.assert_called_once()
+
+    def test_it_adds_the_main_thread_stacks_from_the_signal_sampler_instead_of_sampling_the_main_thread(self):
+        with mock.patch.object(SignalSampler, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        sampled_threads = self.mock_get_stacks.call_args[1]["threads_to_sample"]
+        assert (self.main_thread_id not in [thread_id for thread_id, _ in sampled_threads])
+        assert (result.stacks == [self.thread_stack, self.main_thread_stack])
+        assert (result.attempted_sample_threads_count == 2 + 1)
+        assert (result.seen_threads_count == 2 + 1)
+
+    def test_only_the_latest_main_thread_stack_counts_as_a_wall_clock_sample_the_others_as_cpu_time(self):
+        older_stack = [Frame("older_main_thread_stack")]
+        self.mock_signal_sampler.drain.return_value = ([older_stack, older_stack, self.main_thread_stack], 2.7)
+        mock_thread_cpu_clock = MagicMock(name="thread_cpu_clock", spec=ThreadCpuClock)
+        self.environment["sample_cpu_time"] = True
+        self.environment["thread_cpu_clock"] = mock_thread_cpu_clock
+        self.environment["get_thread_stacks"] = create_autospec(get_thread_stacks,
+                                                                return_value=([self.thread_stack], [0.5]))
+        with mock.patch.object(SignalSampler, "is_supported", return_value=True), \
+                mock.patch.object(ThreadCpuClock, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert (result.stacks == [self.thread_stack, self.main_thread_stack])
+        assert (result.cpu_times == [0.5, 2.7])
+        assert (result.cpu_only_stacks == [(older_stack, 2.7), (older_stack, 2.7)])
+        mock_thread_cpu_clock.cpu_time_since_last_sample.assert_called_once_with(self.main_thread_id)
+
+    def test_when_the_main_thread_was_not_sampled_by_the_signal_sampler_it_samples_it_like_other_threads(self):
+        self.mock_signal_sampler.drain.return_value = ([], 2.7)
+        with mock.patch.object(SignalSampler, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        sampled_threads = self.mock_get_stacks.call_args[1]["threads_to_sample"]
+        assert (self.main_thread_id in [thread_id for thread_id, _ in sampled_threads])
+        assert (result.seen_threads_count == 3)
+
+    def test_when_the_signal_sampler_is_not_running_it_samples_the_main_thread_like_other_threads(self):
+        self.mock_signal_sampler.is_running.return_value = False
+        with mock.patch.object(SignalSampler, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        self.mock_signal_sampler.drain.assert_not_called()
+        assert (result.seen_threads_count == 3)
+
+    def test_the_thread_group_frame_counts_towards_the_max_depth(self):
+        AgentConfiguration.get().max_stack_depth = 2
+        self.environment["group_by_thread_name"] = True
+        self.environment["get_thread_stacks"] = create_autospec(get_thread_stacks, return_value=([], None))
+        self.mock_signal_sampler.drain.return_value = ([[Frame("bottom"), Frame("top")]], 0.0)
+        with mock.patch.object(SignalSampler, "is_supported", return_value=True):
+            sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert [[frame.name for frame in stack] for stack in result.stacks] == \
+            [["<thread-group:MainThread>", "<Truncated>"]]
+
+
+class TestWhenThreadsAreGroupedByName(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.mock_get_thread_stacks = create_autospec(get_thread_stacks)
+        self.mock_get_thread_stacks.return_value = ([["dummy_stack_sample"]], None)
+        self.mock_thread_grouper = MagicMock(name="thread_grouper", spec=ThreadGrouper)
+        self.environment["group_by_thread_name"] = True
+        self.environment["get_thread_stacks"] = self.mock_get_thread_stacks
+        self.environment["thread_grouper"] = self.mock_thread_grouper
+
+    def test_it_passes_the_thread_grouper_when_getting_the_stacks(self):
+        sampler = Sampler(environment=self.environment)
+
+        sampler.sample()
+
+        self.mock_get_stacks.assert_not_called()
+        self.mock_get_thread_stacks.assert_called_once_with(
+            threads_to_sample=ANY,
+            excluded_threads=ANY,
+            max_depth=ANY,
+            thread_cpu_clock=None,
+            thread_grouper=self.mock_thread_grouper)
+
+    def test_it_forgets_the_groups_of_threads_that_are_gone(self):
+        sampler = Sampler(environment=self.environment)
+
+        sampler.sample()
+
+        self.mock_thread_grouper.forget_threads_other_than.assert_called_once_with(["fake_thread_1", "fake_thread_2"])
+
+
+class TestWhenStacksAreGroupedByLambdaPhase(TestSampler):
+    @before
+    def before(self):
+        super().before()
+        self.mock_get_stacks.return_value = [[Frame("handler")]]
+        self.environment["group_by_lambda_phase"] = True
+        codeguru_profiler_agent.aws_lambda.lambda_context._singleton = None
+        yield
+        codeguru_profiler_agent.aws_lambda.lambda_context._singleton = None
+
+    def test_it_starts_the_stacks_with_the_phase_frame(self):
+        LambdaContext.get().phase = COLD_INVOKE_PHASE
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert [[frame.name for frame in stack] for stack in result.stacks] == [["<cold-invoke>", "handler"]]
+
+    def test_the_phase_frame_counts_towards_the_max_depth(self):
+        LambdaContext.get().phase = COLD_INVOKE_PHASE
+        AgentConfiguration.get().max_stack_depth = 1
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert [[frame.name for frame in stack] for stack in result.stacks] == [["<cold-invoke>"]]
+
+    def test_stacks_that_no_longer_fit_end_with_the_truncated_frame(self):
+        LambdaContext.get().phase = COLD_INVOKE_PHASE
+        AgentConfiguration.get().max_stack_depth = 3
+        self.mock_get_stacks.return_value = [[Frame("bottom"), Frame("middle"), Frame("top")]]
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert [[frame.name for frame in stack] for stack in result.stacks] == \
+            [["<cold-invoke>", "bottom", "<Truncated>"]]
+
+    def test_outside_of_lambda_it_does_not_add_a_phase_frame(self):
+        sampler = Sampler(environment=self.environment)
+
+        result = sampler.sample()
+
+        assert [[frame.name for frame in stack] for stack in result.stacks] == [["handler"]]
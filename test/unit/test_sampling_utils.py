@@ -1,11 +1,16 @@
+import asyncio
 import pytest
 import unittest.mock as mock
 import sys
+import threading
 
 from test import help_utils
 from collections import namedtuple
 
-from codeguru_profiler_agent.sampling_utils import get_stacks
+from codeguru_profiler_agent.endpoint_labels import endpoints_by_thread_id, endpoints_by_task
+from codeguru_profiler_agent.thread_grouper import ThreadGrouper
+from codeguru_profiler_agent.sampling_utils import get_stacks, get_thread_stacks, get_asyncio_task_stacks, \
+    _find_running_loop
 
 DEFAULT_TRUNCATED_FRAME_NAME = "<Truncated>"
 
@@ -83,6 +88,60 @@ class TestSamplingUtils:
 
             assert not is_frame_in_stacks(stacks, "dummy_parent_method")
 
+        def test_it_returns_the_cpu_time_of_each_sampled_thread_with_the_stacks(self):
+            thread_cpu_clock = mock.MagicMock(name="thread_cpu_clock")
+            thread_cpu_clock.cpu_time_since_last_sample.side_effect = lambda thread_id: 0.5
+            threads_to_sample = sys._current_frames().items()
+
+            stacks, cpu_times = get_thread_stacks(
+                threads_to_sample=threads_to_sample,
+                excluded_threads=set(["test-thread"]),
+                max_depth=100,
+                thread_cpu_clock=thread_cpu_clock)
+
+            assert len(cpu_times) == len(stacks)
+            assert len(cpu_times) == len(threads_to_sample) - 1
+            assert all(cpu_time == 0.5 for cpu_time in cpu_times)
+
+        def test_it_starts_each_stack_with_the_thread_group_frame(self):
+            stacks, _ = get_thread_stacks(
+                threads_to_sample=sys._current_frames().items(),
+                excluded_threads=set(),
+                max_depth=3,
+                thread_grouper=ThreadGrouper())
+
+            assert any(stack[0].name == "<thread-group:test-thread>" for stack in stacks)
+            for stack in stacks:
+                assert stack[0].name.startswith("<thread-group:")
+                assert len(stack) <= 3
+
+        def test_it_skips_threads_that_terminated_while_being_grouped(self):
+            terminated_thread_id = max(threading._active) + 1
+            threads_to_sample = [(terminated_thread_id, sys._getframe())]
+            with mock.patch("codeguru_profiler_agent.sampling_utils._is_excluded", return_value=False):
+                stacks, _ = get_thread_stacks(
+                    threads_to_sample=threads_to_sample,
+                    excluded_threads=set(),
+                    max_depth=100,
+                    thread_grouper=ThreadGrouper())
+
+            assert stacks == []
+
+        def test_it_starts_the_stacks_of_threads_serving_a_request_with_the_endpoint_frame(self):
+            endpoints_by_thread_id[self.helper.thread.ident] = "GET /users/42"
+            try:
+                stacks, _ = get_thread_stacks(
+                    threads_to_sample=sys._current_frames().items(),
+                    excluded_threads=set(),
+                    max_depth=100,
+                    thread_grouper=ThreadGrouper())
+            finally:
+                del endpoints_by_thread_id[self.helper.thread.ident]
+
+            assert any(stack[0].name == "<thread-group:test-thread>" and stack[1].name == "<endpoint:GET /users/{id}>"
+                       for stack in stacks)
+            assert_frames_in_stack_are_in_expected_order(stacks, "dummy_parent_method", "dummy_method")
+
         def test_it_does_not_include_zombie_threads(self):
             with mock.patch(
                     "codeguru_profiler_agent.sampling_utils._is_zombie",
@@ -146,3 +205,158 @@ class TestSamplingUtils:
                 excluded_threads=set(),
                 max_depth=100)
             assert is_frame_in_stacks(stacks, "put_metric_data")
+
+
+class TestGetAsyncioTaskStacks:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(name="test-event-loop", target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.release = asyncio.run_coroutine_threadsafe(self._new_event(), self.loop).result()
+        yield
+        self.loop.call_soon_threadsafe(self.release.set)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    @staticmethod
+    async def _new_event():
+        return asyncio.Event()
+
+    async def dummy_task_method(self):
+        await self.release.wait()
+
+    async def dummy_task_parent_method(self):
+        await self.dummy_task_method()
+
+    def _start_tasks(self, count, name=None):
+        async def start():
+            for _ in range(count):
+                asyncio.get_running_loop().create_task(self.dummy_task_parent_method(), name=name)
+            # let the tasks run until they are suspended
+            await asyncio.sleep(0)
+        asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+
+    def test_it_reconstructs_the_coroutine_stack_of_suspended_tasks(self):
+        self._start_tasks(1)
+
+        stacks, seen_tasks_count = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads=set(), max_depth=100, max_tasks=100)
+
+        assert seen_tasks_count == 1
+        assert stacks[0][0].name == "<task>"
+        assert_frames_in_stack_are_in_expected_order(stacks, "dummy_task_parent_method", "dummy_task_method")
+
+    def test_it_uses_the_name_of_named_tasks(self):
+        self._start_tasks(1, name="handle-request")
+
+        stacks, _ = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads=set(), max_depth=100, max_tasks=100)
+
+        assert stacks[0][0].name == "<task:handle-request>"
+
+    def test_it_starts_the_stacks_of_tasks_serving_a_request_with_the_endpoint_frame(self):
+        async def start():
+            task = asyncio.get_running_loop().create_task(self.dummy_task_parent_method())
+            endpoints_by_task[task] = "GET /users/42"
+            await asyncio.sleep(0)
+        asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+
+        stacks, _ = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads=set(), max_depth=100, max_tasks=100)
+
+        assert stacks[0][0].name == "<endpoint:GET /users/{id}>"
+        assert stacks[0][1].name == "<task>"
+
+    def test_it_keeps_the_truncated_frame_when_the_endpoint_frame_is_added(self):
+        async def start():
+            task = asyncio.get_running_loop().create_task(self.dummy_task_parent_method())
+            endpoints_by_task[task] = "GET /users/42"
+            await asyncio.sleep(0)
+        asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+
+        stacks, _ = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads=set(), max_depth=3, max_tasks=100)
+
+        assert [frame.name for frame in stacks[0]] == \
+               ["<endpoint:GET /users/{id}>", "<task>", DEFAULT_TRUNCATED_FRAME_NAME]
+
+    def test_it_samples_at_most_max_tasks(self):
+        self._start_tasks(5)
+
+        stacks, seen_tasks_count = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads=set(), max_depth=100, max_tasks=2)
+
+        assert seen_tasks_count == 5
+        assert len(stacks) == 2
+
+    def test_it_truncates_stacks_deeper_than_max_depth(self):
+        self._start_tasks(1)
+
+        stacks, _ = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads=set(), max_depth=2, max_tasks=100)
+
+        assert len(stacks[0]) == 2
+        assert stacks[0][-1].name == DEFAULT_TRUNCATED_FRAME_NAME
+
+    def test_it_finds_the_pending_tasks_with_the_api_of_python_3_6(self):
+        self._start_tasks(2)
+        pending_tasks = asyncio.all_tasks(self.loop)
+        python_3_6_asyncio = mock.NonCallableMock(spec=["BaseEventLoop", "Task"])
+        python_3_6_asyncio.BaseEventLoop = asyncio.BaseEventLoop
+        python_3_6_asyncio.Task.all_tasks.return_value = pending_tasks | {mock.Mock(**{"done.return_value": True})}
+
+        with mock.patch.dict(sys.modules, {"asyncio": python_3_6_asyncio}):
+            stacks, seen_tasks_count = get_asyncio_task_stacks(
+                threads=sys._current_frames().items(), excluded_threads=set(), max_depth=100, max_tasks=100)
+
+        python_3_6_asyncio.Task.all_tasks.assert_called_once_with(self.loop)
+        assert seen_tasks_count == 2
+        assert len(stacks) == 2
+
+    def test_it_ignores_event_loops_of_excluded_threads(self):
+        self._start_tasks(1)
+
+        stacks, seen_tasks_count = get_asyncio_task_stacks(
+            threads=sys._current_frames().items(), excluded_threads={"test-event-loop"}, max_depth=100,
+            max_tasks=100)
+
+        assert stacks == []
+        assert seen_tasks_count == 0
+
+
+class TestFindRunningLoop:
+    """
+    Event loops implemented in C, e.g. uvloop, have no run_forever frame; an asyncio module whose BaseEventLoop does not
+    match the running loop stands for them.
+    """
+    @pytest.fixture(autouse=True)
+    def around(self):
+        class CEventLoop:
+            def run_forever(self):
+                pass
+        self.asyncio = mock.NonCallableMock(spec=["BaseEventLoop", "run", "Runner"])
+        self.asyncio.BaseEventLoop = CEventLoop
+        self.asyncio.run = asyncio.run
+        self.asyncio.Runner = getattr(asyncio, "Runner", None)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.loop = None
+        self.thread = threading.Thread(name="test-asyncio-run", target=asyncio.run, args=(self._wait(),), daemon=True)
+        self.thread.start()
+        self.started.wait()
+        yield
+        self.release.set()
+        self.thread.join()
+
+    async def _wait(self):
+        self.loop = asyncio.get_running_loop()
+        self.started.set()
+        await asyncio.get_running_loop().run_in_executor(None, self.release.wait)
+
+    def test_it_finds_a_loop_run_through_asyncio_run(self):
+        assert _find_running_loop(sys._current_frames()[self.thread.ident], self.asyncio) is self.loop
+
+    def test_it_does_not_find_a_loop_in_a_thread_that_does_not_run_one(self):
+        assert _find_running_loop(sys._current_frames()[threading.get_ident()], self.asyncio) is None
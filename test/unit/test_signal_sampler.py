@@ -0,0 +1,104 @@
+import pytest
+import sys
+import time
+from datetime import timedelta
+
+from test.pytestutils import before
+from codeguru_profiler_agent.reporter.agent_configuration import AgentConfiguration
+from codeguru_profiler_agent.signal_sampler import SignalSampler
+
+
+def dummy_cpu_bound_method(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def _is_frame_in_stacks(stacks, frame_name):
+    return any(frame.name == frame_name for stack in stacks for frame in stack)
+
+
+@pytest.mark.skipif(not SignalSampler.is_supported(), reason="setitimer is not supported on this platform")
+class TestSignalSampler:
+    @before
+    def before(self):
+        AgentConfiguration.set(AgentConfiguration(
+            should_profile=True,
+            sampling_interval=timedelta(milliseconds=10),
+            reporting_interval=timedelta(minutes=5),
+            max_stack_depth=1000))
+        self.subject = SignalSampler(buffer_size=4)
+        yield
+        self.subject.stop()
+
+    def test_it_samples_the_main_thread_when_it_uses_cpu(self):
+        assert self.subject.start()
+
+        dummy_cpu_bound_method(seconds=0.1)
+        stacks, cpu_time_per_stack = self.subject.drain()
+
+        assert _is_frame_in_stacks(stacks, "dummy_cpu_bound_method")
+        assert cpu_time_per_stack == 0.01
+
+    def test_it_restores_the_previous_handler_when_stopped(self):
+        import signal
+        self.subject.start()
+
+        self.subject.stop()
+
+        assert signal.getsignal(signal.SIGPROF) == signal.SIG_DFL
+        assert not self.subject.is_running()
+
+    def test_it_does_not_start_when_another_handler_is_installed(self):
+        import signal
+        previous_handler = signal.signal(signal.SIGPROF, lambda signum, frame: None)
+        try:
+            assert not self.subject.start()
+        finally:
+            signal.signal(signal.SIGPROF, previous_handler)
+
+    def test_it_overwrites_the_oldest_stacks_when_the_buffer_is_full(self):
+        self.subject.start()
+        # stop the timer so that only the stacks captured below end up in the buffer
+        self.subject._arm(0)
+        self.subject._interval_seconds = 0.01
+        for _ in range(6):
+            self.subject._handle_signal(None, sys._getframe())
+
+        stacks, _ = self.subject.drain()
+
+        assert len(stacks) == 4
+        assert self.subject.dropped_stacks_count == 2
+        assert self.subject.drain()[0] == []
+
+    def test_it_skips_the_slots_emptied_while_the_handler_overwrote_them(self):
+        self.subject.start()
+        self.subject._arm(0)
+        self.subject._interval_seconds = 0.01
+        frame = sys._getframe()
+        for _ in range(4):
+            self.subject._handle_signal(None, frame)
+        subject = self.subject
+
+        class InterruptedBuffer(list):
+            fired = False
+
+            def __getitem__(self, index):
+                stack = list.__getitem__(self, index)
+                if not self.fired:
+                    # the handler fires in the main thread while the profiler thread reads the oldest slot, and the
+                    # buffer being full it overwrites that slot
+                    self.fired = True
+                    subject._handle_signal(None, frame)
+                return stack
+        self.subject._buffer = InterruptedBuffer(self.subject._buffer)
+
+        self.subject.drain()
+        stacks, _ = self.subject.drain()
+
+        assert None not in stacks
+
+    def test_it_never_raises_from_the_handler(self):
+        subject = SignalSampler(extract_frames=lambda frame, max_depth: 1 / 0)
+
+        subject._handle_signal(None, sys._getframe())
@@ -0,0 +1,47 @@
+import pytest
+from unittest import mock
+
+from test.pytestutils import before
+from codeguru_profiler_agent.thread_grouper import ThreadGrouper
+
+
+class TestThreadGrouper:
+    @before
+    def before(self):
+        self.subject = ThreadGrouper()
+
+    @pytest.mark.parametrize("thread_name, expected_group_name", [
+        ("ThreadPoolExecutor-0_12", "ThreadPoolExecutor"),
+        ("Thread-3 (worker)", "Thread (worker)"),
+        ("kafka-consumer-2", "kafka-consumer"),
+        ("s3-uploader", "s3-uploader"),
+        ("http2-worker-7", "http2-worker"),
+        ("pool-2-thread-3", "pool-2-thread"),
+        ("MainThread", "MainThread"),
+        ("42", "42"),
+    ])
+    def test_it_removes_numeric_suffixes_from_thread_names(self, thread_name, expected_group_name):
+        assert self.subject.group_name(thread_name) == expected_group_name
+
+    def test_it_returns_the_thread_group_frame(self):
+        assert self.subject.group_frame(1, "ThreadPoolExecutor-0_12").name == "<thread-group:ThreadPoolExecutor>"
+
+    def test_it_caches_the_group_frame_per_thread(self):
+        first_frame = self.subject.group_frame(1, "ThreadPoolExecutor-0_12")
+
+        with mock.patch.object(ThreadGrouper, "group_name") as mock_group_name:
+            assert self.subject.group_frame(1, "ThreadPoolExecutor-0_12") is first_frame
+            mock_group_name.assert_not_called()
+
+    def test_it_normalizes_the_name_again_when_the_thread_is_renamed(self):
+        self.subject.group_frame(1, "ThreadPoolExecutor-0_12")
+
+        assert self.subject.group_frame(1, "kafka-consumer-2").name == "<thread-group:kafka-consumer>"
+
+    def test_it_forgets_threads_that_are_not_alive_anymore(self):
+        self.subject.group_frame(1, "ThreadPoolExecutor-0_12")
+        self.subject.group_frame(2, "kafka-consumer-2")
+
+        self.subject.forget_threads_other_than([2])
+
+        assert list(self.subject._group_frames.keys()) == [2]
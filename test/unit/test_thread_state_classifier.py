@@ -0,0 +1,57 @@
+import pytest
+import sys
+import threading
+
+from test import help_utils
+from codeguru_profiler_agent.model.frame import Frame
+from codeguru_profiler_agent.sampling_utils import get_stacks, TIME_SLEEP_FRAME
+from codeguru_profiler_agent.thread_state_classifier import ThreadStateClassifier, RUNNABLE, BLOCKED, IDLE
+
+
+def _frame_of(function):
+    return Frame(function.__code__.co_name, file_path=function.__code__.co_filename)
+
+
+class TestThreadStateClassifier:
+    @pytest.fixture(autouse=True)
+    def around(self):
+        self.subject = ThreadStateClassifier()
+        yield
+
+    def test_it_classifies_stacks_running_code_as_runnable(self):
+        assert self.subject.classify([Frame("main", file_path="app.py"), Frame("compute", file_path="app.py")]) \
+               == RUNNABLE
+
+    def test_it_classifies_stacks_waiting_on_a_lock_as_blocked(self):
+        assert self.subject.classify([Frame("main", file_path="app.py"), _frame_of(threading.Condition.wait)]) \
+               == BLOCKED
+
+    def test_it_classifies_stacks_sleeping_as_idle(self):
+        assert self.subject.classify([Frame("main", file_path="app.py"), TIME_SLEEP_FRAME]) == IDLE
+
+    def test_it_prefers_idle_when_waiting_for_work_through_a_lock(self):
+        import queue
+        assert self.subject.classify([Frame("main", file_path="app.py"), _frame_of(queue.Queue.get),
+                                      _frame_of(threading.Condition.wait)]) == IDLE
+
+    def test_it_only_looks_at_the_top_of_the_stack(self):
+        import queue
+        subject = ThreadStateClassifier(max_classified_frames=1)
+
+        assert subject.classify([_frame_of(queue.Queue.get), Frame("compute", file_path="app.py")]) == RUNNABLE
+
+    def test_it_ignores_functions_that_do_not_exist(self):
+        subject = ThreadStateClassifier(idle_functions=("queue:NotAQueue.get", "not_a_module:get"))
+
+        assert subject.classify([Frame("get", file_path="queue.py")]) == RUNNABLE
+
+    def test_it_classifies_a_thread_waiting_on_a_queue_as_idle(self):
+        helper = help_utils.HelperThreadRunner()
+        helper.new_helper_thread_blocked_inside_dummy_method()
+        try:
+            stacks = get_stacks(threads_to_sample=[(helper.thread.ident, sys._current_frames()[helper.thread.ident])],
+                                excluded_threads=set(), max_depth=100)
+        finally:
+            helper.stop_helper_thread()
+
+        assert self.subject.classify(stacks[0]) == IDLE
@@ -0,0 +1,62 @@
+import threading
+import pytest
+
+from test.pytestutils import before
+from codeguru_profiler_agent.sampling_utils import get_greenlet_stacks
+from codeguru_profiler_agent.utils.greenlet_tracker import GreenletTracker
+
+greenlet = pytest.importorskip("greenlet")
+
+
+def dummy_greenlet_method():
+    greenlet.getcurrent().parent.switch()
+
+
+def dummy_greenlet_parent_method():
+    dummy_greenlet_method()
+
+
+class TestGreenletTracker:
+    @before
+    def before(self):
+        self.subject = GreenletTracker()
+        self.subject.start()
+        yield
+        self.subject.stop()
+
+    def test_it_returns_the_frames_of_suspended_greenlets(self):
+        suspended = greenlet.greenlet(dummy_greenlet_parent_method)
+        suspended.switch()
+
+        greenlet_frames = self.subject.suspended_greenlets()
+
+        assert [g for g, _ in greenlet_frames] == [suspended]
+        stack = get_greenlet_stacks(greenlet_frames=greenlet_frames, max_depth=100)[0]
+        assert [frame.name for frame in stack][-2:] == ["dummy_greenlet_parent_method", "dummy_greenlet_method"]
+
+    def test_it_does_not_return_finished_greenlets(self):
+        finished = greenlet.greenlet(lambda: None)
+        finished.switch()
+
+        assert self.subject.suspended_greenlets() == []
+
+    def test_it_calls_the_trace_hook_that_was_already_installed(self):
+        self.subject.stop()
+        events = []
+        previous_trace = lambda event, args: events.append(event)
+        greenlet.settrace(previous_trace)
+        self.subject.start()
+
+        greenlet.greenlet(lambda: None).switch()
+
+        assert "switch" in events
+        self.subject.stop()
+        assert greenlet.gettrace() is previous_trace
+        greenlet.settrace(None)
+
+    def test_stopping_from_another_thread_leaves_the_trace_hook_installed(self):
+        thread = threading.Thread(target=self.subject.stop)
+        thread.start()
+        thread.join()
+
+        assert greenlet.gettrace() is not None
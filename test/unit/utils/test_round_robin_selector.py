@@ -0,0 +1,39 @@
+from test.pytestutils import before
+from codeguru_profiler_agent.utils.round_robin_selector import RoundRobinSelector
+
+
+class TestRoundRobinSelector:
+    @before
+    def before(self):
+        self.subject = RoundRobinSelector()
+
+    def test_it_selects_everything_when_under_the_limit(self):
+        assert self.subject.select([3, 1, 2], max_count=3) == [3, 1, 2]
+
+    def test_it_rotates_through_the_items(self):
+        items = [5, 1, 4, 2, 3]
+
+        assert self.subject.select(items, max_count=2) == [1, 2]
+        assert self.subject.select(items, max_count=2) == [3, 4]
+        assert self.subject.select(items, max_count=2) == [5, 1]
+
+    def test_it_keeps_rotating_when_items_come_and_go(self):
+        self.subject.select([1, 2, 3, 4], max_count=2)
+
+        # 2 is gone and 10 is new: we resume after 2, the last item selected
+        assert self.subject.select([1, 3, 4, 10], max_count=2) == [3, 4]
+        assert self.subject.select([1, 3, 4, 10], max_count=2) == [10, 1]
+
+    def test_it_covers_every_item_within_a_bounded_number_of_calls(self):
+        items = list(range(10))
+        selected = set()
+
+        for _ in range(4):
+            selected.update(self.subject.select(items, max_count=3))
+
+        assert selected == set(items)
+
+    def test_it_orders_items_by_key(self):
+        subject = RoundRobinSelector(key=lambda thread: thread[0])
+
+        assert subject.select([(2, "b"), (1, "a"), (3, "c")], max_count=2) == [(1, "a"), (2, "b")]
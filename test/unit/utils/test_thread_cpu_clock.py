@@ -0,0 +1,96 @@
+import pytest
+
+from test.pytestutils import before
+from codeguru_profiler_agent.utils.thread_cpu_clock import ThreadCpuClock
+
+
+class TestThreadCpuClock:
+    @before
+    def before(self):
+        self.cpu_times = {"thread-1": 1.0, "thread-2": 5.0}
+
+        def clock_gettime(thread_id):
+            if thread_id not in self.cpu_times:
+                raise OSError("no such thread")
+            return self.cpu_times[thread_id]
+
+        self.alive_threads = {"thread-1", "thread-2"}
+        self.clock_id_requests = []
+
+        def get_cpu_clock_id(thread_id):
+            self.clock_id_requests.append(thread_id)
+            return thread_id
+
+        self.subject = ThreadCpuClock(get_cpu_clock_id=get_cpu_clock_id, clock_gettime=clock_gettime,
+                                      is_thread_alive=lambda thread_id: thread_id in self.alive_threads)
+
+    def test_it_returns_zero_the_first_time_a_thread_is_seen(self):
+        assert (self.subject.cpu_time_since_last_sample("thread-1") == 0.0)
+
+    def test_it_returns_the_cpu_time_spent_since_the_last_sample(self):
+        self.subject.cpu_time_since_last_sample("thread-1")
+        self.cpu_times["thread-1"] = 1.25
+
+        assert (self.subject.cpu_time_since_last_sample("thread-1") == 0.25)
+
+    def test_it_keeps_track_of_each_thread_separately(self):
+        self.subject.cpu_time_since_last_sample("thread-1")
+        self.subject.cpu_time_since_last_sample("thread-2")
+        self.cpu_times["thread-2"] = 5.5
+
+        assert (self.subject.cpu_time_since_last_sample("thread-1") == 0.0)
+        assert (self.subject.cpu_time_since_last_sample("thread-2") == 0.5)
+
+    def test_it_returns_zero_when_the_thread_is_gone(self):
+        self.subject.cpu_time_since_last_sample("thread-1")
+        del self.cpu_times["thread-1"]
+
+        assert (self.subject.cpu_time_since_last_sample("thread-1") == 0.0)
+
+    def test_it_does_not_read_the_clock_of_a_thread_that_terminated(self):
+        self.subject.cpu_time_since_last_sample("thread-1")
+        self.alive_threads.remove("thread-1")
+        self.cpu_times["thread-1"] = 3.0
+
+        assert (self.subject.cpu_time_since_last_sample("thread-1") == 0.0)
+        assert (self.clock_id_requests == ["thread-1"])
+
+    def test_it_returns_zero_when_reading_the_clock_fails(self):
+        def failing_clock_id(thread_id):
+            raise ValueError("unexpected")
+        subject = ThreadCpuClock(get_cpu_clock_id=failing_clock_id, clock_gettime=lambda clock_id: 1.0,
+                                 is_thread_alive=lambda thread_id: True)
+
+        assert (subject.cpu_time_since_last_sample("thread-1") == 0.0)
+
+    def test_it_forgets_threads_that_are_not_alive_anymore(self):
+        self.subject.cpu_time_since_last_sample("thread-1")
+        self.subject.cpu_time_since_last_sample("thread-2")
+        self.cpu_times["thread-1"] = 3.0
+
+        self.subject.forget_threads_other_than(["thread-2"])
+
+        # a new thread reusing the same ident starts from scratch
+        assert (self.subject.cpu_time_since_last_sample("thread-1") == 0.0)
+
+
+@pytest.mark.skipif(not ThreadCpuClock.is_supported(), reason="per-thread cpu clocks are only supported on Linux")
+class TestWithTheSystemClock:
+    def test_it_measures_the_cpu_time_of_the_current_thread(self):
+        import threading
+        subject = ThreadCpuClock()
+        thread_id = threading.get_ident()
+        subject.cpu_time_since_last_sample(thread_id)
+        sum(i * i for i in range(100000))
+
+        assert (subject.cpu_time_since_last_sample(thread_id) > 0)
+
+    def test_it_does_not_read_the_clock_of_a_thread_that_was_joined(self):
+        import threading
+        subject = ThreadCpuClock()
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread_id = thread.ident
+        thread.join()
+
+        assert (subject.cpu_time_since_last_sample(thread_id) == 0.0)